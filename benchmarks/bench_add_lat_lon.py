@@ -0,0 +1,72 @@
+"""
+Peak memory of adding EPIC lat/lon dimensions to the variables of an
+Aquadopp profile dataset, for the previous concat/transpose implementation
+and the current one.
+
+Usage::
+
+    python benchmarks/bench_add_lat_lon.py [ntime] [nbins]
+"""
+
+from __future__ import division, print_function
+import sys
+import time
+import tracemalloc
+import numpy as np
+import xarray as xr
+from stglib.core import utils
+
+VARS = ['U', 'V', 'W', 'AGC', 'Pressure', 'Temperature', 'Heading', 'Pitch',
+        'Roll', 'bin_depth', 'Pressure_ac']
+
+
+def old_add_lat_lon(ds, var):
+    ds[var] = xr.concat([ds[var]], dim=ds['lon'])
+    ds[var] = xr.concat([ds[var]], dim=ds['lat'])
+
+    dims = [d for d in ds[var].dims if (d != 'lon') and (d != 'lat')]
+    dims.extend(['lat', 'lon'])
+
+    ds[var] = ds[var].transpose(*dims)
+
+    return ds
+
+
+def make_aqd(ntime, nbins):
+    ds = xr.Dataset(coords={'lat': [41.5], 'lon': [-70.7],
+                            'bindist': np.arange(nbins) * 0.5})
+    for k in ['U', 'V', 'W', 'AGC', 'bin_depth']:
+        ds[k] = (('time', 'bindist'), np.random.randn(ntime, nbins))
+    for k in ['Pressure', 'Temperature', 'Heading', 'Pitch', 'Roll',
+              'Pressure_ac']:
+        ds[k] = ('time', np.random.randn(ntime))
+
+    return ds
+
+
+def measure(func, ds):
+    tracemalloc.start()
+    t0 = time.time()
+    for var in VARS:
+        ds = func(ds, var)
+    elapsed = time.time() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return ds, peak, elapsed
+
+
+def main(ntime=200000, nbins=40):
+    base = make_aqd(ntime, nbins)
+    print('Dataset size: %.0f MB' % (base.nbytes / 1e6))
+
+    old, oldpeak, oldt = measure(old_add_lat_lon, base.copy())
+    new, newpeak, newt = measure(utils.add_lat_lon, base.copy())
+    assert old.identical(new)
+
+    print('old: peak %7.1f MB allocated, %.2f s' % (oldpeak / 1e6, oldt))
+    print('new: peak %7.1f MB allocated, %.2f s' % (newpeak / 1e6, newt))
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
@@ -0,0 +1,95 @@
+"""
+Compare the ECO and HOBO readers against the previous python-engine
+implementations on synthetic 1 Hz records.
+
+Usage::
+
+    python benchmarks/bench_eco_hobo.py [nrows]
+"""
+
+from __future__ import division, print_function
+import os
+import sys
+import time
+import tempfile
+import numpy as np
+import pandas as pd
+from stglib import eco, hobo
+
+
+def write_eco(filnam, nrows):
+    t = pd.date_range('2017-07-20', periods=nrows, freq='s')
+    counts = np.random.randint(50, 4000, nrows)
+    with open(filnam, 'w') as f:
+        f.write(''.join('%s\t%d\n' % (s, c) for s, c in
+                        zip(t.strftime('%m/%d/%y\t%H:%M:%S'), counts)))
+        f.write('etx\n')
+
+
+def write_hobo(filnam, nrows):
+    t = pd.date_range('2017-07-20', periods=nrows, freq='s')
+    p = 101 + np.random.randn(nrows)
+    temp = 20 + np.random.randn(nrows)
+    with open(filnam, 'w') as f:
+        f.write('"Plot Title: 10761"\n')
+        f.write(''.join('%d,%s,%.3f,%.3f\n' % x for x in
+                        zip(range(1, nrows + 1),
+                            t.strftime('%m/%d/%y %I:%M:%S %p'), p, temp)))
+        f.write(',,,,Logged\n')
+        f.write(',,,,End Of File\n')
+
+
+def old_read_eco_csv(filnam, names, skiprows=None, skipfooter=0):
+    # the previous implementation, minus the parse_dates/infer_datetime_format
+    # arguments that current pandas no longer accepts
+    df = pd.read_csv(filnam, sep='\t', names=names, engine='python',
+                     skiprows=skiprows, skipfooter=skipfooter,
+                     dtype={'date': str, 'time': str})
+    df['date_time'] = pd.to_datetime(df['date'] + ' ' + df['time'])
+
+    return df
+
+
+def old_read_hobo(filnam, skiprows=1, skipfooter=0):
+    df = pd.read_csv(filnam, usecols=[0, 1, 2, 3],
+                     names=['#', 'datetime', 'abspres_kPa', 'temp_C'],
+                     engine='python', skiprows=skiprows,
+                     skipfooter=skipfooter)
+    df['time'] = pd.to_datetime(df['datetime'])
+
+    return df
+
+
+def timeit(func, *args, **kwargs):
+    t0 = time.time()
+    result = func(*args, **kwargs)
+    return time.time() - t0, result
+
+
+def main(nrows=500000):
+    tmp = tempfile.mkdtemp()
+    ecofile = os.path.join(tmp, 'par.txt')
+    hobofile = os.path.join(tmp, 'hobo.csv')
+    write_eco(ecofile, nrows)
+    write_hobo(hobofile, nrows)
+
+    names = ['date', 'time', 'counts']
+    told, old = timeit(old_read_eco_csv, ecofile, names, skipfooter=1)
+    tnew, new = timeit(eco.read_eco_csv, ecofile, names)
+    assert (old['date_time'].values == new['date_time'].values).all()
+    print('ECO  %d rows: old %6.2f s  new %6.2f s  (%.0fx)' % (
+        nrows, told, tnew, told / tnew))
+
+    told, old = timeit(old_read_hobo, hobofile, skipfooter=2)
+    tnew, new = timeit(hobo.read_hobo, hobofile)
+    assert (old['time'].values == new['time'].values).all()
+    print('HOBO %d rows: old %6.2f s  new %6.2f s  (%.0fx)' % (
+        nrows, told, tnew, told / tnew))
+
+    os.remove(ecofile)
+    os.remove(hobofile)
+    os.rmdir(tmp)
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
@@ -2,12 +2,6 @@
 
 import sys
 sys.path.insert(0, '/Users/dnowacki/Documents/stglib')
-import stglib
-import argparse
+from stglib.core import cmd
 
-args = stglib.cmd.aqdcdf2nc_parse_args()
-
-if args.atmpres:
-    ds = stglib.aqd.cdf2nc.cdf_to_nc(args.cdfname, atmpres=args.atmpres)
-else:
-    ds = stglib.aqd.cdf2nc.cdf_to_nc(args.cdfname)
+cmd.runaqdcdf2nc()
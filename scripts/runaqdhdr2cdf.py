@@ -2,20 +2,6 @@
 
 import sys
 sys.path.insert(0, '/Users/dnowacki/Documents/stglib')
-import stglib
-import argparse
-import yaml
+from stglib.core import cmd
 
-args = stglib.cmd.aqdhdr2cdf_parse_args()
-
-# initialize metadata from the globalatts file
-metadata = stglib.read_globalatts(args.gatts)
-
-# Add additional metadata from metadata config file
-with open(args.config) as f:
-    config = yaml.safe_load(f)
-
-for k in config:
-    metadata[k] = config[k]
-
-RAW = stglib.aqd.hdr2cdf.prf_to_cdf(metadata)
+cmd.runaqdhdr2cdf()
@@ -2,24 +2,6 @@
 
 import sys
 sys.path.insert(0, '/Users/dnowacki/Documents/stglib')
-import stglib
-import argparse
-import yaml
+from stglib.core import cmd
 
-parser = argparse.ArgumentParser(description='Convert EXO .csv file to raw .cdf format. Run this script from the directory containing EXO file')
-parser.add_argument('gatts', help='path to global attributes file (gatts formatted)')
-parser.add_argument('config', help='path to ancillary config file (YAML formatted)')
-
-args = parser.parse_args()
-
-# initialize metadata from the globalatts file
-metadata = stglib.read_globalatts(args.gatts)
-
-# Add additional metadata from metadata config file
-with open(args.config) as f:
-    config = yaml.safe_load(f)
-
-for k in config:
-    metadata[k] = config[k]
-
-RAW = stglib.exo.csv_to_cdf(metadata)
+cmd.runexocsv2cdf()
@@ -0,0 +1,7 @@
+#!/usr/bin/env python
+
+import sys
+sys.path.insert(0, '/Users/dnowacki/Documents/stglib')
+from stglib.core import cmd
+
+cmd.runiqcdf2nc()
@@ -2,8 +2,6 @@
 
 import sys
 sys.path.insert(0, '/Users/dnowacki/Documents/stglib')
-import stglib
+from stglib.core import cmd
 
-args = stglib.cmd.rsknc2diwasp_parse_args()
-
-ds = stglib.rsk.nc2diwasp.nc_to_diwasp(args.ncname)
+cmd.runrsknc2diwasp()
@@ -2,19 +2,6 @@
 
 import sys
 sys.path.insert(0, '/Users/dnowacki/Documents/stglib')
-import stglib
-import yaml
+from stglib.core import cmd
 
-args = stglib.cmd.rskrsk2cdf_parse_args()
-
-# initialize metadata from the globalatts file
-metadata = stglib.read_globalatts(args.gatts)
-
-# Add additional metadata from metadata config file
-with open(args.config) as f:
-    config = yaml.safe_load(f)
-
-for k in config:
-    metadata[k] = config[k]
-
-RAW = stglib.rsk.rsk2cdf.rsk_to_cdf(metadata)
+cmd.runrskrsk2cdf()
@@ -2,12 +2,6 @@
 
 import sys
 sys.path.insert(0, '/Users/dnowacki/Documents/stglib')
-import stglib
-import argparse
+from stglib.core import cmd
 
-parser = argparse.ArgumentParser(description='Convert processed Aquadopp waves .nc files using DIWASP')
-parser.add_argument('ncname', help='processed .nc filename')
-
-args = parser.parse_args()
-
-ds = stglib.aqd.wvsnc2diwasp.nc_to_diwasp(args.ncname)
+cmd.runwvsnc2diwasp()
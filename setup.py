@@ -7,13 +7,28 @@ setup(name='stglib',
       author_email='dnowacki@usgs.gov',
       url='https://github.com/dnowacki-usgs/stglib',
       license='Public domain',
-      install_requires=['numpy', 'netCDF4', 'xarray'],
-      packages=['stglib', 'stglib.aqd', 'stglib.rsk'],
-      scripts=['scripts/runaqdhdr2cdf.py',
-               'scripts/runaqdcdf2nc.py',
-               'scripts/runrskrsk2cdf.py',
-               'scripts/runrskcdf2nc.py',
-               'scripts/runrsknc2diwasp.py',
-               ],
+      # module-level __getattr__ for lazy submodule imports
+      python_requires='>=3.7',
+      install_requires=['numpy', 'scipy', 'netCDF4', 'xarray', 'pyyaml'],
+      # MATLAB v7.3 .mat files (e.g. SonTek IQ exports)
+      extras_require={'mat73': ['h5py']},
+      packages=['stglib', 'stglib.aqd', 'stglib.core', 'stglib.rsk'],
+      entry_points={
+          'console_scripts': [
+              'stglib=stglib.core.cmd:main',
+              'runaqdhdr2cdf.py=stglib.core.cmd:runaqdhdr2cdf',
+              'runaqdcdf2nc.py=stglib.core.cmd:runaqdcdf2nc',
+              'runwvswad2cdf.py=stglib.core.cmd:runwvswad2cdf',
+              'runwvscdf2nc.py=stglib.core.cmd:runwvscdf2nc',
+              'runwvsnc2diwasp.py=stglib.core.cmd:runwvsnc2diwasp',
+              'runrskrsk2cdf.py=stglib.core.cmd:runrskrsk2cdf',
+              'runrskcdf2nc.py=stglib.core.cmd:runrskcdf2nc',
+              'runrsknc2diwasp.py=stglib.core.cmd:runrsknc2diwasp',
+              'runexocsv2cdf.py=stglib.core.cmd:runexocsv2cdf',
+              'runexocdf2nc.py=stglib.core.cmd:runexocdf2nc',
+              'runiqmat2cdf.py=stglib.core.cmd:runiqmat2cdf',
+              'runiqcdf2nc.py=stglib.core.cmd:runiqcdf2nc',
+              ],
+          },
       include_package_data=True
      )
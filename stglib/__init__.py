@@ -1,10 +1,46 @@
-from . import eco
-from . import exo
-from . import iq
-from . import hobo
-from . import aqd
-from . import rsk
-from . import indexvel
-from . import core
-from .core import utils, cmd
-from .core.utils import read_globalatts
+"""
+stglib: process oceanographic data
+
+Submodules are imported lazily on first attribute access, so that run scripts
+only pay the import cost of the instrument they actually process.
+"""
+
+import importlib
+
+# name -> module path, relative to this package
+_submodules = {'eco': '.eco',
+               'exo': '.exo',
+               'iq': '.iq',
+               'hobo': '.hobo',
+               'aqd': '.aqd',
+               'rsk': '.rsk',
+               'indexvel': '.indexvel',
+               'quicklook': '.quicklook',
+               'core': '.core',
+               'utils': '.core.utils',
+               'cmd': '.core.cmd'}
+
+# name -> (module path, attribute)
+_attributes = {'read_globalatts': ('.core.utils', 'read_globalatts')}
+
+__all__ = sorted(list(_submodules) + list(_attributes))
+
+
+def __getattr__(name):
+    if name in _submodules:
+        value = importlib.import_module(_submodules[name], __name__)
+    elif name in _attributes:
+        modname, attr = _attributes[name]
+        value = getattr(importlib.import_module(modname, __name__), attr)
+    else:
+        raise AttributeError(
+            'module %r has no attribute %r' % (__name__, name))
+
+    # cache so __getattr__ is only called once per name
+    globals()[name] = value
+
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -21,15 +21,9 @@ def cdf_to_nc(cdf_filename, atmpres=False):
     # Create depth variable depending on orientation
     VEL, T = qaqc.set_orientation(VEL, VEL['TransMatrix'].values)
 
-    # Transform coordinates from, most likely, BEAM to ENU
-    u, v, w = qaqc.coord_transform(VEL['VEL1'].values, VEL['VEL2'].values, VEL['VEL3'].values,
-        VEL['Heading'].values, VEL['Pitch'].values, VEL['Roll'].values, T, VEL.attrs['AQDCoordinateSystem'])
-
-    VEL['U'] = xr.DataArray(u, dims=('time', 'bindist'))
-    VEL['V'] = xr.DataArray(v, dims=('time', 'bindist'))
-    VEL['W'] = xr.DataArray(w, dims=('time', 'bindist'))
-
-    VEL = qaqc.magvar_correct(VEL)
+    # Transform coordinates from, most likely, BEAM to ENU, and correct for
+    # magnetic declination
+    VEL = qaqc.transform_velocity(VEL, T, ('time', 'bindist'))
 
     VEL['AGC'] = (VEL['AMP1'] + VEL['AMP2'] + VEL['AMP3']) / 3
 
@@ -2,7 +2,7 @@ from __future__ import division, print_function
 import pandas as pd
 import xarray as xr
 import numpy as np
-from ..core import utils
+from ..core import utils, provenance
 from . import qaqc
 
 def prf_to_cdf(metadata):
@@ -11,6 +11,8 @@ def prf_to_cdf(metadata):
     # TODO: clock drift code
     # TODO: logmeta code
 
+    provenance.reset_timings()
+
     basefile = metadata['basefile']
 
     if 'prefix' in metadata:
@@ -25,8 +27,21 @@ def prf_to_cdf(metadata):
 
     print("Loading ASCII files")
 
+    # lines of the .sen, .aN and .vN files to read, if clipping on read
+    window = utils.clip_window(metadata,
+                               timeshift=instmeta['AQDAverageInterval']/2)
+    if window is not None:
+        lines = utils.line_range(basefile + '.sen', qaqc.line_time, *window)
+        print('Reading %d profiles from %s to %s' % ((lines[1],) + window))
+    else:
+        lines = None
+
     # Load sensor data
-    ds = load_sen(basefile)
+    with provenance.timed('aqdhdr2cdf read'):
+        ds = load_sen(basefile, lines)
+
+    # from the config, where true is still distinct from 1 second
+    fill_gaps = metadata.get('fill_gaps')
 
     # write out metadata first, then deal exclusively with xarray attrs
     ds = utils.write_metadata(ds, metadata)
@@ -35,13 +50,22 @@ def prf_to_cdf(metadata):
     del metadata
     del instmeta
 
+    ds = utils.add_clip_history(ds, window)
+
     # Deal with metadata peculiarities
     ds = qaqc.check_attrs(ds)
 
     ds = qaqc.check_orientation(ds)
 
     # Load amplitude and velocity data
-    ds = load_amp_vel(ds, basefile)
+    with provenance.timed('aqdhdr2cdf read'):
+        ds = load_amp_vel(ds, basefile, lines)
+
+    ds = utils.normalize_time(ds, freq=fill_gaps)
+
+    ds = provenance.add_inputs(
+        ds, [basefile + ext for ext in ['.hdr', '.sen', '.a1', '.a2', '.a3',
+                                        '.v1', '.v2', '.v3']])
 
     # Compute time stamps
     ds = utils.shift_time(ds, ds.attrs['AQDAverageInterval']/2)
@@ -59,6 +83,8 @@ def prf_to_cdf(metadata):
     # need to drop datetime
     ds = ds.drop('datetime')
 
+    ds = provenance.add_timings(ds)
+
     ds.to_netcdf(cdf_filename, unlimited_dims='time')
 
     print('Finished writing data to %s' % cdf_filename)
@@ -66,10 +92,17 @@ def prf_to_cdf(metadata):
     return ds
 
 
-def load_sen(basefile):
-    """Load data from .sen file"""
+def load_sen(basefile, lines=None):
+    """
+    Load data from .sen file
+
+    `lines` is an optional (first line, number of lines) tuple of the
+    profiles to read
+    """
 
     senfile = basefile + '.sen'
+    if lines is not None:
+        senfile = utils.read_lines(senfile, *lines)
 
     # read csv and parse dates
     # https://stackoverflow.com/questions/27112591/parsing-year-month-day-hour-minute-second-in-python
@@ -106,11 +139,21 @@ def load_sen(basefile):
     return RAW
 
 
-def load_amp_vel(RAW, basefile):
-    """Load amplitude and velocity data from the .aN and .vN files"""
+def load_amp_vel(RAW, basefile, lines=None):
+    """
+    Load amplitude and velocity data from the .aN and .vN files
+
+    `lines` is an optional (first line, number of lines) tuple of the
+    profiles to read
+    """
+
+    def open_lines(filename):
+        if lines is None:
+            return filename
+        return utils.read_lines(filename, *lines)
 
     for n in [1, 2, 3]:
-        afile = basefile + '.a' + str(n)
+        afile = open_lines(basefile + '.a' + str(n))
         a = pd.read_csv(afile, header=None, delim_whitespace=True)
 
         if 'bindist' in RAW:
@@ -122,7 +165,7 @@ def load_amp_vel(RAW, basefile):
                                            dims=('time', 'bindist'),
                                            coords=coords)
 
-        vfile = basefile + '.v' + str(n)
+        vfile = open_lines(basefile + '.v' + str(n))
         v = pd.read_csv(vfile, header=None, delim_whitespace=True)
         # convert to cm/s
         RAW['VEL' + str(n)] = xr.DataArray(v * 100,
@@ -1,5 +1,6 @@
 from __future__ import division, print_function
 
+import datetime
 import numpy as np
 import xarray as xr
 
@@ -31,6 +32,11 @@ def ds_rename(ds, waves=False):
             'AMP2': 'AGC2_1222',
             'AMP3': 'AGC3_1223'})
 
+    # per-burst spike counts follow the variables they count
+    for k in list(varnames):
+        if k + '_spikes' in ds:
+            varnames[k + '_spikes'] = varnames[k] + '_spikes'
+
     ds.rename(varnames, inplace=True)
 
     return ds
@@ -62,52 +68,59 @@ def add_delta_t(ds, waves=False):
     return ds
 
 
-def coord_transform(vel1, vel2, vel3, heading, pitch, roll, T, cs):
-    """Perform coordinate transformation to ENU"""
-
-    N, M = np.shape(vel1)
+def coord_transform(vel1, vel2, vel3, heading, pitch, roll, T, cs,
+                    magvar=0):
+    """
+    Perform coordinate transformation to ENU
 
-    u = np.zeros((N,M))
-    v = np.zeros((N,M))
-    w = np.zeros((N,M))
+    All profiles are transformed at once. If `magvar` (magnetic declination,
+    degrees) is given it is added to the heading in the rotation, so the
+    output is rotated to geographic coordinates in the same pass. This is
+    equivalent to rotating the output by :py:func:`magvar_correct`.
+    """
 
     if cs == 'ENU':
-        print('Data already in Earth coordinates; doing nothing')
-
         u = vel1
         v = vel2
         w = vel3
-        # u =  vel1 * math.cos(magvar) + vel2 * math.sin(magvar);
-        # v = -vel1 * math.sin(magvar) + vel2 * math.cos(magvar);
-        # w = vel3;
+        if magvar:
+            print('Data already in Earth coordinates; rotating by magnetic '
+                  'declination of %f degrees' % magvar)
+            mv = np.deg2rad(magvar)
+            u = vel1 * np.cos(mv) + vel2 * np.sin(mv)
+            v = -vel1 * np.sin(mv) + vel2 * np.cos(mv)
+        else:
+            print('Data already in Earth coordinates; doing nothing')
     elif cs == 'XYZ':
         # TODO: add XYZ
         print("Data are in XYZ coordinates; transforming to Earth coordinates")
+        N, M = np.shape(vel1)
+        u = np.zeros((N,M))
+        v = np.zeros((N,M))
+        w = np.zeros((N,M))
     elif cs == 'BEAM':
         print('Data are in BEAM coordinates; transforming to Earth coordinates')
 
-        for i in range(N):
-            hh = np.pi * (heading[i] - 90) / 180
-            pp = np.pi * pitch[i] / 180
-            rr = np.pi * roll[i] / 180
+        hh = np.deg2rad(np.mod(np.asarray(heading) + magvar, 360) - 90)
+        pp = np.deg2rad(pitch)
+        rr = np.deg2rad(roll)
+        zero = np.zeros_like(hh)
+        one = np.ones_like(hh)
 
-            H = np.array([[ np.cos(hh), np.sin(hh), 0],
-                          [-np.sin(hh), np.cos(hh), 0],
-                          [ 0,          0,          1]])
+        # heading matrices, (N, 3, 3)
+        H = np.array([[ np.cos(hh), np.sin(hh), zero],
+                      [-np.sin(hh), np.cos(hh), zero],
+                      [ zero,       zero,       one]]).transpose((2, 0, 1))
 
-            # make tilt matrix
-            P = np.array([[np.cos(pp), -np.sin(pp) * np.sin(rr), -np.cos(rr) * np.sin(pp)],
-                          [0,           np.cos(rr),              -np.sin(rr)],
-                          [np.sin(pp),  np.sin(rr) * np.cos(pp),  np.cos(pp) * np.cos(rr)]])
+        # tilt matrices
+        P = np.array([[np.cos(pp), -np.sin(pp) * np.sin(rr), -np.cos(rr) * np.sin(pp)],
+                      [zero,        np.cos(rr),              -np.sin(rr)],
+                      [np.sin(pp),  np.sin(rr) * np.cos(pp),  np.cos(pp) * np.cos(rr)]]).transpose((2, 0, 1))
 
-            # resulting transformation matrix
-            R = np.dot(np.dot(H, P), T)
+        # resulting transformation matrices
+        R = H @ P @ T
 
-            for j in range(M):
-                vel = np.dot(R, np.array([vel1[i,j], vel2[i,j], vel3[i,j]]).T)
-                u[i,j] = vel[0]
-                v[i,j] = vel[1]
-                w[i,j] = vel[2]
+        u, v, w = np.einsum('nij,jnm->inm', R, np.array([vel1, vel2, vel3]))
 
     return u, v, w
 
@@ -162,8 +175,8 @@ def make_bin_depth(VEL):
     return VEL
 
 
-def magvar_correct(ds):
-    """Correct for magnetic declination at site"""
+def get_magvar(ds):
+    """Magnetic declination at site from metadata, in degrees"""
 
     if 'magnetic_variation_at_site' in ds.attrs:
         magvardeg = ds.attrs['magnetic_variation_at_site']
@@ -173,66 +186,171 @@ def magvar_correct(ds):
         print('No magnetic variation information provided; using zero for compass correction')
         magvardeg = 0
 
-    print('Rotating heading and horizontal velocities by %f degrees' % magvardeg)
+    return magvardeg
+
+
+def magvar_correct(ds, velocity=True):
+    """
+    Correct for magnetic declination at site
+
+    Rotates the heading and, if `velocity`, the horizontal velocities. Use
+    ``velocity=False`` when the declination has already been applied in
+    :py:func:`coord_transform`.
+    """
+
+    magvardeg = get_magvar(ds)
+
+    if velocity:
+        print('Rotating heading and horizontal velocities by %f degrees' % magvardeg)
+    else:
+        print('Rotating heading by %f degrees' % magvardeg)
 
-    ds['Heading'] = ds['Heading'] + magvardeg
-    ds['Heading'][ds['Heading'] >= 360] = ds['Heading'][ds['Heading'] >= 360] - 360
-    ds['Heading'][ds['Heading'] < 0] = ds['Heading'][ds['Heading'] < 0] + 360
+    ds['Heading'] = np.mod(ds['Heading'] + magvardeg, 360)
 
-    vel1 = ds['U'].copy()
-    vel2 = ds['V'].copy()
+    if velocity:
+        vel1 = ds['U']
+        vel2 = ds['V']
 
-    magvar = magvardeg * np.pi / 180
+        mv = magvardeg * np.pi / 180
 
-    ds['U'] =  vel1 * np.cos(magvar) + vel2 * np.sin(magvar)
-    ds['V'] = -vel1 * np.sin(magvar) + vel2 * np.cos(magvar)
+        ds['U'] =  vel1 * np.cos(mv) + vel2 * np.sin(mv)
+        ds['V'] = -vel1 * np.sin(mv) + vel2 * np.cos(mv)
 
     return ds
 
 
-def trim_vel(ds, waves=False):
-    """Trim velocity data depending on specified method"""
+def transform_velocity(ds, T, dims):
+    """
+    Transform VEL1, VEL2, VEL3 to ENU U, V, W and correct for magnetic
+    declination.
+
+    By default the declination is applied within the coordinate rotation.
+    Set ``separate_magvar`` in the metadata to rotate the ENU velocities
+    afterward in a separate step instead (the original method, useful for
+    validation).
+    """
+
+    args = (ds['VEL1'].values, ds['VEL2'].values, ds['VEL3'].values,
+            ds['Heading'].values, ds['Pitch'].values, ds['Roll'].values, T,
+            ds.attrs['AQDCoordinateSystem'])
+
+    if ds.attrs.get('separate_magvar'):
+        u, v, w = coord_transform(*args)
+    else:
+        u, v, w = coord_transform(*args, magvar=get_magvar(ds))
+
+    ds['U'] = xr.DataArray(u, dims=dims)
+    ds['V'] = xr.DataArray(v, dims=dims)
+    ds['W'] = xr.DataArray(w, dims=dims)
+
+    return magvar_correct(ds, velocity=bool(ds.attrs.get('separate_magvar')))
+
+
+def trim_masks(ds):
+    """
+    Compute a boolean (time, bindist) mask of good data for each trimming
+    method specified in the metadata.
+
+    Methods are ``trim_method`` (``'water level'`` or ``'water level sl'``
+    for water level and sidelobes), ``cutoff_ampl`` (minimum AGC, counts;
+    0 to not cut off) and ``ampl_dropoff`` (trim bins beyond where AGC decreases by more than
+    this many counts from one bin to the next, e.g. above the surface
+    echo).
+
+    Returns
+    -------
+    dict
+        History text -> mask, True where data are good
+    """
+
+    masks = {}
+    bindist = ds['bindist'].values
 
     if ('trim_method' in ds.attrs and
-           ds.attrs['trim_method'].lower() != 'none' and
-           ds.attrs['trim_method'] != None):
+            ds.attrs['trim_method'] is not None and
+            ds.attrs['trim_method'].lower() != 'none'):
 
         if 'Pressure_ac' in ds:
             print('Using atmospherically corrected pressure to trim')
-            WL = ds['Pressure_ac'] + ds.attrs['transducer_offset_from_bottom']
-            P = ds['Pressure_ac']
+            P = ds['Pressure_ac'].values
         elif 'Pressure' in ds:
             # FIXME incorporate press_ ac below
             print('Using NON-atmospherically corrected pressure to trim')
-            WL = ds['Pressure'] + ds.attrs['transducer_offset_from_bottom']
-            P = ds['Pressure']
+            P = ds['Pressure'].values
 
         if ds.attrs['trim_method'].lower() == 'water level':
             print('Trimming using water level')
-            for var in ['U', 'V', 'W', 'AGC']:
-                ds[var] = ds[var].where(ds['bindist'] < P)
-            ds.attrs['history'] = 'Trimmed velocity data using water level. '+ ds.attrs['history']
+            masks['water level'] = bindist[None, :] < P[:, None]
         elif ds.attrs['trim_method'].lower() == 'water level sl':
             print('Trimming using water level and sidelobes')
-            for var in ['U', 'V', 'W', 'AGC']:
-                ds[var] = ds[var].where(ds['bindist'] < P * np.cos(np.deg2rad(ds.attrs['AQDBeamAngle'])))
-            ds.attrs['history'] = 'Trimmed velocity data using water level and sidelobes. '+ ds.attrs['history']
+            masks['water level and sidelobes'] = (
+                bindist[None, :] <
+                P[:, None] * np.cos(np.deg2rad(ds.attrs['AQDBeamAngle'])))
 
-        # find first bin that is all bad values
-        # there might be a better way to do this using xarray and named dimensions, but this works for now
-        lastbin = np.argmin(np.all(np.isnan(ds['U']), axis=0) == False)
-        print(lastbin)
-        # this trims so there are no all-nan rows in the data
-        ds = ds.isel(bindist=slice(0, lastbin))
+    if 'AGC' in ds and ds.attrs.get('cutoff_ampl'):
+        print('Trimming using amplitude cutoff of %s counts' %
+              ds.attrs['cutoff_ampl'])
+        masks['amplitude cutoff of %s counts' % ds.attrs['cutoff_ampl']] = (
+            ds['AGC'].values >= ds.attrs['cutoff_ampl'])
 
-        # TODO: need to add histcomment
+    if 'AGC' in ds and 'ampl_dropoff' in ds.attrs:
+        print('Trimming using amplitude drop-off of %s counts' %
+              ds.attrs['ampl_dropoff'])
+        drop = np.diff(ds['AGC'].values, axis=1) < -ds.attrs['ampl_dropoff']
+        # bad from the first drop-off onward
+        bad = np.logical_or.accumulate(drop, axis=1)
+        masks['amplitude drop-off of %s counts' % ds.attrs['ampl_dropoff']] = (
+            np.hstack([np.ones((len(bad), 1), dtype=bool), ~bad]))
 
-        # TODO: add other trim methods
-    else:
+    return masks
+
+
+def trim_vel(ds, waves=False):
+    """
+    Trim velocity data depending on specified method(s)
+
+    The masks from :py:func:`trim_masks` are combined and applied to U, V,
+    W, and AGC, and bins beyond the last one with any good data are removed.
+    """
+
+    masks = trim_masks(ds)
+
+    if not masks:
         print('Did not trim velocity data')
+        return ds
+
+    good = np.logical_and.reduce(list(masks.values()))
+    goodda = xr.DataArray(good, dims=ds['U'].dims)
+
+    for var in ['U', 'V', 'W', 'AGC']:
+        if var in ds:
+            ds[var] = ds[var].where(goodda)
+
+    for method in masks:
+        ds.attrs['history'] = ('Trimmed velocity data using %s. ' % method +
+                               ds.attrs['history'])
+
+    # bins beyond the last one with any good data
+    anygood = np.flatnonzero(good.any(axis=0))
+    lastbin = anygood[-1] + 1 if len(anygood) else 0
+    print('Trimming to %d bins' % lastbin)
+    ds = ds.isel(bindist=slice(0, lastbin))
 
     return ds
 
+
+def line_time(line):
+    """
+    Time of a line of an Aquadopp .sen or .whd file, which begin with month,
+    day, year, hour, minute, and second
+    """
+
+    mo, dd, yy, hh, mi, ss = line.split()[:6]
+
+    return datetime.datetime(int(yy), int(mo), int(dd), int(hh), int(mi),
+                             int(float(ss)))
+
+
 def read_aqd_hdr(basefile):
     """
     Get instrument metadata from .hdr file
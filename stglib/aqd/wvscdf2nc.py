@@ -1,7 +1,6 @@
 from __future__ import division, print_function
 
-import xarray as xr
-from ..core import utils
+from ..core import utils, despike
 from . import qaqc
 
 def cdf_to_nc(cdf_filename, atmpres=False):
@@ -12,21 +11,20 @@ def cdf_to_nc(cdf_filename, atmpres=False):
     # Clip data to in/out water times or via good_ens
     ds = utils.clip_ds(ds)
 
+    # Remove spikes from the burst data, in the coordinates they were
+    # recorded in
+    ds = despike.despike_from_attrs(
+        ds, ['Pressure', 'Pressure_ac', 'VEL1', 'VEL2', 'VEL3'])
+
     # Create water_depth variables
     ds = utils.create_water_depth(ds)
 
     # Create depth variable depending on orientation
     ds, T = qaqc.set_orientation(ds, ds['TransMatrix'].values)
 
-    # Transform coordinates from, most likely, BEAM to ENU
-    u, v, w = qaqc.coord_transform(ds['VEL1'].values, ds['VEL2'].values, ds['VEL3'].values,
-        ds['Heading'].values, ds['Pitch'].values, ds['Roll'].values, T, ds.attrs['AQDCoordinateSystem'])
-
-    ds['U'] = xr.DataArray(u, dims=('time', 'sample'))
-    ds['V'] = xr.DataArray(v, dims=('time', 'sample'))
-    ds['W'] = xr.DataArray(w, dims=('time', 'sample'))
-
-    ds = qaqc.magvar_correct(ds)
+    # Transform coordinates from, most likely, BEAM to ENU, and correct for
+    # magnetic declination
+    ds = qaqc.transform_velocity(ds, T, ('time', 'sample'))
 
     ds = qaqc.make_bin_depth(ds)
 
@@ -5,10 +5,19 @@ import xarray as xr
 import sys
 from ..core import utils
 
+# sample-resolution variables of the processed waves file that are not
+# carried through to the wave statistics, so they are never loaded.
+# Pressure is needed to compute water_depth and is dropped afterward.
+UNUSED = ['Tx_1211', 'vel1_1277', 'vel2_1278', 'vel3_1279', 'U', 'V', 'W',
+          'avgamp1', 'avgamp2', 'avgamp3', 'AGC1_1221', 'AGC2_1222',
+          'AGC3_1223', 'TransMatrix', 'nrecs', 'burst', 'soundspeed',
+          'Battery', 'Hdg_1215', 'Ptch_1216', 'Roll_1217']
+
 
 def nc_to_diwasp(nc_filename):
 
-    ds = xr.open_dataset(nc_filename, autoclose=True, decode_times=False)
+    ds = xr.open_dataset(nc_filename, decode_times=False,
+                         drop_variables=UNUSED)
 
     ds = utils.epic_to_cf_time(ds)
 
@@ -29,31 +38,8 @@ def nc_to_diwasp(nc_filename):
 
     ds = utils.create_water_depth(ds)
 
-    # Remove old variables as we just want to keep the wave statistics
-    ds = ds.drop(['P_1',
-                  'P_1ac',
-                  'sample',
-                  'Tx_1211',
-                  'vel1_1277',
-                  'vel2_1278',
-                  'vel3_1279',
-                  'U',
-                  'V',
-                  'W',
-                  'avgamp1',
-                  'avgamp2',
-                  'avgamp3',
-                  'AGC1_1221',
-                  'AGC2_1222',
-                  'AGC3_1223',
-                  'TransMatrix',
-                  'nrecs',
-                  'burst',
-                  'soundspeed',
-                  'Battery',
-                  'Hdg_1215',
-                  'Ptch_1216',
-                  'Roll_1217'])
+    # Remove pressure as we just want to keep the wave statistics
+    ds = ds.drop([k for k in ['P_1', 'P_1ac', 'sample'] if k in ds.variables])
 
     ds = utils.trim_max_wp(ds)
 
@@ -4,12 +4,14 @@ import sys
 import pandas as pd
 import xarray as xr
 import numpy as np
-from ..core import utils
+from ..core import utils, provenance
 from . import qaqc
 
 def wad_to_cdf(metadata):
     """Main waves load file"""
 
+    provenance.reset_timings()
+
     basefile = metadata['basefile']
 
     # get instrument metadata from the HDR file
@@ -17,7 +19,21 @@ def wad_to_cdf(metadata):
 
     metadata['instmeta'] = instmeta
 
-    ds = load_whd(metadata)
+    # bursts to read, if clipping on read
+    fs = float(instmeta['WaveSampleRate'].split()[0])
+    window = utils.clip_window(
+        metadata, timeshift=instmeta['WaveNumberOfSamples']/fs/2)
+    if window is not None:
+        bursts = utils.line_range(basefile + '.whd', qaqc.line_time, *window)
+        print('Reading %d bursts from %s to %s' % ((bursts[1],) + window))
+    else:
+        bursts = None
+
+    with provenance.timed('wvswad2cdf read'):
+        ds = load_whd(metadata, bursts)
+
+    # from the config, where true is still distinct from 1 second
+    fill_gaps = metadata.get('fill_gaps')
 
     # write out metadata first, then deal exclusively with xarray attrs
     ds = utils.write_metadata(ds, metadata)
@@ -26,7 +42,15 @@ def wad_to_cdf(metadata):
     del metadata
     del instmeta
 
-    ds = load_wad(ds)
+    ds = utils.add_clip_history(ds, window)
+
+    with provenance.timed('wvswad2cdf read'):
+        ds = load_wad(ds, bursts)
+
+    ds = utils.normalize_time(ds, freq=fill_gaps)
+
+    ds = provenance.add_inputs(
+        ds, [basefile + ext for ext in ['.hdr', '.whd', '.wad']])
 
     # Deal with metadata peculiarities
     ds = qaqc.check_attrs(ds, waves=True)
@@ -38,7 +62,6 @@ def wad_to_cdf(metadata):
     ds = qaqc.check_orientation(ds, waves=True)
 
     # Compute time stamps
-    fs = float(ds.attrs['WaveSampleRate'].split()[0])
     ds = utils.shift_time(ds, ds.attrs['WaveNumberOfSamples']/fs/2)
 
     ds = utils.create_epic_time(ds)
@@ -51,16 +74,25 @@ def wad_to_cdf(metadata):
     # need to drop datetime
     ds = ds.drop('datetime')
 
+    ds = provenance.add_timings(ds)
+
     ds.to_netcdf(cdf_filename, unlimited_dims='time')
 
     print('Finished writing data to %s' % cdf_filename)
 
     return ds
 
-def load_whd(metadata):
-    """Load data from .whd file"""
+def load_whd(metadata, bursts=None):
+    """
+    Load data from .whd file
+
+    `bursts` is an optional (first burst, number of bursts) tuple of the
+    bursts to read
+    """
 
     whdfile = metadata['basefile'] + '.whd'
+    if bursts is not None:
+        whdfile = utils.read_lines(whdfile, *bursts)
 
     # read csv and parse dates
     # https://stackoverflow.com/questions/27112591/parsing-year-month-day-hour-minute-second-in-python
@@ -97,12 +129,23 @@ def load_whd(metadata):
 
     return ds
 
-def load_wad(ds):
+def load_wad(ds, bursts=None):
+    """
+    Load burst data from .wad file
+
+    `bursts` is an optional (first burst, number of bursts) tuple of the
+    bursts to read
+    """
 
     wadfile = ds.attrs['basefile'] + '.wad'
     print('Loading wave data from ' + wadfile + '; this may take some time')
+    if bursts is not None:
+        spb = int(ds.attrs['WaveNumberOfSamples'])
+        wad = utils.read_lines(wadfile, bursts[0] * spb, bursts[1] * spb)
+    else:
+        wad = wadfile
     # pd.read_csv is ~10x faster than np.loadtxt or np.genfromtxt
-    WAD = pd.read_csv(wadfile, header=None, delim_whitespace=True).values
+    WAD = pd.read_csv(wad, header=None, delim_whitespace=True).values
 
     r, c = np.shape(WAD)
     print(wadfile + ' has ' + str(r) + ' rows and ' + str(c) + ' columns')
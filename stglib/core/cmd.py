@@ -45,6 +45,53 @@ def aqdcdf2nc_parse_args():
     return parser.parse_args()
 
 
+def wvswad2cdf_parser():
+    description = ('Convert Aquadopp .wad wave files to raw .cdf format. Run '
+                   'this script from the directory containing Aquadopp files')
+    parser = argparse.ArgumentParser(description=description)
+    gattsarg(parser)
+    yamlarg(parser)
+
+    return parser
+
+
+def wvswad2cdf_parse_args():
+    parser = wvswad2cdf_parser()
+
+    return parser.parse_args()
+
+
+def wvscdf2nc_parser():
+    description = ('Convert raw Aquadopp .cdf wave files to processed .nc '
+                   'files')
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('cdfname', help='raw .CDF filename')
+    parser.add_argument('--atmpres', help=('path to cdf file containing '
+                                           'atmopsheric pressure data'))
+
+    return parser
+
+
+def wvscdf2nc_parse_args():
+    parser = wvscdf2nc_parser()
+
+    return parser.parse_args()
+
+
+def wvsnc2diwasp_parser():
+    description = 'Convert processed Aquadopp waves .nc files using DIWASP'
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('ncname', help='processed .nc filename')
+
+    return parser
+
+
+def wvsnc2diwasp_parse_args():
+    parser = wvsnc2diwasp_parser()
+
+    return parser.parse_args()
+
+
 def rskrsk2cdf_parser():
     description = ('Convert raw RBR d|wave files (.rsk) to raw .cdf format. '
                    'Run this script from the directory '
@@ -91,3 +138,350 @@ def rsknc2diwasp_parse_args():
     parser = rsknc2diwasp_parser()
 
     return parser.parse_args()
+
+
+def exocsv2cdf_parser():
+    description = ('Convert EXO .csv file to raw .cdf format. Run this script '
+                   'from the directory containing EXO file')
+    parser = argparse.ArgumentParser(description=description)
+    gattsarg(parser)
+    yamlarg(parser)
+
+    return parser
+
+
+def exocsv2cdf_parse_args():
+    parser = exocsv2cdf_parser()
+
+    return parser.parse_args()
+
+
+def exocdf2nc_parser():
+    description = 'Convert raw EXO .cdf format to processed .nc files'
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('cdfname', help='raw .CDF filename')
+    parser.add_argument('--atmpres', help=('path to cdf file containing '
+                                           'atmopsheric pressure data'))
+
+    return parser
+
+
+def exocdf2nc_parse_args():
+    parser = exocdf2nc_parser()
+
+    return parser.parse_args()
+
+
+def iqmat2cdf_parser():
+    description = ('Convert SonTek IQ .mat export to raw .cdf format. Run '
+                   'this script from the directory containing the IQ file')
+    parser = argparse.ArgumentParser(description=description)
+    gattsarg(parser)
+    yamlarg(parser)
+
+    return parser
+
+
+def iqmat2cdf_parse_args():
+    parser = iqmat2cdf_parser()
+
+    return parser.parse_args()
+
+
+def iqcdf2nc_parser():
+    description = 'Convert raw SonTek IQ .cdf format to processed .nc files'
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('cdfname', help='raw .CDF filename')
+
+    return parser
+
+
+def iqcdf2nc_parse_args():
+    parser = iqcdf2nc_parser()
+
+    return parser.parse_args()
+
+
+def serve_parser():
+    description = ('Run a long-lived processing worker that executes jobs '
+                   'placed in a queue directory')
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('queue', help='path to job queue directory')
+    parser.add_argument('--processes', type=int,
+                        help='number of worker processes (default: one per '
+                             'CPU)')
+    parser.add_argument('--poll', type=float, default=1.,
+                        help='seconds between checks for new jobs')
+    parser.add_argument('--once', action='store_true',
+                        help='exit when the queue is empty')
+
+    return parser
+
+
+def quicklook_parser():
+    description = ('Create quicklook plots of all raw .cdf files in a '
+                   'directory')
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('directory', nargs='?', default='.',
+                        help='directory containing raw files (default: .)')
+    parser.add_argument('--pattern', default='*-raw.cdf',
+                        help="glob pattern of files to plot "
+                             "(default: '*-raw.cdf')")
+    parser.add_argument('--processes', type=int,
+                        help='number of processes (default: one per CPU)')
+
+    return parser
+
+
+def inventory_parser():
+    description = ('List start and stop times, record and burst counts, and '
+                   'sizes of the raw instrument files in a directory, '
+                   'without reading their data')
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('directory', nargs='?', default='.',
+                        help='directory containing raw files (default: .)')
+    parser.add_argument('--pattern', default='*',
+                        help="glob pattern of files to list (default: '*')")
+
+    return parser
+
+
+def lowpass_parser():
+    description = ('Low-pass filter variables of a processed .nc file in '
+                   'place, in chunks, adding filtered copies of them')
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('ncname', help='processed .nc file')
+    parser.add_argument('variables', nargs='+',
+                        help='variables to filter, e.g. P_1 u_1205 v_1206')
+    parser.add_argument('--method', default='pl33',
+                        choices=['pl33', 'godin', 'butter'],
+                        help='filter (default: pl33)')
+    parser.add_argument('--cutoff', type=float, default=33.,
+                        help='half-amplitude or cutoff period, in hours '
+                             '(default: 33)')
+    parser.add_argument('--suffix', default='_lp',
+                        help="suffix of filtered variable names "
+                             "(default: '_lp')")
+    parser.add_argument('--chunksize', type=int, default=2**16,
+                        help='time steps filtered at once (default: 65536)')
+
+    return parser
+
+
+def load_metadata(gatts, config):
+    """
+    Initialize metadata from the global attributes file and add additional
+    metadata from the instrument config file
+    """
+
+    import yaml
+    from . import utils
+
+    metadata = utils.read_globalatts(gatts)
+
+    with open(config) as f:
+        config = yaml.safe_load(f)
+
+    for k in config:
+        metadata[k] = config[k]
+
+    return metadata
+
+
+# Console entry points. The processing modules are imported inside each
+# function so that only the instrument being processed is loaded.
+
+def runaqdhdr2cdf(args=None):
+    from ..aqd import hdr2cdf
+
+    args = aqdhdr2cdf_parser().parse_args(args)
+    metadata = load_metadata(args.gatts, args.config)
+
+    return hdr2cdf.prf_to_cdf(metadata)
+
+
+def runaqdcdf2nc(args=None):
+    from ..aqd import cdf2nc
+
+    args = aqdcdf2nc_parser().parse_args(args)
+
+    if args.atmpres:
+        return cdf2nc.cdf_to_nc(args.cdfname, atmpres=args.atmpres)
+    else:
+        return cdf2nc.cdf_to_nc(args.cdfname)
+
+
+def runwvswad2cdf(args=None):
+    from ..aqd import wvswad2cdf
+
+    args = wvswad2cdf_parser().parse_args(args)
+    metadata = load_metadata(args.gatts, args.config)
+
+    return wvswad2cdf.wad_to_cdf(metadata)
+
+
+def runwvscdf2nc(args=None):
+    from ..aqd import wvscdf2nc
+
+    args = wvscdf2nc_parser().parse_args(args)
+
+    if args.atmpres:
+        return wvscdf2nc.cdf_to_nc(args.cdfname, atmpres=args.atmpres)
+    else:
+        return wvscdf2nc.cdf_to_nc(args.cdfname)
+
+
+def runwvsnc2diwasp(args=None):
+    from ..aqd import wvsnc2diwasp
+
+    args = wvsnc2diwasp_parser().parse_args(args)
+
+    return wvsnc2diwasp.nc_to_diwasp(args.ncname)
+
+
+def runrskrsk2cdf(args=None):
+    from ..rsk import rsk2cdf
+
+    args = rskrsk2cdf_parser().parse_args(args)
+    metadata = load_metadata(args.gatts, args.config)
+
+    return rsk2cdf.rsk_to_cdf(metadata)
+
+
+def runrskcdf2nc(args=None):
+    from ..rsk import cdf2nc
+
+    args = rskcdf2nc_parser().parse_args(args)
+
+    if args.atmpres:
+        return cdf2nc.cdf_to_nc(args.cdfname, atmpres=args.atmpres)
+    else:
+        return cdf2nc.cdf_to_nc(args.cdfname)
+
+
+def runrsknc2diwasp(args=None):
+    from ..rsk import nc2diwasp
+
+    args = rsknc2diwasp_parser().parse_args(args)
+
+    return nc2diwasp.nc_to_diwasp(args.ncname)
+
+
+def runexocsv2cdf(args=None):
+    from .. import exo
+
+    args = exocsv2cdf_parser().parse_args(args)
+    metadata = load_metadata(args.gatts, args.config)
+
+    return exo.csv_to_cdf(metadata)
+
+
+def runexocdf2nc(args=None):
+    from .. import exo
+
+    args = exocdf2nc_parser().parse_args(args)
+
+    if args.atmpres:
+        return exo.cdf_to_nc(args.cdfname, atmpres=args.atmpres)
+    else:
+        return exo.cdf_to_nc(args.cdfname)
+
+
+def runserve(args=None):
+    from . import worker
+
+    args = serve_parser().parse_args(args)
+
+    return worker.serve(args.queue,
+                        processes=args.processes,
+                        poll_interval=args.poll,
+                        once=args.once)
+
+
+def runiqmat2cdf(args=None):
+    from .. import iq
+
+    args = iqmat2cdf_parser().parse_args(args)
+    metadata = load_metadata(args.gatts, args.config)
+
+    return iq.mat_to_cdf(metadata)
+
+
+def runiqcdf2nc(args=None):
+    from .. import iq
+
+    args = iqcdf2nc_parser().parse_args(args)
+
+    return iq.cdf_to_nc(args.cdfname)
+
+
+def runquicklook(args=None):
+    import matplotlib
+    matplotlib.use('Agg')
+    from .. import quicklook
+
+    args = quicklook_parser().parse_args(args)
+
+    return quicklook.make_quicklooks(args.directory,
+                                     pattern=args.pattern,
+                                     processes=args.processes)
+
+
+def runinventory(args=None):
+    from . import inventory
+
+    args = inventory_parser().parse_args(args)
+
+    df = inventory.inventory(args.directory, pattern=args.pattern)
+    print(df.to_string(index=False))
+
+    return df
+
+
+def runlowpass(args=None):
+    from . import lowpass
+
+    args = lowpass_parser().parse_args(args)
+
+    lowpass.filter_nc(args.ncname, args.variables, method=args.method,
+                      cutoff=args.cutoff, suffix=args.suffix,
+                      chunksize=args.chunksize)
+
+
+commands = {'aqdhdr2cdf': runaqdhdr2cdf,
+            'aqdcdf2nc': runaqdcdf2nc,
+            'wvswad2cdf': runwvswad2cdf,
+            'wvscdf2nc': runwvscdf2nc,
+            'wvsnc2diwasp': runwvsnc2diwasp,
+            'rskrsk2cdf': runrskrsk2cdf,
+            'rskcdf2nc': runrskcdf2nc,
+            'rsknc2diwasp': runrsknc2diwasp,
+            'exocsv2cdf': runexocsv2cdf,
+            'exocdf2nc': runexocdf2nc,
+            'iqmat2cdf': runiqmat2cdf,
+            'iqcdf2nc': runiqcdf2nc,
+            'quicklook': runquicklook,
+            'inventory': runinventory,
+            'lowpass': runlowpass,
+            'serve': runserve}
+
+
+def main(args=None):
+    """
+    Entry point for the ``stglib`` command, which dispatches to the individual
+    processing commands, e.g. ``stglib aqdhdr2cdf gatts.txt config.yaml``
+    """
+
+    import sys
+
+    if args is None:
+        args = sys.argv[1:]
+
+    if not args or args[0] not in commands:
+        print('usage: stglib {%s} ...' % ','.join(commands))
+        sys.exit(0 if args and args[0] in ('-h', '--help') else 2)
+
+    # so the subcommand's usage message reads correctly
+    sys.argv[0] = 'stglib ' + args[0]
+
+    commands[args[0]](args[1:])
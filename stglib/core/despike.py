@@ -0,0 +1,337 @@
+"""
+Despiking of burst (time, sample) data.
+
+Spikes are found for all bursts at once, with each burst treated as an
+independent series along the sample axis, either from a robust z-score
+(median and median absolute deviation) or with the phase-space method of
+Goring and Nikora (2002). Spikes are then replaced by linear interpolation
+between neighboring good samples, or left as NaN.
+"""
+
+from __future__ import division, print_function
+import warnings
+import numpy as np
+
+METHODS = ['mad', 'phasespace']
+
+
+def running_median(x, window=5):
+    """Running median of odd length `window` along the last axis, with the
+    ends padded by their nearest values"""
+
+    from numpy.lib.stride_tricks import as_strided
+
+    half = window // 2
+    pad = [(0, 0)] * (x.ndim - 1) + [(half, half)]
+    xp = np.pad(x, pad, mode='edge')
+    view = as_strided(xp, shape=x.shape + (window,),
+                      strides=xp.strides + (xp.strides[-1],), writeable=False)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', category=RuntimeWarning)
+        return _median(view)[..., 0]
+
+
+def mad_spikes(x, threshold=5., window=5):
+    """
+    Find samples that differ from the running median of `window` samples
+    by more than `threshold` robust standard deviations (1.4826 times the
+    median absolute deviation) of the sample-to-sample differences in their
+    burst.
+
+    Comparing with the running median rather than the burst median keeps
+    the wave signal itself from inflating the threshold, and scaling by the
+    spread of the differences keeps the curvature of short waves from being
+    mistaken for spikes.
+
+    Parameters
+    ----------
+    x : numpy.ndarray
+        (burst, sample) array
+    threshold : float, optional
+        Threshold, in robust standard deviations. Default 5
+    window : int, optional
+        Length of the running median, in samples. Default 5
+
+    Returns
+    -------
+    numpy.ndarray
+        Boolean array, True at spikes
+    """
+
+    x = np.asarray(x, dtype=float)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', category=RuntimeWarning)
+        dev = np.abs(x - running_median(x, window))
+        scale = _robust_std(np.diff(x, axis=-1))
+
+    return dev > threshold * scale
+
+
+def phase_space_spikes(x, threshold=None, maxiter=10):
+    """
+    Find spikes with the phase-space thresholding method of Goring and
+    Nikora (2002), J. Hydraul. Eng., 128(1), 117-126.
+
+    Each sample, with its first and second differences, is a point in phase
+    space; points outside the ellipsoid whose axes are the universal
+    threshold sqrt(2 ln n) times the standard deviations of the three
+    quantities are spikes. The standard deviations are estimated from the
+    median absolute deviation, which spikes do not inflate (Wahl, 2003).
+    Because differencing spreads a spike to its neighbors, only points that
+    depart further from the mean of their neighbors than either neighbor
+    does are taken as spikes. Spikes are interpolated over and the test is
+    repeated until no new spikes are found.
+
+    Parameters
+    ----------
+    x : numpy.ndarray
+        (burst, sample) array
+    threshold : float, optional
+        Multiplier of the standard deviations. Default sqrt(2 ln n), n being
+        the number of samples per burst
+    maxiter : int, optional
+        Maximum number of iterations. Default 10
+
+    Returns
+    -------
+    numpy.ndarray
+        Boolean array, True at spikes
+    """
+
+    x = np.array(x, dtype=float)
+    spikes = np.zeros(x.shape, dtype=bool)
+    if threshold is None:
+        threshold = np.sqrt(2 * np.log(x.shape[-1]))
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', category=RuntimeWarning)
+        for _ in range(maxiter):
+            u = x - _median(x)
+            du = np.gradient(u, axis=-1)
+            d2u = np.gradient(du, axis=-1)
+
+            su = threshold * _robust_std(u)
+            sdu = threshold * _robust_std(du)
+            sd2u = threshold * _robust_std(d2u)
+
+            # rotation of the principal axis in the u-d2u plane
+            theta = np.arctan2(np.nansum(u * d2u, axis=-1, keepdims=True),
+                               np.nansum(u ** 2, axis=-1, keepdims=True))
+            cos, sin = np.cos(theta), np.sin(theta)
+            # ellipse axes in the rotated u-d2u plane
+            a = np.sqrt(np.abs((su * cos) ** 2 - (sd2u * sin) ** 2) /
+                        np.abs(cos ** 4 - sin ** 4))
+            b = np.sqrt(np.abs((sd2u * cos) ** 2 - (su * sin) ** 2) /
+                        np.abs(cos ** 4 - sin ** 4))
+            ur = u * cos + d2u * sin
+            d2ur = -u * sin + d2u * cos
+
+            new = (((u / su) ** 2 + (du / sdu) ** 2 > 1) |
+                   ((du / sdu) ** 2 + (d2u / sd2u) ** 2 > 1) |
+                   ((ur / a) ** 2 + (d2ur / b) ** 2 > 1)) & ~spikes
+
+            # departure from the mean of the neighbors; a spike's neighbors
+            # depart by half as much, in the opposite direction
+            r = np.zeros_like(u)
+            r[..., 1:-1] = np.abs(u[..., 1:-1] -
+                                  (u[..., :-2] + u[..., 2:]) / 2)
+            peak = np.ones(u.shape, dtype=bool)
+            peak[..., 1:] &= r[..., 1:] >= r[..., :-1]
+            peak[..., :-1] &= r[..., :-1] >= r[..., 1:]
+            new &= peak
+            if not new.any():
+                break
+            spikes |= new
+            x[new] = np.nan
+            x = interp_nan(x)
+
+    return spikes
+
+
+def _median(x):
+    """Median along the last axis, ignoring NaNs (the slower nanmedian is
+    only used if there are any)"""
+
+    if np.isnan(x).any():
+        return np.nanmedian(x, axis=-1, keepdims=True)
+
+    return np.median(x, axis=-1, keepdims=True)
+
+
+def _robust_std(x):
+    """Standard deviation along the last axis estimated from the median
+    absolute deviation"""
+
+    return 1.4826 * _median(np.abs(x - _median(x)))
+
+
+def interp_nan(x):
+    """
+    Linearly interpolate over NaNs along the last axis of `x`, for all rows
+    at once. NaNs before the first or after the last good sample of a row
+    take the value of the nearest good sample; rows without any good samples
+    are left as NaN.
+    """
+
+    x = np.asarray(x, dtype=float)
+    bad = np.isnan(x)
+    if not bad.any():
+        return x
+
+    n = x.shape[-1]
+    idx = np.broadcast_to(np.arange(n), x.shape)
+
+    # index of the previous and next good sample of each sample
+    prev = np.maximum.accumulate(np.where(bad, -1, idx), axis=-1)
+    nxt = np.flip(np.minimum.accumulate(
+        np.flip(np.where(bad, n, idx), axis=-1), axis=-1), axis=-1)
+
+    # nearest good sample at the ends
+    prev = np.where(prev < 0, nxt, prev)
+    nxt = np.where(nxt >= n, prev, nxt)
+    prev = np.clip(prev, 0, n - 1)
+    nxt = np.clip(nxt, 0, n - 1)
+
+    x0 = np.take_along_axis(x, prev, axis=-1)
+    x1 = np.take_along_axis(x, nxt, axis=-1)
+    span = np.where(nxt > prev, nxt - prev, 1)
+    w = (idx - prev) / span
+
+    return np.where(bad, x0 + w * (x1 - x0), x)
+
+
+def find_spikes(x, method='mad', threshold=None):
+    """Boolean spike mask of a (burst, sample) array by `method`"""
+
+    if method == 'mad':
+        return mad_spikes(x, 5. if threshold is None else threshold)
+    elif method == 'phasespace':
+        return phase_space_spikes(x, threshold)
+    else:
+        raise ValueError('Unknown despiking method %r; must be one of %s' %
+                         (method, METHODS))
+
+
+def despike_array(x, method='mad', threshold=None, fill='interp',
+                  max_workers=None, chunksize=1000):
+    """
+    Despike a (burst, sample) array.
+
+    Parameters
+    ----------
+    x : numpy.ndarray
+        (burst, sample) array
+    method : {'mad', 'phasespace'}, optional
+        Spike detection method. Default 'mad'
+    threshold : float, optional
+        Threshold; see :py:func:`mad_spikes` and
+        :py:func:`phase_space_spikes` for the defaults
+    fill : {'interp', 'nan'}, optional
+        Replace spikes by linear interpolation, or with NaN. Default 'interp'
+    max_workers : int, optional
+        Number of threads; the bursts are divided into chunks of `chunksize`
+        bursts that are despiked in parallel. Default 1
+    chunksize : int, optional
+        Bursts per chunk. Default 1000
+
+    Returns
+    -------
+    x : numpy.ndarray
+        Despiked array (float)
+    nspikes : numpy.ndarray
+        Number of spikes in each burst
+    """
+
+    x = np.asarray(x, dtype=float)
+
+    def work(chunk):
+        spikes = find_spikes(chunk, method, threshold)
+        out = np.where(spikes, np.nan, chunk)
+        if fill == 'interp':
+            out = interp_nan(out)
+        return out, spikes.sum(axis=-1)
+
+    if max_workers is None or max_workers <= 1 or len(x) <= chunksize:
+        return work(x)
+
+    import concurrent.futures
+
+    chunks = [x[i:i + chunksize] for i in range(0, len(x), chunksize)]
+    with concurrent.futures.ThreadPoolExecutor(max_workers) as ex:
+        results = list(ex.map(work, chunks))
+
+    return (np.concatenate([r[0] for r in results]),
+            np.concatenate([r[1] for r in results]))
+
+
+def despike(ds, variables, method='mad', threshold=None, fill='interp',
+            max_workers=None):
+    """
+    Despike (time, sample) burst variables of a Dataset.
+
+    The number of spikes in each burst is recorded in a ``<var>_spikes``
+    variable.
+
+    Parameters
+    ----------
+    ds : xarray.Dataset
+        The Dataset
+    variables : list
+        Variables to despike; those not in `ds` are skipped
+    method, threshold, fill, max_workers
+        See :py:func:`despike_array`
+
+    Returns
+    -------
+    xarray.Dataset
+        The despiked Dataset
+    """
+
+    from . import utils
+
+    done = []
+    for var in variables:
+        if var not in ds:
+            continue
+        da = ds[var].transpose('time', 'sample')
+        values, nspikes = despike_array(da.values, method, threshold, fill,
+                                        max_workers)
+        ds[var] = da.copy(data=values.astype(
+            np.result_type(da.dtype, np.float32))).transpose(*ds[var].dims)
+        ds[var + '_spikes'] = ('time', nspikes.astype('int32'),
+                               {'long_name': 'Number of spikes in %s' % var,
+                                'units': 'count'})
+        print('Removed %d spikes from %s' % (nspikes.sum(), var))
+        done.append(var)
+
+    if done:
+        histtext = 'Despiked %s using %s method%s. ' % (
+            ', '.join(done), method,
+            '' if threshold is None else ' with threshold %s' % threshold)
+        ds = utils.insert_history(ds, histtext)
+
+    return ds
+
+
+def despike_from_attrs(ds, variables):
+    """
+    Despike `variables` according to the ``despike``,
+    ``despike_threshold``, ``despike_fill``, and ``despike_workers``
+    attributes (from the instrument config file). ``despike`` may be the
+    name of a method, or true for the MAD method; booleans are stored in the
+    raw .cdf file as 0 or 1, so any nonzero number also means the MAD
+    method. Does nothing if ``despike`` is not set or is false.
+    """
+
+    method = ds.attrs.get('despike')
+    if not isinstance(method, str):
+        if not method:
+            return ds
+        method = 'mad'
+
+    return despike(ds, variables, method=method,
+                   threshold=ds.attrs.get('despike_threshold'),
+                   fill=ds.attrs.get('despike_fill', 'interp'),
+                   max_workers=ds.attrs.get('despike_workers'))
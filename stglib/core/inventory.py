@@ -0,0 +1,377 @@
+"""
+Inventory of raw instrument files, without reading their data.
+
+Start and stop times, record and burst counts, and file sizes are found from
+headers and file tails only: the first and last lines of Aquadopp .sen and
+.whd files and of EXO, HOBO, and ECO .csv files, an aggregate query on RSK
+databases, and the variable shapes and sample times of IQ .mat files. This
+takes milliseconds per file, regardless of file size. Where the number of
+records can only be estimated (EXO and ECO files, whose lines are not
+fixed-width), ``records_estimated`` is True.
+"""
+
+from __future__ import division, print_function
+import os
+import glob
+import pandas as pd
+from . import utils
+
+COLUMNS = ['file', 'instrument', 'start', 'stop', 'records',
+           'records_estimated', 'bursts', 'size', 'error']
+
+
+def head_line(filename, skip=0, encoding='utf-8'):
+    """Return the first non-blank line of a text file after `skip` lines,
+    and the number of bytes up to and including it"""
+
+    nbytes = 0
+    with open(filename, 'rb') as f:
+        for n, line in enumerate(f):
+            nbytes += len(line)
+            if n >= skip and line.strip():
+                return line.decode(encoding, errors='replace'), nbytes
+
+    raise ValueError('No data lines found in %s' % filename)
+
+
+def first_data_line(filename, is_data, encoding='utf-8', nbytes=65536):
+    """
+    Return the first line of a text file for which `is_data` is True, and
+    the number of bytes before it, looking only in the first `nbytes`.
+    Returns (None, None) if there is none.
+    """
+
+    offset = 0
+    with open(filename, 'rb') as f:
+        for line in f:
+            if offset >= nbytes:
+                break
+            text = line.decode(encoding, errors='replace')
+            if is_data(text):
+                return text, offset
+            offset += len(line)
+
+    return None, None
+
+
+def last_data_line(filename, is_data):
+    """Return the last line of a text file for which `is_data` is True,
+    skipping any footer"""
+
+    for line in reversed(utils.tail_lines(filename)):
+        if is_data(line):
+            return line
+
+    raise ValueError('No data lines found at the end of %s' % filename)
+
+
+def count_records(filename, offset, is_data, encoding='utf-8',
+                  nbytes=65536):
+    """
+    Count the data lines in a text file after `offset` bytes. If the rest of
+    the file is longer than `nbytes`, the count is estimated from the mean
+    length of the lines in the first `nbytes` of it.
+
+    Returns
+    -------
+    n : int
+        Number of data lines
+    estimated : bool
+        True if `n` is an estimate
+    """
+
+    size = os.path.getsize(filename) - offset
+    with open(filename, 'rb') as f:
+        f.seek(offset)
+        block = f.read(nbytes)
+    if len(block) >= size:
+        return sum(1 for line in block.decode(encoding, errors='replace')
+                   .splitlines() if is_data(line)), False
+
+    # only count complete lines
+    block = block[:block.rfind(b'\n') + 1]
+
+    return int(round(size * block.count(b'\n') / len(block))), True
+
+
+def inventory_aqd(filename):
+    """
+    Inventory an Aquadopp .sen (one line per profile) or .whd (one line per
+    wave burst) file. Both are fixed-width, so the number of records is the
+    file size divided by the length of the first line.
+    """
+
+    from ..aqd import qaqc
+
+    first, reclen = head_line(filename)
+    last = utils.tail_lines(filename)[-1]
+    nrec = int(round(os.path.getsize(filename) / reclen))
+
+    return {'instrument': 'aqd' if filename.endswith('.sen') else 'wvs',
+            'start': pd.Timestamp(qaqc.line_time(first)),
+            'stop': pd.Timestamp(qaqc.line_time(last)),
+            'records': nrec,
+            'records_estimated': False,
+            'bursts': nrec if filename.endswith('.whd') else None}
+
+
+def inventory_exo(filename):
+    """
+    Inventory an EXO .csv file. EXO lines are not fixed-width, so the number
+    of records is estimated from the mean length of the first lines of data
+    (unless the file is small).
+    """
+
+    import csv
+    from .. import exo
+
+    encoding, nhdr = exo.sniff_exo(filename)
+    colnames, hdrbytes = head_line(filename, nhdr, encoding)
+    colnames = next(csv.reader([colnames]))
+    if not colnames[0].startswith(exo.DATA_HEADER):
+        raise ValueError('%s is not an EXO .csv file' % filename)
+    first, _ = head_line(filename, nhdr + 1, encoding)
+
+    def timestamp(line):
+        row = next(csv.reader([line]))
+        return pd.to_datetime(row[0].strip() + ' ' + row[1].strip(),
+                              format='%m/%d/%Y %H:%M:%S')
+
+    def is_data(line):
+        try:
+            timestamp(line)
+            return True
+        except (ValueError, IndexError, StopIteration):
+            return False
+
+    nrec, estimated = count_records(filename, hdrbytes, is_data, encoding)
+
+    return {'instrument': 'exo',
+            'start': timestamp(first),
+            'stop': timestamp(last_data_line(filename, is_data)),
+            'records': nrec,
+            'records_estimated': estimated,
+            'bursts': None}
+
+
+def inventory_hobo(filename):
+    """
+    Inventory an Onset HOBO .csv export. Data lines are numbered, so the
+    number of records is exact.
+    """
+
+    from .. import hobo
+
+    first, offset = first_data_line(filename, hobo._is_data)
+    with open(filename, 'rb') as f:
+        header = f.read(offset or 0)
+    # the column names include e.g. "Date Time, GMT-04:00"
+    if first is None or b'Date Time' not in header:
+        raise ValueError('%s is not a HOBO .csv file' % filename)
+    last = last_data_line(filename, hobo._is_data)
+
+    def row(line):
+        n, time = [x.strip().strip('"') for x in line.split(',')[:2]]
+        try:
+            time = utils.parse_datetime([time], '%m/%d/%y %I:%M:%S %p')[0]
+        except ValueError:
+            time = pd.Timestamp(time)
+        return int(n), time
+
+    (n0, start), (n1, stop) = row(first), row(last)
+
+    return {'instrument': 'hobo',
+            'start': start,
+            'stop': stop,
+            'records': n1 - n0 + 1,
+            'records_estimated': False,
+            'bursts': None}
+
+
+def inventory_eco(filename):
+    """
+    Inventory a WET Labs ECO (PAR or NTU) file. The number of records is
+    estimated as for EXO files.
+    """
+
+    from .. import eco
+
+    def is_data(line):
+        return eco._ECO_DATA.match(line) is not None
+
+    first, offset = first_data_line(filename, is_data)
+    if first is None:
+        raise ValueError('%s is not a WET Labs ECO file' % filename)
+
+    def timestamp(line):
+        date, time = line.split('\t')[:2]
+        time = date.strip() + ' ' + time.strip()
+        try:
+            return utils.parse_datetime([time], '%m/%d/%y %H:%M:%S')[0]
+        except ValueError:
+            return pd.Timestamp(time)
+
+    nrec, estimated = count_records(filename, offset, is_data)
+
+    return {'instrument': 'eco',
+            'start': timestamp(first),
+            'stop': timestamp(last_data_line(filename, is_data)),
+            'records': nrec,
+            'records_estimated': estimated,
+            'bursts': None}
+
+
+def inventory_csv(filename):
+    """
+    Inventory an EXO, HOBO, or ECO .csv file. EXO files are identified by
+    their line of column names; errors reading them are raised. Other files
+    are HOBO or ECO files if their data lines can be read as such, and are
+    otherwise not raw instrument files, for which None is returned.
+    """
+
+    from .. import exo
+
+    encoding, nhdr = exo.sniff_exo(filename)
+    try:
+        colnames, _ = head_line(filename, nhdr, encoding)
+    except ValueError:
+        colnames = ''
+    if colnames.lstrip('\ufeff"').startswith(exo.DATA_HEADER):
+        return inventory_exo(filename)
+
+    for reader in [inventory_hobo, inventory_eco]:
+        try:
+            return reader(filename)
+        except ValueError:
+            continue
+
+    return None
+
+
+def inventory_rsk(filename):
+    """Inventory an RBR .rsk file with a single aggregate query"""
+
+    import sqlite3
+    from ..rsk import rsk2cdf
+
+    conn = sqlite3.connect('file:%s?mode=ro' % filename, uri=True)
+    try:
+        continuous = rsk2cdf.sampling_mode(conn) == 'continuous'
+        start, stop, nrec = conn.execute(
+            'SELECT MIN(tstamp), MAX(tstamp), COUNT(*) FROM ' +
+            ('data' if continuous else 'burstdata')).fetchone()
+        if continuous:
+            spb = None
+        else:
+            try:
+                spb = conn.execute(
+                    'SELECT samplingcount FROM schedules').fetchone()[0]
+            except sqlite3.OperationalError:
+                spb = conn.execute(
+                    'SELECT samplingcount FROM wave').fetchone()[0]
+    finally:
+        conn.close()
+
+    return {'instrument': 'rsk',
+            'start': pd.to_datetime(start, unit='ms'),
+            'stop': pd.to_datetime(stop, unit='ms'),
+            'records': nrec,
+            'records_estimated': False,
+            'bursts': nrec // spb if spb else None}
+
+
+def inventory_iq(filename):
+    """Inventory a SonTek IQ .mat export from its sample times only"""
+
+    import numpy as np
+
+    if 'FlowData_SampleTime' not in utils.matvars(filename):
+        raise ValueError('%s is not a SonTek IQ .mat file' % filename)
+
+    t = np.ravel(utils.loadmat(
+        filename, variable_names=['FlowData_SampleTime'])[
+            'FlowData_SampleTime'])
+    # per email from SonTek
+    epoch = pd.Timestamp('2000-01-01')
+
+    return {'instrument': 'iq',
+            'start': epoch + pd.to_timedelta(t[0], unit='us'),
+            'stop': epoch + pd.to_timedelta(t[-1], unit='us'),
+            'records': len(t),
+            'records_estimated': False,
+            'bursts': None}
+
+
+# extension -> inventory function
+READERS = {'.sen': inventory_aqd,
+           '.whd': inventory_aqd,
+           '.csv': inventory_csv,
+           '.rsk': inventory_rsk,
+           '.mat': inventory_iq}
+
+
+def inventory_file(filename):
+    """
+    Inventory a single raw file
+
+    Returns
+    -------
+    dict
+        The file name, instrument type, start and stop times, number of
+        records (and whether it is an estimate) and bursts, and size in
+        bytes, or None for a .csv file from an unrecognized instrument
+    """
+
+    ext = os.path.splitext(filename)[1].lower()
+    if ext not in READERS:
+        raise ValueError('Unknown file type: %s' % filename)
+
+    info = READERS[ext](filename)
+    if info is None:
+        return None
+
+    row = {'file': filename, 'size': os.path.getsize(filename)}
+    row.update(info)
+
+    return row
+
+
+def inventory(directory='.', pattern='*'):
+    """
+    Inventory all recognized raw files in a directory.
+
+    Parameters
+    ----------
+    directory : string, optional
+        Directory to search. Default current directory
+    pattern : string, optional
+        Glob pattern of files to consider. Default '*'
+
+    Returns
+    -------
+    pandas.DataFrame
+        One row per file, with columns ``file``, ``instrument``, ``start``,
+        ``stop``, ``records``, ``records_estimated``, ``bursts``, ``size``
+        (bytes), and ``error``. Files that could not be read are listed with
+        only their size and the error. .csv files from other instruments are
+        left out.
+    """
+
+    rows = []
+    for f in sorted(glob.glob(os.path.join(directory, pattern))):
+        if os.path.splitext(f)[1].lower() not in READERS:
+            continue
+        try:
+            row = inventory_file(f)
+        except Exception as e:
+            row = {'file': f, 'size': os.path.getsize(f),
+                   'error': '%s: %s' % (type(e).__name__, e)}
+        if row is not None:
+            rows.append(row)
+
+    df = pd.DataFrame(rows, columns=COLUMNS)
+    for k in ['records', 'bursts']:
+        df[k] = df[k].astype('Int64')
+    df['records_estimated'] = df['records_estimated'].astype('boolean')
+
+    return df
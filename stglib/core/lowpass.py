@@ -0,0 +1,370 @@
+"""
+Tidal low-pass filters for long time series.
+
+The PL33 and Godin filters are applied as FIR convolutions and the
+Butterworth filter forward and backward (zero phase). Missing data are
+handled by normalized convolution for the FIR filters, so gaps do not
+spread, and by interpolating across gaps and restoring them afterward for
+the Butterworth filter.
+
+Files are filtered in chunks along time, each read with an overlap of the
+filter half-length, so memory use is bounded regardless of record length.
+For the FIR filters the result equals filtering the whole record at once.
+The Butterworth response never ends, and the overlap of five cutoff periods
+truncates it, so chunked Butterworth output matches the whole-record output
+only to within that truncated tail (a few parts in a million of the signal
+amplitude for the default cutoff).
+"""
+
+from __future__ import division, print_function
+import numpy as np
+
+METHODS = ['pl33', 'godin', 'butter']
+
+
+def pl33_weights(dt, T=33.):
+    """
+    Weights of the PL33 filter (Flagg, Beardsley, and Limeburner), as in
+    pl33tn.m
+
+    Parameters
+    ----------
+    dt : float
+        Sample interval, in hours
+    T : float, optional
+        Half-amplitude period, in hours. Default 33
+
+    Returns
+    -------
+    numpy.ndarray
+        Normalized weights, of length 4 * T / dt + 1
+    """
+
+    fq = dt / T
+    nw = int(round(2 * T / dt))
+    t = np.pi * np.arange(-nw, nw + 1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        wts = ((2 * np.sin(2 * fq * t) - np.sin(fq * t) -
+                np.sin(3 * fq * t)) / (fq * fq * t ** 3))
+    # limit at t = 0
+    wts[nw] = 2 * fq
+
+    return wts / wts.sum()
+
+
+def godin_weights(dt):
+    """
+    Weights of the Godin filter: successive running means of 24, 24, and 25
+    hours
+
+    Parameters
+    ----------
+    dt : float
+        Sample interval, in hours
+
+    Returns
+    -------
+    numpy.ndarray
+        Normalized weights
+    """
+
+    wts = np.ones(1)
+    for hours in [24, 24, 25]:
+        wts = np.convolve(wts, np.ones(int(round(hours / dt))))
+
+    return wts / wts.sum()
+
+
+def fir_filter(x, weights, min_weight=0.75):
+    """
+    Convolve `x` along its first axis with `weights`, ignoring NaNs.
+
+    Each output is normalized by the sum of the weights of the valid inputs
+    contributing to it, and is NaN where that sum is less than `min_weight`
+    (e.g. near the ends of the record and long gaps) or the input is NaN.
+
+    Parameters
+    ----------
+    x : numpy.ndarray
+        Data, with time along the first axis
+    weights : numpy.ndarray
+        Normalized filter weights, of odd length
+    min_weight : float, optional
+        Minimum fraction of the filter weight that must be available.
+        Default 0.75
+
+    Returns
+    -------
+    numpy.ndarray
+        Filtered data, the same shape as `x`
+    """
+
+    from scipy.signal import fftconvolve
+
+    x = np.asarray(x, dtype=float)
+    w = weights.reshape((-1,) + (1,) * (x.ndim - 1))
+    valid = np.isfinite(x)
+
+    num = fftconvolve(np.where(valid, x, 0), w, mode='same', axes=0)
+    if valid.all():
+        # the weight available only varies near the ends of the record
+        den = fftconvolve(np.ones((len(x),) + (1,) * (x.ndim - 1)), w,
+                          mode='same', axes=0)
+    else:
+        den = fftconvolve(valid.astype(float), w, mode='same', axes=0)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where((den >= min_weight) & valid, num / den, np.nan)
+
+
+def butter_filter(x, dt, cutoff=33., order=4, padlen=None):
+    """
+    Zero-phase Butterworth low-pass filter along the first axis of `x`.
+
+    NaNs are linearly interpolated over before filtering and restored
+    afterward.
+
+    Parameters
+    ----------
+    x : numpy.ndarray
+        Data, with time along the first axis
+    dt : float
+        Sample interval, in hours
+    cutoff : float, optional
+        Cutoff period, in hours. Default 33
+    order : int, optional
+        Filter order. Default 4
+    padlen : int, optional
+        Number of samples the ends are extended by, as in
+        :py:func:`scipy.signal.sosfiltfilt`. Default five cutoff periods
+
+    Returns
+    -------
+    numpy.ndarray
+        Filtered data, the same shape as `x`
+    """
+
+    from scipy.signal import butter, sosfiltfilt
+    from . import despike
+
+    x = np.asarray(x, dtype=float)
+    bad = ~np.isfinite(x)
+    sos = butter(order, 2 * dt / cutoff, output='sos')
+
+    # interpolate along time, which interp_nan does along the last axis
+    filled = np.moveaxis(despike.interp_nan(np.moveaxis(
+        np.where(bad, np.nan, x), 0, -1)), -1, 0)
+    ok = np.isfinite(filled).all(axis=0)
+    y = np.full(x.shape, np.nan)
+    if padlen is None:
+        padlen = halfwidth(dt, 'butter', cutoff)
+    padlen = min(padlen, len(x) - 1)
+    y[:, ok] = sosfiltfilt(sos, filled[:, ok], axis=0, padlen=padlen)
+    y[bad] = np.nan
+
+    return y
+
+
+def halfwidth(dt, method='pl33', cutoff=33.):
+    """Number of samples either side of each output that it depends on (for
+    the Butterworth filter, five cutoff periods, beyond which the response
+    has decayed to a few parts in a million but is not zero)"""
+
+    if method == 'pl33':
+        return len(pl33_weights(dt, cutoff)) // 2
+    elif method == 'godin':
+        return len(godin_weights(dt)) // 2
+    elif method == 'butter':
+        return int(np.ceil(5 * cutoff / dt))
+    else:
+        raise ValueError('Unknown filter %r; must be one of %s' %
+                         (method, METHODS))
+
+
+def filter_array(x, dt, method='pl33', cutoff=33., **kwargs):
+    """
+    Low-pass filter `x` along its first axis
+
+    Parameters
+    ----------
+    x : numpy.ndarray
+        Data, with time along the first axis
+    dt : float
+        Sample interval, in hours
+    method : {'pl33', 'godin', 'butter'}, optional
+        Filter. Default 'pl33'
+    cutoff : float, optional
+        Half-amplitude (PL33) or cutoff (Butterworth) period, in hours.
+        Ignored for the Godin filter. Default 33
+    **kwargs
+        Passed to :py:func:`fir_filter` or :py:func:`butter_filter`
+
+    Returns
+    -------
+    numpy.ndarray
+        Filtered data
+    """
+
+    if method == 'pl33':
+        return fir_filter(x, pl33_weights(dt, cutoff), **kwargs)
+    elif method == 'godin':
+        return fir_filter(x, godin_weights(dt), **kwargs)
+    elif method == 'butter':
+        return butter_filter(x, dt, cutoff, **kwargs)
+    else:
+        raise ValueError('Unknown filter %r; must be one of %s' %
+                         (method, METHODS))
+
+
+def filter_chunked(read, write, n, dt, method='pl33', cutoff=33.,
+                   chunksize=2**16, **kwargs):
+    """
+    Filter a time series too long to hold in memory, in chunks.
+
+    Each chunk is read with the filter half-width of extra samples on either
+    side. For the FIR filters the filtered chunks join seamlessly; for the
+    Butterworth filter they differ from filtering the whole record by the
+    part of its impulse response beyond the half-width (see
+    :py:func:`halfwidth`).
+
+    Parameters
+    ----------
+    read : callable
+        ``read(start, stop)`` returns samples start to stop (time first)
+    write : callable
+        ``write(start, stop, values)`` stores filtered samples start to stop
+    n : int
+        Length of the time series
+    dt, method, cutoff, **kwargs
+        See :py:func:`filter_array`
+    chunksize : int, optional
+        Number of output samples per chunk. Default 65536
+    """
+
+    m = halfwidth(dt, method, cutoff)
+
+    for i0 in range(0, n, chunksize):
+        i1 = min(i0 + chunksize, n)
+        lo = max(i0 - m, 0)
+        hi = min(i1 + m, n)
+        y = filter_array(read(lo, hi), dt, method, cutoff, **kwargs)
+        write(i0, i1, y[i0 - lo:i1 - lo])
+
+
+def filter_ds(ds, variables, method='pl33', cutoff=33., suffix='_lp',
+              **kwargs):
+    """
+    Add low-pass filtered copies of `variables` to a Dataset, named with
+    `suffix`. The Dataset must have a regularly sampled time dimension.
+    """
+
+    from . import utils
+
+    dt = _hours(np.median(np.diff(ds['time'].values)))
+
+    for var in variables:
+        da = ds[var].transpose('time', ...)
+        y = filter_array(da.values, dt, method, cutoff, **kwargs)
+        ds[var + suffix] = da.copy(data=y).transpose(*ds[var].dims)
+        ds[var + suffix].attrs['note'] = _note(method, cutoff)
+
+    return utils.insert_history(ds, 'Low-pass filtered %s. ' %
+                                ', '.join(variables))
+
+
+def filter_nc(filename, variables, method='pl33', cutoff=33., suffix='_lp',
+              chunksize=2**16, **kwargs):
+    """
+    Low-pass filter variables of an EPIC netCDF file in place, in bounded
+    memory.
+
+    The filtered variables are written to new variables named with `suffix`
+    (e.g. ``P_1_lp``), which are overwritten if they already exist.
+
+    Parameters
+    ----------
+    filename : string
+        netCDF filename, opened for appending
+    variables : list
+        Variables with a time dimension to filter, e.g. ``['P_1',
+        'water_depth', 'u_1205', 'v_1206']``
+    method, cutoff, **kwargs
+        See :py:func:`filter_array`
+    suffix : string, optional
+        Suffix of the filtered variable names. Default '_lp'
+    chunksize : int, optional
+        Number of time steps to filter at once. Default 65536
+    """
+
+    import netCDF4
+
+    with netCDF4.Dataset(filename, 'r+') as nc:
+        dt = _hours(np.nanmedian(np.diff(_epic_days(nc))) * 86400e9)
+
+        for var in variables:
+            v = nc[var]
+            axis = v.dimensions.index('time')
+
+            if var + suffix in nc.variables:
+                out = nc[var + suffix]
+            else:
+                out = nc.createVariable(var + suffix, 'f4', v.dimensions,
+                                        fill_value=1e35)
+            for k in v.ncattrs():
+                if k not in ['_FillValue', 'minimum', 'maximum']:
+                    out.setncattr(k, v.getncattr(k))
+            out.setncattr('note', _note(method, cutoff))
+
+            def index(start, stop):
+                idx = [slice(None)] * v.ndim
+                idx[axis] = slice(start, stop)
+                return tuple(idx)
+
+            def read(start, stop):
+                x = v[index(start, stop)]
+                x = np.ma.filled(np.ma.asarray(x, dtype=float), np.nan)
+                return np.moveaxis(x, axis, 0)
+
+            def write(start, stop, values):
+                out[index(start, stop)] = np.ma.masked_invalid(
+                    np.moveaxis(values, 0, axis))
+
+            filter_chunked(read, write, v.shape[axis], dt, method, cutoff,
+                           chunksize, **kwargs)
+            print('Filtered %s into %s' % (var, var + suffix))
+
+        histtext = 'Low-pass filtered %s. ' % ', '.join(variables)
+        if 'history' in nc.ncattrs():
+            histtext += nc.getncattr('history')
+        nc.setncattr('history', histtext)
+
+
+def _note(method, cutoff):
+    if method == 'godin':
+        return 'Low-pass filtered with a Godin (24-24-25 hour) filter'
+    elif method == 'pl33':
+        return 'Low-pass filtered with a PL%g filter' % cutoff
+    else:
+        return ('Low-pass filtered with a zero-phase Butterworth filter '
+                'with a %g hour cutoff' % cutoff)
+
+
+def _hours(dt):
+    """Hours from a timedelta64 or nanoseconds"""
+
+    return np.float64(dt / np.timedelta64(1, 'ns')
+                      if isinstance(dt, np.timedelta64) else dt) / 3600e9
+
+
+def _epic_days(nc):
+    """Times of an EPIC (time, time2) or CF file, in days"""
+
+    if 'time2' in nc.variables:
+        return np.ma.filled(nc['time'][:] + nc['time2'][:] / 86400000.,
+                            np.nan)
+
+    import netCDF4
+
+    t = nc['time']
+    return np.ma.filled(netCDF4.date2num(
+        netCDF4.num2date(t[:], t.units), 'days since 1970-01-01'), np.nan)
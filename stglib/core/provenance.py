@@ -0,0 +1,160 @@
+"""
+Provenance information for processed files.
+
+Library versions are looked up once per process and cached, the calling
+module is found from the frame directly instead of with ``inspect.stack()``,
+and input checksums are cached by path, size, and modification time, so
+recording provenance costs next to nothing even when many jobs run in the
+same process.
+"""
+
+from __future__ import division, print_function
+import os
+import sys
+import json
+import time
+import hashlib
+import platform
+import functools
+import contextlib
+from collections import OrderedDict
+
+# file (path, size, mtime) -> checksum
+_checksums = {}
+
+# stage name -> elapsed seconds, since the last add_timings() or
+# reset_timings()
+_timings = OrderedDict()
+
+
+@functools.lru_cache(maxsize=None)
+def versions():
+    """Python and library versions, e.g. 'Python 3.7.0, xarray 0.10.9, ...'"""
+
+    import numpy as np
+    import xarray as xr
+    import netCDF4
+
+    return ('Python ' + platform.python_version() + ', xarray ' +
+            xr.__version__ + ', NumPy ' + np.__version__ + ', netCDF4 ' +
+            netCDF4.__version__)
+
+
+def caller(depth=1):
+    """Filename of the module `depth` frames above the caller"""
+
+    return os.path.basename(sys._getframe(depth + 1).f_code.co_filename)
+
+
+def entry_point():
+    """The command being run, e.g. 'stglib aqdhdr2cdf' or 'runaqdhdr2cdf.py'"""
+
+    return os.path.basename(sys.argv[0]) if sys.argv and sys.argv[0] else ''
+
+
+def config_hash(metadata):
+    """SHA-1 of the metadata dict, independent of key order"""
+
+    text = json.dumps(metadata, sort_keys=True, default=str)
+
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def checksum(filename, blocksize=2**20):
+    """SHA-1 of a file, cached while its size and modification time are
+    unchanged"""
+
+    st = os.stat(filename)
+    key = (os.path.abspath(filename), st.st_size, st.st_mtime_ns)
+    if key not in _checksums:
+        h = hashlib.sha1()
+        with open(filename, 'rb') as f:
+            for block in iter(lambda: f.read(blocksize), b''):
+                h.update(block)
+        _checksums[key] = h.hexdigest()
+
+    return _checksums[key]
+
+
+def history(filename):
+    """History text for a file processed by module `filename`"""
+
+    return 'Processed using ' + filename + ' with ' + versions()
+
+
+def record(metadata, filename):
+    """
+    Provenance attributes for a Dataset created by module `filename` from
+    `metadata`
+
+    Returns
+    -------
+    dict
+        ``history``, ``stglib_entry_point``, and ``stglib_config_sha1``
+    """
+
+    return {'history': history(filename),
+            'stglib_entry_point': entry_point(),
+            'stglib_config_sha1': config_hash(
+                {k: metadata[k] for k in metadata if k != 'instmeta'})}
+
+
+def add_inputs(ds, filenames):
+    """
+    Record the input files (and their sizes) in the ``stglib_inputs``
+    attribute. If ``checksum_inputs`` is set in the metadata, their SHA-1
+    checksums are recorded too; this reads each file once.
+    """
+
+    if isinstance(filenames, str):
+        filenames = [filenames]
+
+    entries = []
+    for f in filenames:
+        entry = '%s (%d bytes' % (os.path.basename(f), os.path.getsize(f))
+        if ds.attrs.get('checksum_inputs'):
+            entry += ', sha1 ' + checksum(f)
+        entries.append(entry + ')')
+
+    ds.attrs['stglib_inputs'] = '; '.join(entries)
+
+    return ds
+
+
+@contextlib.contextmanager
+def timed(name):
+    """Time a processing stage; see :py:func:`add_timings`"""
+
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        _timings[name] = _timings.get(name, 0) + time.perf_counter() - t0
+
+
+def reset_timings():
+    """Discard stage timings not yet added to a Dataset (e.g. left by a job
+    that failed); called at the start of each job"""
+
+    _timings.clear()
+
+
+def add_timings(ds):
+    """
+    Append the stage timings recorded with :py:func:`timed` since the last
+    call to the ``stglib_timings`` attribute, which is carried through from
+    the raw to the processed files.
+    """
+
+    if not _timings:
+        return ds
+
+    text = '; '.join('%s %.3f s' % (k, _timings[k]) for k in _timings)
+    _timings.clear()
+
+    if ds.attrs.get('stglib_timings'):
+        ds.attrs['stglib_timings'] = ds.attrs['stglib_timings'] + '; ' + text
+    else:
+        ds.attrs['stglib_timings'] = text
+
+    return ds
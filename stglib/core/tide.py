@@ -0,0 +1,327 @@
+"""
+Harmonic (tidal) analysis.
+
+The standard semidiurnal, diurnal, and shallow-water constituents are fit
+by least squares to whole records, with all series (e.g. every bin of a
+velocity profile) solved at once against a single design matrix. Series
+with the same pattern of missing data share a solve. Nodal corrections
+(Schureman, 1958) are evaluated at the middle of the record and cached by
+deployment period, and constituents that the record is too short to
+resolve (by the Rayleigh criterion) are left out.
+
+Times are taken to be UTC, so phases are Greenwich phase lags.
+"""
+
+from __future__ import division, print_function
+import functools
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+# name: (Doodson numbers for mean lunar time, s, h, and p, and phase offset
+# in degrees), in order of precedence for the Rayleigh criterion
+CONSTITUENTS = {'M2': (2, 0, 0, 0, 0),
+                'S2': (2, 2, -2, 0, 0),
+                'N2': (2, -1, 0, 1, 0),
+                'K1': (1, 1, 0, 0, 90),
+                'O1': (1, -1, 0, 0, -90),
+                'K2': (2, 2, 0, 0, 0),
+                'P1': (1, 1, -2, 0, -90),
+                'Q1': (1, -2, 0, 1, -90),
+                'M4': (4, 0, 0, 0, 0),
+                'MS4': (4, 2, -2, 0, 0),
+                'M6': (6, 0, 0, 0, 0)}
+
+# rates of change of mean lunar time, and of the mean longitudes of the moon
+# (s), sun (h), and lunar perigee (p), in degrees per hour
+RATES = np.array([14.4920521, 0.5490165, 0.0410686, 0.0046418])
+
+
+def speed(name):
+    """Angular speed of constituent `name`, in degrees per hour"""
+
+    return np.dot(CONSTITUENTS[name][:4], RATES)
+
+
+def astronomical(time):
+    """
+    Mean lunar time, and the mean longitudes of the moon (s), sun (h), lunar
+    perigee (p), and lunar ascending node (N) at `time`, in degrees
+    (Meeus, 1998)
+    """
+
+    time = pd.Timestamp(time)
+    T = (time.to_julian_date() - 2451545.) / 36525.
+    s = 218.3164477 + 481267.88123421 * T
+    h = 280.46646 + 36000.76983 * T
+    p = 83.3532465 + 4069.0137287 * T
+    N = 125.04452 - 1934.136261 * T
+    hours = (time - time.normalize()) / pd.Timedelta(hours=1)
+    tau = 15 * hours + h - s
+
+    return np.mod([tau, s, h, p, N], 360)
+
+
+def _nodal_fu(name, N):
+    """Nodal amplitude factor f and phase correction u (degrees) of
+    constituent `name` for lunar node longitude `N` (degrees)"""
+
+    N = np.radians(N)
+
+    if name in ['M2', 'N2']:
+        return (1.0004 - 0.0373 * np.cos(N) + 0.0002 * np.cos(2 * N),
+                -2.14 * np.sin(N))
+    elif name == 'K1':
+        return (1.0060 + 0.1150 * np.cos(N) - 0.0088 * np.cos(2 * N) +
+                0.0006 * np.cos(3 * N),
+                -8.86 * np.sin(N) + 0.68 * np.sin(2 * N) -
+                0.07 * np.sin(3 * N))
+    elif name in ['O1', 'Q1']:
+        return (1.0089 + 0.1871 * np.cos(N) - 0.0147 * np.cos(2 * N) +
+                0.0014 * np.cos(3 * N),
+                10.80 * np.sin(N) - 1.34 * np.sin(2 * N) +
+                0.19 * np.sin(3 * N))
+    elif name == 'K2':
+        return (1.0241 + 0.2863 * np.cos(N) + 0.0083 * np.cos(2 * N) -
+                0.0015 * np.cos(3 * N),
+                -17.74 * np.sin(N) + 0.68 * np.sin(2 * N) -
+                0.04 * np.sin(3 * N))
+    elif name in ['M4', 'MS4', 'M6']:
+        # compounds of M2 (and S2, which has no nodal correction)
+        n = {'M4': 2, 'MS4': 1, 'M6': 3}[name]
+        f, u = _nodal_fu('M2', np.degrees(N))
+        return f ** n, n * u
+    else:
+        return 1., 0.
+
+
+def nodal(start, stop, names):
+    """
+    Nodal corrections for a deployment period.
+
+    The period is widened to whole days (UTC) and the corrections are cached
+    on those days, so that every variable and instrument of a deployment
+    shares them even if their records start and end at slightly different
+    times.
+
+    Parameters
+    ----------
+    start, stop : int
+        Start and end of the record, in nanoseconds since 1970-01-01
+    names : tuple
+        Constituent names
+
+    Returns
+    -------
+    ref : pandas.Timestamp
+        Reference time (the middle of the record, widened to whole days)
+    f : numpy.ndarray
+        Nodal amplitude factors
+    vu : numpy.ndarray
+        Equilibrium argument V0 + u at the reference time, in degrees
+
+    The arrays are read-only, since they are shared by every caller.
+    """
+
+    day = pd.Timedelta(days=1).value
+    return _nodal_days(int(start) // day, -(-int(stop) // day), tuple(names))
+
+
+@functools.lru_cache(maxsize=64)
+def _nodal_days(day0, day1, names):
+    """:py:func:`nodal` for days `day0` to `day1` since 1970-01-01"""
+
+    ref = pd.Timestamp((day0 + day1) * pd.Timedelta(days=1).value // 2)
+    args = astronomical(ref)
+    f = np.empty(len(names))
+    vu = np.empty(len(names))
+    for i, name in enumerate(names):
+        f[i], u = _nodal_fu(name, args[4])
+        v0 = np.dot(CONSTITUENTS[name][:4], args[:4]) + CONSTITUENTS[name][4]
+        vu[i] = np.mod(v0 + u, 360)
+    f.flags.writeable = False
+    vu.flags.writeable = False
+
+    return ref, f, vu
+
+
+def resolvable(duration, names=None, rayleigh=1.):
+    """
+    Constituents that can be resolved from a record of `duration` hours.
+
+    A constituent is kept if its frequency differs from those of all the
+    constituents already kept (in order of `names`) by at least `rayleigh`
+    cycles over the record.
+
+    Parameters
+    ----------
+    duration : float
+        Record length, in hours
+    names : list, optional
+        Candidate constituents, in order of precedence. Default all of
+        :py:data:`CONSTITUENTS`
+    rayleigh : float, optional
+        Rayleigh criterion. Default 1
+
+    Returns
+    -------
+    list
+        Names of the resolvable constituents
+    """
+
+    if names is None:
+        names = list(CONSTITUENTS)
+
+    keep = []
+    for name in names:
+        if all(abs(speed(name) - speed(k)) / 360 * duration >= rayleigh
+               for k in keep) and speed(name) / 360 * duration >= rayleigh:
+            keep.append(name)
+
+    return keep
+
+
+def design(hours, names):
+    """Design matrix of a mean and the cosine and sine of each constituent,
+    for times `hours` relative to the reference time"""
+
+    omega = np.radians([speed(k) for k in names])
+    phase = np.outer(hours, omega)
+
+    return np.hstack([np.ones((len(hours), 1)), np.cos(phase), np.sin(phase)])
+
+
+def harmonic_fit(time, x, names=None, rayleigh=1.):
+    """
+    Fit tidal constituents to one or many series at once.
+
+    Parameters
+    ----------
+    time : array_like
+        Sample times (datetime64, UTC)
+    x : numpy.ndarray
+        Data, with time along the first axis; any other axes (e.g. depth
+        bins) are fit independently, in a single least-squares solve for all
+        series with the same missing data
+    names : list, optional
+        Constituents to fit, before the Rayleigh criterion is applied.
+        Default all of :py:data:`CONSTITUENTS`
+    rayleigh : float, optional
+        Rayleigh criterion; see :py:func:`resolvable`. Default 1
+
+    Returns
+    -------
+    dict
+        ``names`` of the constituents fit, their ``amplitude`` and
+        Greenwich ``phase`` (degrees), each of shape (constituent, ...), and
+        the ``mean`` of each series
+    """
+
+    time = pd.DatetimeIndex(np.ravel(time))
+    x = np.asarray(x, dtype=float)
+    shape = x.shape[1:]
+    y = x.reshape(len(x), -1)
+
+    duration = (time[-1] - time[0]) / pd.Timedelta(hours=1)
+    names = resolvable(duration, names, rayleigh)
+    ref, f, vu = nodal(time[0].value, time[-1].value, tuple(names))
+    G = design((time - ref) / pd.Timedelta(hours=1), names)
+
+    coef = np.full((G.shape[1], y.shape[1]), np.nan)
+    valid = np.isfinite(y)
+    # one solve for each distinct pattern of missing data
+    patterns, which = np.unique(np.packbits(valid, axis=0), axis=1,
+                                return_inverse=True)
+    which = np.ravel(which)
+    for i in range(patterns.shape[1]):
+        cols = np.flatnonzero(which == i)
+        rows = valid[:, cols[0]]
+        if rows.sum() < G.shape[1]:
+            continue
+        coef[:, cols] = np.linalg.lstsq(G[rows], y[rows][:, cols],
+                                        rcond=None)[0]
+
+    K = len(names)
+    a, b = coef[1:K + 1], coef[K + 1:]
+    amplitude = np.hypot(a, b) / f[:, None]
+    phase = np.mod(np.degrees(np.arctan2(b, a)) + vu[:, None], 360)
+
+    return {'names': names,
+            'amplitude': amplitude.reshape((K,) + shape),
+            'phase': phase.reshape((K,) + shape),
+            'mean': coef[0].reshape(shape)}
+
+
+def predict(time, names, amplitude, phase, mean=0):
+    """
+    Tidal prediction from constituent amplitudes and Greenwich phases (e.g.
+    from :py:func:`harmonic_fit`), with time along the first axis of the
+    result
+    """
+
+    time = pd.DatetimeIndex(np.ravel(time))
+    amplitude = np.asarray(amplitude, dtype=float)
+    phase = np.asarray(phase, dtype=float)
+    shape = amplitude.shape[1:]
+    ref, f, vu = nodal(time[0].value, time[-1].value, tuple(names))
+    hours = (time - ref) / pd.Timedelta(hours=1)
+    omega = np.radians([speed(k) for k in names])
+
+    arg = (np.outer(hours, omega)[:, :, None] +
+           np.radians(vu[:, None] - phase.reshape(len(names), -1))[None])
+    tide = np.einsum('tkn,kn->tn', np.cos(arg),
+                     f[:, None] * amplitude.reshape(len(names), -1))
+
+    return tide.reshape((len(time),) + shape) + mean
+
+
+def harmonic_ds(ds, variables, names=None, rayleigh=1.):
+    """
+    Harmonic analysis of variables of a Dataset, e.g. ``['P_1ac']`` or
+    ``['u_1205', 'v_1206']``.
+
+    Parameters
+    ----------
+    ds : xarray.Dataset
+        Dataset with a datetime64 ``time`` (or, for EPIC files, ``time_cf``)
+    variables : list
+        Variables to analyse; all other dimensions (e.g. depth bins) are
+        analysed at once
+    names, rayleigh
+        See :py:func:`harmonic_fit`
+
+    Returns
+    -------
+    xarray.Dataset
+        ``<var>_amp``, ``<var>_phase``, and ``<var>_mean`` for each variable,
+        with a ``constituent`` dimension
+    """
+
+    if np.issubdtype(ds['time'].dtype, np.datetime64):
+        time = ds['time'].values
+    else:
+        time = ds['time_cf'].values
+
+    out = xr.Dataset(attrs={'history': 'Harmonic analysis of %s. ' %
+                            ', '.join(variables)})
+    for var in variables:
+        da = ds[var].transpose('time', ...)
+        fit = harmonic_fit(time, da.values, names, rayleigh)
+        dims = ('constituent',) + da.dims[1:]
+        coords = {k: da[k] for k in da.dims[1:] if k in da.coords}
+        coords['constituent'] = fit['names']
+        units = da.attrs.get('units', '')
+        out[var + '_amp'] = xr.DataArray(
+            fit['amplitude'], dims=dims, coords=coords,
+            attrs={'long_name': 'Amplitude of %s' % var, 'units': units})
+        out[var + '_phase'] = xr.DataArray(
+            fit['phase'], dims=dims, coords=coords,
+            attrs={'long_name': 'Greenwich phase lag of %s' % var,
+                   'units': 'degrees'})
+        out[var + '_mean'] = xr.DataArray(
+            fit['mean'], dims=da.dims[1:],
+            coords={k: v for k, v in coords.items() if k != 'constituent'},
+            attrs={'long_name': 'Mean of %s' % var, 'units': units})
+        print('Fit %d constituents to %s' % (len(fit['names']), var))
+
+    return out
@@ -1,14 +1,12 @@
 from __future__ import division, print_function
 import csv
 import os
+import re
+import contextlib
 import sys
-import inspect
-import platform
-import netCDF4
 import warnings
 import xarray as xr
 import numpy as np
-import scipy.io as spio
 
 
 def clip_ds(ds):
@@ -32,19 +30,11 @@ def clip_ds(ds):
         else:
             good_ens = ds.attrs['good_ens']
 
-        goods = []
-        for x in good_ens:
-            goods.append(np.arange(x[0], x[1]))
-        goods = np.hstack(goods)
-
-        ds = ds.isel(time=goods)
+        ds = isel_ranges(ds, good_ens)
 
         histtext = 'Data clipped using good_ens values of %s . ' % (
             str(good_ens))
-        if 'history' in ds.attrs:
-            ds.attrs['history'] = histtext + ds.attrs['history']
-        else:
-            ds.attrs['history'] = histtext
+        ds = insert_history(ds, histtext)
 
     elif 'good_dates' in ds.attrs:
         # clip by start/end dates that are not Deployment_date
@@ -83,6 +73,93 @@ def clip_ds(ds):
     return ds
 
 
+def isel_ranges(ds, ranges, dim='time'):
+    """
+    Select one or more [start, stop) index ranges along `dim`.
+
+    A single range is a slice, so it is a view that keeps lazily loaded (or
+    dask-backed) variables lazy. Several ranges are one outer slice from the
+    first start to the last stop followed by an integer index of the rows to
+    keep within it. Lazily loaded variables are not read by this, but the
+    rows are only gathered (and copied) when the data are loaded, and a
+    dask-backed variable becomes a gather of the rows in each chunk.
+    """
+
+    ranges = [(int(x[0]), int(x[1])) for x in ranges]
+
+    if len(ranges) == 1:
+        return ds.isel({dim: slice(*ranges[0])})
+
+    lo = min(r[0] for r in ranges)
+    hi = max(r[1] for r in ranges)
+    keep = np.concatenate([np.arange(a, b) for a, b in ranges]) - lo
+
+    return ds.isel({dim: slice(lo, hi)}).isel({dim: keep})
+
+
+def clip_window(metadata, timeshift=0):
+    """
+    Time window to clip to while reading raw files, if ``clip_on_read`` is
+    set in the metadata.
+
+    The window comes from ``good_dates`` or ``Deployment_date`` and
+    ``Recovery_date``, in the same order of precedence as
+    :py:func:`clip_ds`. ``good_ens`` refers to indices into the full record,
+    so it is not applied on read.
+
+    Parameters
+    ----------
+    metadata : dict
+        Instrument metadata
+    timeshift : float, optional
+        Seconds that will be added to the raw times after reading (e.g. half
+        the averaging interval); the window is moved back by this amount.
+        Default 0
+
+    Returns
+    -------
+    tuple or None
+        (start, stop) as pandas Timestamps, or None if data are not to be
+        clipped on read
+    """
+
+    import pandas as pd
+
+    if not metadata.get('clip_on_read') or 'good_ens' in metadata:
+        return None
+
+    if 'good_dates' in metadata:
+        start, stop = metadata['good_dates'][0], metadata['good_dates'][1]
+    elif 'Deployment_date' in metadata and 'Recovery_date' in metadata:
+        start, stop = metadata['Deployment_date'], metadata['Recovery_date']
+    else:
+        return None
+
+    shift = pd.Timedelta(seconds=timeshift)
+
+    return pd.Timestamp(start) - shift, pd.Timestamp(stop) - shift
+
+
+def insert_history(ds, histtext):
+    """Prepend `histtext` to the history attribute"""
+
+    if 'history' in ds.attrs:
+        ds.attrs['history'] = histtext + ds.attrs['history']
+    else:
+        ds.attrs['history'] = histtext
+
+    return ds
+
+
+def add_clip_history(ds, window):
+    """Record in the history that data were clipped to `window` on read"""
+
+    if window is None:
+        return ds
+
+    return insert_history(ds, 'Data clipped on read to %s - %s. ' % window)
+
+
 def add_min_max(ds):
     """
     Add minimum and maximum values to variables in NC or CDF files
@@ -331,20 +408,27 @@ def trim_wp_ratio(ds):
 
 
 def write_metadata(ds, metadata):
-    """Write out all metadata to CDF file"""
+    """
+    Write out all metadata to CDF file.
+
+    netCDF has no boolean attribute type, so boolean options (e.g.
+    ``clip_on_read: true``) are written as the integers 0 and 1.
+    """
 
     for k in metadata:
         # don't want to write out instmeta dict, call it separately
         if k != 'instmeta':
-            ds.attrs.update({k: metadata[k]})
+            v = metadata[k]
+            if isinstance(v, (bool, np.bool_)):
+                v = int(v)
+            ds.attrs.update({k: v})
 
-    f = os.path.basename(inspect.stack()[1][1])
+    from . import provenance
 
-    ds.attrs.update({
-        'history': 'Processed using ' + f + ' with Python ' +
-                   platform.python_version() + ', xarray ' + xr.__version__ +
-                   ', NumPy ' + np.__version__ + ', netCDF4 ' +
-                   netCDF4.__version__})
+    # once per Dataset: keep the hash of the config, not of instmeta written
+    # afterward
+    if 'stglib_config_sha1' not in ds.attrs:
+        ds.attrs.update(provenance.record(metadata, provenance.caller()))
 
     return ds
 
@@ -367,11 +451,11 @@ def rename_time(ds):
     # nc['time'][:] = timebak
     # nc.close()
 
-    ds.rename({'time': 'time_cf'}, inplace=True)
-    ds.rename({'epic_time': 'time'}, inplace=True)
-    ds.rename({'epic_time2': 'time2'}, inplace=True)
-    ds.set_coords(['time', 'time2'], inplace=True)
-    ds.swap_dims({'time_cf': 'time'}, inplace=True)
+    ds = ds.rename({'time': 'time_cf'})
+    ds = ds.rename({'epic_time': 'time'})
+    ds = ds.rename({'epic_time2': 'time2'})
+    ds = ds.set_coords(['time', 'time2'])
+    ds = ds.swap_dims({'time_cf': 'time'})
     # output int32 time_cf for THREDDS compatibility
     ds['time_cf'].encoding['dtype'] = 'i4'
 
@@ -414,17 +498,15 @@ def add_start_stop_time(ds):
 
 
 def add_lat_lon(ds, var):
-    """Add lat and lon dimensions"""
-
-    ds[var] = xr.concat([ds[var]], dim=ds['lon'])
-    ds[var] = xr.concat([ds[var]], dim=ds['lat'])
+    """
+    Add lat and lon dimensions
 
-    # Reorder so lat, lon are at the end.
-    dims = [d for d in ds[var].dims if (d != 'lon') and (d != 'lat')]
-    dims.extend(['lat', 'lon'])
-    dims = tuple(dims)
+    The length-1 lat and lon axes are appended as views of the existing
+    data, so no copy of the variable is made.
+    """
 
-    ds[var] = ds[var].transpose(*dims)
+    ndim = ds[var].ndim
+    ds[var] = ds[var].expand_dims(['lat', 'lon'], axis=[ndim, ndim + 1])
 
     return ds
 
@@ -541,7 +623,723 @@ def str2num(s):
         return s
 
 
-def loadmat(filename):
+def tail_lines(filename, blocksize=4096):
+    """
+    Return the last complete lines of a text file, reading only its end.
+
+    Reads `blocksize` bytes from the end of the file (more if needed to get
+    at least one complete line) and returns them split into lines, without
+    line terminators. Trailing blank lines are dropped.
+    """
+
+    with open(filename, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        while True:
+            start = max(size - blocksize, 0)
+            f.seek(start)
+            lines = f.read().splitlines()
+            while lines and not lines[-1].strip():
+                lines.pop()
+            if start > 0:
+                # the first line is probably incomplete
+                lines = lines[1:]
+            if lines or start == 0:
+                break
+            blocksize *= 2
+
+    return [l.decode('utf-8', errors='replace') for l in lines]
+
+
+def count_footer(filename, is_data, blocksize=4096):
+    """
+    Count the non-data lines at the end of a text file.
+
+    Parameters
+    ----------
+    filename : string
+        The filename
+    is_data : callable
+        Function of a line (str) returning True if it is a data line
+    blocksize : int, optional
+        Number of bytes to read from the end of the file at a time.
+        Default 4096
+
+    Returns
+    -------
+    int
+        Number of lines following the last data line. Blank lines are not
+        counted.
+    """
+
+    with open(filename, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+
+    while True:
+        lines = tail_lines(filename, blocksize)
+        n = 0
+        for line in reversed(lines):
+            if is_data(line):
+                return n
+            n += bool(line.strip('\r'))
+        if blocksize >= size:
+            raise ValueError('No data lines found in %s' % filename)
+        blocksize *= 4
+
+
+def count_lines(filename, chunksize=2**22):
+    """
+    Count the non-blank lines in a file, without decoding or splitting
+    them. Lines that are empty or only a carriage return are blank, as
+    they are to :py:func:`pandas.read_csv`.
+    """
+
+    n = 0
+    # a newline (or carriage return and newline) right after another newline
+    # ends a blank line; the start of the file counts as a newline
+    blank = re.compile(b'(?<=\n)\r?\n')
+    prev = b'\n'
+    last = b''
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunksize), b''):
+            buf = prev + chunk
+            n += chunk.count(b'\n')
+            # a blank line is counted in the chunk holding its newline
+            n -= sum(1 for m in blank.finditer(buf) if m.end() > len(prev))
+            prev = buf[-2:]
+            last = chunk
+
+    # a final line without a terminator is still a line
+    if last and not last.endswith(b'\n') and last.splitlines()[-1].strip(
+            b'\r'):
+        n += 1
+
+    return n
+
+
+def count_rows(filename, skiprows=None, skipfooter=0):
+    """
+    Number of rows :py:func:`pandas.read_csv` will parse from a file after
+    skipping `skiprows` lines (an int or a list of line numbers) and
+    `skipfooter` non-blank lines at the end, to pass as ``nrows`` to the C
+    parser. Blank lines are not rows.
+    """
+
+    if skiprows is None:
+        skiprows = []
+    elif isinstance(skiprows, (int, np.integer)):
+        skiprows = range(skiprows)
+    elif callable(skiprows):
+        raise TypeError('skiprows must be a number of lines or a list of '
+                        'line numbers, not a function')
+    skiprows = set(skiprows)
+
+    skipped = 0
+    if skiprows:
+        with open(filename, 'rb') as f:
+            for i, line in enumerate(f):
+                if i > max(skiprows):
+                    break
+                if i in skiprows and line.strip(b'\r\n'):
+                    skipped += 1
+
+    return count_lines(filename) - skipped - skipfooter
+
+
+def record_length(filename):
+    """
+    Length in bytes (including the terminator) of the lines of a
+    fixed-width text file, or None if the lines are not all the same length.
+    Only the first and last lines are checked.
+    """
+
+    size = os.path.getsize(filename)
+    with open(filename, 'rb') as f:
+        reclen = len(f.readline())
+        if not reclen or size % reclen:
+            return None
+        # the last record must start right after a line terminator
+        f.seek(size - reclen - 1 if size > reclen else 0)
+        if size > reclen and f.read(1) != b'\n':
+            return None
+
+    return reclen
+
+
+def time_range(filename, parse_time, start=None, stop=None, offset=0):
+    """
+    Find the lines of a text file sorted by time that fall within a window,
+    by bisection on byte offsets, so only a few dozen lines are parsed.
+
+    Parameters
+    ----------
+    filename : string
+        The filename
+    parse_time : callable
+        Function of a line (bytes) returning its time. Lines it cannot parse
+        (e.g. a footer) are treated as being after the window
+    start, stop : datetime-like, optional
+        Inclusive window. Default None, the start or end of the file
+    offset : int, optional
+        Byte offset of the first data line, i.e. the length of any header.
+        Default 0
+
+    Returns
+    -------
+    lo, hi : int
+        Byte offsets of the first line in the window and of the first line
+        after it
+    """
+
+    size = os.path.getsize(filename)
+
+    with open(filename, 'rb') as f:
+        def line_at(pos):
+            """The first line starting at or after pos"""
+            f.seek(pos - 1 if pos > offset else pos)
+            if pos > offset:
+                f.readline()
+            return f.tell(), f.readline()
+
+        def after(line, t, strict):
+            try:
+                lt = parse_time(line)
+            except ValueError:
+                return True
+            return lt > t if strict else lt >= t
+
+        def first(t, strict):
+            lo, hi = offset, size
+            while lo < hi:
+                mid = (lo + hi) // 2
+                pos, line = line_at(mid)
+                if pos >= hi or not line.strip() or after(line, t, strict):
+                    hi = mid
+                else:
+                    lo = pos + len(line)
+            return line_at(lo)[0]
+
+        lo = offset if start is None else first(start, False)
+        hi = size if stop is None else first(stop, True)
+
+    return lo, max(lo, hi)
+
+
+def line_number(filename, pos, reclen=None):
+    """Number of lines before byte offset `pos`, which must be the start of a
+    line; computed from `reclen` for fixed-width files"""
+
+    if reclen:
+        return pos // reclen
+
+    n = 0
+    with open(filename, 'rb') as f:
+        while pos > 0:
+            chunk = f.read(min(pos, 2**22))
+            n += chunk.count(b'\n')
+            pos -= len(chunk)
+
+    return n
+
+
+def line_range(filename, parse_time, start=None, stop=None):
+    """
+    Line numbers of the lines of a headerless text file sorted by time that
+    fall within a window; see :py:func:`time_range`.
+
+    Returns
+    -------
+    first, nrows : int
+        Index of the first line in the window and the number of lines in it
+    """
+
+    lo, hi = time_range(filename, parse_time, start, stop)
+    reclen = record_length(filename)
+    first = line_number(filename, lo, reclen)
+
+    if reclen:
+        return first, (hi - lo) // reclen
+
+    with open(filename, 'rb') as f:
+        f.seek(lo)
+        data = f.read(hi - lo)
+
+    return first, data.count(b'\n') + (1 if data and data[-1:] != b'\n'
+                                        else 0)
+
+
+def read_lines(filename, first, nrows):
+    """
+    Return lines ``first`` to ``first + nrows`` of a text file as a file-like
+    object for ``pd.read_csv``. Fixed-width files are read directly from the
+    right offset; otherwise the preceding lines are skipped without being
+    parsed.
+    """
+
+    import io
+    import itertools
+
+    reclen = record_length(filename)
+
+    with open(filename, 'rb') as f:
+        if reclen:
+            f.seek(first * reclen)
+            return io.BytesIO(f.read(nrows * reclen))
+        return io.BytesIO(b''.join(itertools.islice(f, first, first + nrows)))
+
+
+def read_files(reader, filenames, max_workers=None, **kwargs):
+    """
+    Read several files concurrently with a pool of threads.
+
+    Parameters
+    ----------
+    reader : callable
+        Function taking a filename (and `kwargs`) and returning a Dataset
+    filenames : list
+        Files to read
+    max_workers : int, optional
+        Number of threads. Default is chosen by concurrent.futures
+
+    Returns
+    -------
+    list
+        The Datasets, in the order of `filenames`
+    """
+
+    import functools
+    import concurrent.futures
+
+    if len(filenames) == 1:
+        return [reader(filenames[0], **kwargs)]
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers) as ex:
+        return list(ex.map(functools.partial(reader, **kwargs), filenames))
+
+
+def merge_time(datasets, dim='time'):
+    """
+    Merge Datasets covering consecutive (possibly overlapping) time periods
+    into one.
+
+    Segments are ordered by their first time. Where a segment overlaps the
+    ones before it, its samples up to the end of the data already merged are
+    dropped, so earlier files take precedence and the result has no
+    duplicate times. Segments are trimmed with slices (views) and
+    concatenated once. Each segment must already be sorted by time.
+    Variables without `dim` and attributes are taken from the first segment.
+
+    Returns
+    -------
+    xarray.Dataset
+    """
+
+    datasets = sorted([ds for ds in datasets if ds.sizes[dim]],
+                      key=lambda ds: ds[dim].values[0])
+    if not datasets:
+        raise ValueError('No data to read; if clip_on_read is set, check '
+                         'that the deployment window (good_dates, or '
+                         'Deployment_date and Recovery_date) overlaps the '
+                         'data')
+
+    pieces = []
+    end = None
+    ndropped = 0
+    for ds in datasets:
+        if end is not None:
+            i = np.searchsorted(ds[dim].values, end, side='right')
+            ndropped += i
+            ds = ds.isel({dim: slice(i, None)})
+        if ds.sizes[dim]:
+            pieces.append(ds)
+            end = ds[dim].values[-1]
+
+    if ndropped:
+        print('Dropped %d %s values overlapping earlier files' %
+              (ndropped, dim))
+
+    if len(pieces) == 1:
+        return pieces[0]
+
+    return xr.concat(pieces, dim=dim, data_vars='minimal', coords='minimal',
+                     compat='override', combine_attrs='override')
+
+
+def time_order(time):
+    """
+    Index that sorts `time` and removes duplicate times, keeping the first
+    occurrence of each, or None if `time` is already strictly increasing.
+
+    The common case (already sorted) costs a single vectorized comparison;
+    sorting is only done if some time steps are negative.
+    """
+
+    time = np.asarray(time)
+    dt = np.diff(time)
+    if np.issubdtype(dt.dtype, np.timedelta64):
+        dt = dt.astype(np.int64)
+
+    if (dt > 0).all():
+        return None
+
+    if (dt >= 0).all():
+        order = np.arange(len(time))
+    else:
+        order = np.argsort(time, kind='stable')
+    ts = time[order]
+    keep = np.concatenate([[True], ts[1:] != ts[:-1]])
+
+    return order[keep]
+
+
+def normalize_time(ds, dim='time', freq=None):
+    """
+    Sort a Dataset by time and remove duplicate times, optionally placing it
+    on a regular time grid.
+
+    Parameters
+    ----------
+    ds : xarray.Dataset
+        The Dataset
+    dim : string, optional
+        Time dimension. Default 'time'
+    freq : float, pandas.Timedelta, or True, optional
+        Spacing (float seconds or Timedelta) of a regular grid from the first
+        time to the last. Each time is moved to the nearest grid point, and
+        grid points without data (e.g. missing ensembles or bursts) are
+        filled with NaN (NaT for times); integer variables are converted to
+        floating point to hold the NaNs if there are any such grid points.
+        True uses the median time step. Default None (or False), which keeps
+        the original times
+
+    Returns
+    -------
+    xarray.Dataset
+        The Dataset, unchanged (not copied) if it was already strictly
+        increasing and no grid was requested. Sorting, de-duplication and
+        gridding are done with one indexing operation per variable.
+    """
+
+    import pandas as pd
+
+    t = ds[dim].values
+    order = time_order(t)
+    if order is not None:
+        print('Sorted %s and removed %d duplicate times' % (
+            dim, len(t) - len(order)))
+
+    if freq is None or freq is False or len(t) < 2:
+        return ds if order is None else ds.isel({dim: order})
+
+    if order is None:
+        order = np.arange(len(t))
+    ts = t[order].astype('datetime64[ns]').astype(np.int64)
+    if freq is True:
+        step = np.median(np.diff(ts))
+    elif isinstance(freq, (int, float)):
+        step = freq * 1e9
+    else:
+        step = pd.Timedelta(freq).value
+
+    # grid position of each time; the first time at a grid point wins
+    k = np.rint((ts - ts[0]) / step).astype(np.int64)
+    indexer = np.full(k[-1] + 1, -1, dtype=np.int64)
+    indexer[k[::-1]] = order[::-1]
+    grid = (ts[0] + np.arange(len(indexer)) * step).astype(
+        np.int64).astype('datetime64[ns]')
+
+    nmissing = (indexer < 0).sum()
+    if nmissing:
+        print('Filled %d missing %s values' % (nmissing, dim))
+
+    return _take(ds, dim, indexer, grid)
+
+
+def _take(ds, dim, indexer, values):
+    """
+    Index every variable along `dim` with `indexer`, where -1 means missing,
+    and set the `dim` coordinate to `values`.
+
+    Missing values are NaN, NaT, or None, so if any are missing, integer
+    and boolean variables become floating point (float32 for types of up to
+    16 bits, float64 otherwise) and other types become object.
+    """
+
+    missing = indexer < 0
+    safe = np.where(missing, 0, indexer)
+
+    out = ds.drop_vars([k for k in ds.variables if dim in ds[k].dims])
+    out[dim] = (dim, values, ds[dim].attrs)
+    out[dim].encoding = ds[dim].encoding
+
+    for k in ds.variables:
+        v = ds.variables[k]
+        if dim not in v.dims or k == dim:
+            continue
+        axis = v.get_axis_num(dim)
+        vals = np.take(v.values, safe, axis=axis)
+        if missing.any():
+            if vals.dtype.kind in 'mM':
+                fill = np.array('NaT', dtype=vals.dtype)
+            elif vals.dtype.kind in 'iubfc':
+                vals = vals.astype(np.result_type(vals.dtype, np.float32))
+                fill = np.nan
+            else:
+                vals = vals.astype(object)
+                fill = None
+            idx = [slice(None)] * vals.ndim
+            idx[axis] = missing
+            vals[tuple(idx)] = fill
+        var = xr.Variable(v.dims, vals, v.attrs)
+        var.encoding = v.encoding
+        if k in ds.coords:
+            out.coords[k] = var
+        else:
+            out[k] = var
+
+    return out
+
+
+def burst_index(time, spb=None, gap=None):
+    """
+    Assign each sample of a burst-sampled record to a burst and a position
+    within the burst.
+
+    Bursts start where the time step exceeds `gap`. Positions within a
+    burst are computed from the time since the start of the burst, so
+    dropped samples leave a hole instead of shifting the rest of the burst.
+    If `spb` is given, bursts are further split every `spb` samples, for
+    records logged without a gap between bursts.
+
+    Parameters
+    ----------
+    time : array_like
+        Sample times, datetime64
+    spb : int, optional
+        Samples per burst. Default None, which uses the longest burst
+    gap : numpy.timedelta64 or float, optional
+        Minimum time step (timedelta64, or float seconds) between bursts.
+        Default is twice the median time step
+
+    Returns
+    -------
+    burst, sample : numpy.ndarray
+        Burst number and position within the burst of each sample
+    burst_time : numpy.ndarray
+        Time of the middle of each burst (datetime64)
+    nsamp : int
+        Number of samples per burst
+    """
+
+    t = np.asarray(time).astype('datetime64[ns]').astype(np.int64)
+    dt = np.diff(t)
+    if gap is None:
+        gap = 2 * np.median(dt)
+    elif isinstance(gap, np.timedelta64):
+        gap = gap / np.timedelta64(1, 'ns')
+    else:
+        gap = gap * 1e9
+
+    isnew = np.concatenate([[True], dt > gap])
+    # sample interval within bursts
+    step = np.median(dt[~isnew[1:]]) if (~isnew[1:]).any() else 1
+    starts = np.flatnonzero(isnew)
+    gapburst = np.cumsum(isnew) - 1
+    sample = np.rint((t - t[starts][gapburst]) / step).astype(np.int64)
+
+    if spb:
+        # split continuous records every spb samples
+        key = gapburst * (sample.max() // spb + 1) + sample // spb
+        _, burst = np.unique(key, return_inverse=True)
+        burststart = (t[starts][gapburst] + (sample // spb) * spb * step)
+        sample = sample % spb
+        nsamp = int(spb)
+    else:
+        burst = gapburst
+        burststart = t[starts][gapburst]
+        nsamp = int(sample.max()) + 1
+
+    nburst = int(burst.max()) + 1
+    first = np.zeros(nburst, dtype=np.int64)
+    first[burst[::-1]] = burststart[::-1]
+    burst_time = (first + int(nsamp / 2) * step).astype(
+        np.int64).astype('datetime64[ns]')
+
+    return burst, sample, burst_time, nsamp
+
+
+def to_bursts(time, data, spb=None, gap=None):
+    """
+    Reshape continuous (time) data into (time, sample) bursts.
+
+    Short or incomplete bursts are padded with NaN; arrays that fill every
+    (burst, sample) slot keep their dtype. See :py:func:`burst_index` for
+    how bursts are found.
+
+    Parameters
+    ----------
+    time : array_like
+        Sample times, datetime64
+    data : dict
+        Variable name -> 1-D array the same length as `time`
+    spb, gap
+        Passed to :py:func:`burst_index`
+
+    Returns
+    -------
+    xarray.Dataset
+        Dataset with time (middle of each burst) and sample dimensions
+    """
+
+    order = time_order(time)
+    if order is not None:
+        time = np.asarray(time)[order]
+        data = {k: np.asarray(data[k])[order] for k in data}
+
+    burst, sample, burst_time, nsamp = burst_index(time, spb=spb, gap=gap)
+    shape = (len(burst_time), nsamp)
+    complete = len(burst) == shape[0] * shape[1] and len(
+        np.unique(burst * nsamp + sample)) == len(burst)
+
+    ds = xr.Dataset({'time': ('time', burst_time),
+                     'sample': ('sample', np.arange(nsamp))})
+    for k in data:
+        values = np.asarray(data[k])
+        if complete:
+            out = np.empty(shape, dtype=values.dtype)
+        else:
+            out = np.full(shape, np.nan,
+                          dtype=np.result_type(values.dtype, np.float32))
+        out[burst, sample] = values
+        ds[k] = (['time', 'sample'], out)
+
+    return ds
+
+
+def to_windows(time, data, nsamp, step=None):
+    """
+    Reshape regularly sampled (time) data into (time, sample) windows of
+    `nsamp` samples starting every `step` samples, which overlap if `step` is
+    less than `nsamp`.
+
+    The windows are read-only strided views of the input arrays, so no data
+    are copied whatever the overlap. Samples after the last complete window
+    are dropped.
+
+    Parameters
+    ----------
+    time : array_like
+        Sample times
+    data : dict
+        Variable name -> array whose first axis is the same length as `time`
+    nsamp : int
+        Samples per window
+    step : int, optional
+        Samples between the starts of consecutive windows. Default `nsamp`
+
+    Returns
+    -------
+    xarray.Dataset
+        Dataset with time (start of each window) and sample dimensions
+    """
+
+    from numpy.lib.stride_tricks import as_strided
+
+    if step is None:
+        step = nsamp
+    time = np.asarray(time)
+    nwin = max((len(time) - nsamp) // step + 1, 0)
+
+    ds = xr.Dataset({'time': ('time', time[:nwin * step:step]),
+                     'sample': ('sample', np.arange(nsamp))})
+    for k in data:
+        values = np.asarray(data[k])
+        s = values.strides
+        ds[k] = (['time', 'sample'] + ['dim_%d' % n for n in
+                                       range(2, values.ndim + 1)],
+                 as_strided(values, shape=(nwin, nsamp) + values.shape[1:],
+                            strides=(step * s[0],) + s, writeable=False))
+
+    return ds
+
+
+def parse_datetime(values, format):
+    """
+    Parse an array of timestamp strings with a strftime `format`.
+
+    Zero-padded, fixed-width timestamps (every string the same length,
+    directives limited to %Y %y %m %d %H %I %M %S %p) are parsed by
+    assembling integer components from the character codes, which is much
+    faster than strptime. Anything else falls back to
+    :py:func:`pandas.to_datetime` with the given `format`, which raises
+    ValueError if the values do not match it.
+
+    Returns
+    -------
+    pandas.DatetimeIndex
+    """
+
+    import pandas as pd
+
+    widths = {'Y': 4, 'y': 2, 'm': 2, 'd': 2, 'H': 2, 'I': 2, 'M': 2,
+              'S': 2, 'p': 2}
+    fields = {}
+    literals = []
+    pos = 0
+    i = 0
+    try:
+        while i < len(format):
+            if format[i] == '%':
+                fields[format[i+1]] = (pos, pos + widths[format[i+1]])
+                pos += widths[format[i+1]]
+                i += 2
+            else:
+                literals.append((pos, format[i]))
+                pos += 1
+                i += 1
+
+        b = np.asarray(values).astype('S')
+        if (b.dtype.itemsize != pos or
+                (np.char.str_len(b) != pos).any()):
+            raise ValueError
+    except (KeyError, IndexError, ValueError, UnicodeEncodeError):
+        return pd.DatetimeIndex(pd.to_datetime(values, format=format))
+
+    c = b.view(np.uint8).reshape((-1, pos))
+
+    def number(field):
+        d = c[:, slice(*fields[field])].astype(np.int64) - ord('0')
+        if ((d < 0) | (d > 9)).any():
+            raise ValueError
+        return d @ 10 ** np.arange(d.shape[1] - 1, -1, -1)
+
+    try:
+        if not all((c[:, p] == ord(l)).all() for p, l in literals):
+            raise ValueError
+        comps = {k: number(f) for f, k in
+                 zip('mdHMS', ['month', 'day', 'hour', 'minute', 'second'])
+                 if f in fields}
+        if 'Y' in fields:
+            comps['year'] = number('Y')
+        elif 'y' in fields:
+            # same pivot as strptime
+            yy = number('y')
+            comps['year'] = np.where(yy < 69, 2000 + yy, 1900 + yy)
+        if 'I' in fields:
+            # lower-case the AM/PM characters
+            p = c[:, slice(*fields['p'])] | 0x20
+            am = (p[:, 0] == ord('a')) & (p[:, 1] == ord('m'))
+            pm = (p[:, 0] == ord('p')) & (p[:, 1] == ord('m'))
+            if not (am | pm).all():
+                raise ValueError
+            comps['hour'] = number('I') % 12 + 12 * pm
+        return pd.DatetimeIndex(pd.to_datetime(comps))
+    except (KeyError, ValueError):
+        return pd.DatetimeIndex(pd.to_datetime(values, format=format))
+
+
+def loadmat(filename, variable_names=None):
     '''
     this function should be called instead of direct spio.loadmat
     as it cures the problem of not properly recovering python dictionaries
@@ -549,16 +1347,156 @@ def loadmat(filename):
     which are still mat-objects
 
     from: `StackOverflow <https://stackoverflow.com/q/7008608>`_
+
+    Only the variables in `variable_names` are read, if given. MATLAB v7.3
+    (HDF5) files are read with h5py; see :py:func:`open_mat` to read only
+    slices of their arrays.
     '''
-    data = spio.loadmat(filename, struct_as_record=False, squeeze_me=True)
+
+    if is_mat73(filename):
+        h5py = _import_h5py()
+        with h5py.File(filename, 'r') as f:
+            return _loadmat73(f, h5py, variable_names, lazy=False)
+
+    import scipy.io as spio
+
+    data = spio.loadmat(filename, struct_as_record=False, squeeze_me=True,
+                        variable_names=variable_names)
     return _check_keys(data)
 
 
+@contextlib.contextmanager
+def open_mat(filename, variable_names=None):
+    '''
+    Like :py:func:`loadmat`, as a context manager. The numeric arrays of
+    MATLAB v7.3 files are lazy :py:class:`MatH5Array` objects that read from
+    disk when sliced, and can only be read until the file is closed on
+    exit.
+    '''
+
+    if not is_mat73(filename):
+        yield loadmat(filename, variable_names)
+        return
+
+    h5py = _import_h5py()
+    with h5py.File(filename, 'r') as f:
+        yield _loadmat73(f, h5py, variable_names, lazy=True)
+
+
+def matvars(filename):
+    '''
+    Return a dict of variable name -> shape for a .mat file without reading
+    the data
+    '''
+
+    if is_mat73(filename):
+        h5py = _import_h5py()
+        with h5py.File(filename, 'r') as f:
+            return {k: tuple(reversed(getattr(f[k], 'shape', ()))) for k in f
+                    if not k.startswith('#')}
+
+    import scipy.io as spio
+
+    return {name: shape for name, shape, _ in spio.whosmat(filename)}
+
+
+def is_mat73(filename):
+    '''Check the file header for a MATLAB v7.3 (HDF5-based) .mat file'''
+
+    with open(filename, 'rb') as f:
+        return f.read(19) == b'MATLAB 7.3 MAT-file'
+
+
+class MatH5Array(object):
+    '''
+    Lazy view of a numeric array in a MATLAB v7.3 file. Presents the array in
+    MATLAB (column-major) order with singleton dimensions squeezed, like
+    ``scipy.io.loadmat(..., squeeze_me=True)``, and only reads the requested
+    slice from disk.
+    '''
+
+    def __init__(self, dset):
+        self.dset = dset
+        # HDF5 axes that survive squeezing
+        self._axes = [i for i, n in enumerate(dset.shape) if n != 1]
+        self.shape = tuple(dset.shape[i] for i in reversed(self._axes))
+        self.ndim = len(self.shape)
+        self.dtype = dset.dtype
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        key = key + (slice(None),) * (self.ndim - len(key))
+
+        h5key = [0] * self.dset.ndim
+        for axis, k in zip(reversed(self._axes), key):
+            h5key[axis] = k
+
+        # HDF5 stores MATLAB arrays transposed
+        return np.transpose(self.dset[tuple(h5key)])
+
+    def __array__(self, dtype=None, copy=None):
+        return np.asarray(self[()], dtype=dtype)
+
+
+def _import_h5py():
+    try:
+        import h5py
+    except ImportError:
+        raise ImportError('h5py is required to read MATLAB v7.3 .mat files')
+
+    return h5py
+
+
+def _loadmat73(f, h5py, variable_names=None, lazy=False):
+    '''
+    Read an open MATLAB v7.3 file into a dict, converting structs to nested
+    dicts and char arrays to strings. Numeric arrays are wrapped in
+    :py:class:`MatH5Array` if `lazy`, which needs the file to stay open.
+    '''
+
+    if variable_names is None:
+        variable_names = [k for k in f if not k.startswith('#')]
+
+    return {k: _h5todict(f[k], h5py, lazy) for k in variable_names if k in f}
+
+
+def _h5todict(obj, h5py, lazy=False):
+    '''
+    Recursively convert an HDF5 group (MATLAB struct) to a dict; small
+    datasets are read eagerly, numeric arrays lazily if `lazy`
+    '''
+
+    if isinstance(obj, h5py.Group):
+        return {k: _h5todict(obj[k], h5py, lazy) for k in obj}
+
+    mclass = obj.attrs.get('MATLAB_class', b'')
+    if isinstance(mclass, bytes):
+        mclass = mclass.decode()
+
+    if obj.attrs.get('MATLAB_empty', 0):
+        return np.array([])
+    elif mclass == 'char':
+        return ''.join(chr(c) for c in np.ravel(obj[()]))
+    elif obj.size == 1:
+        return np.ravel(obj[()])[0].item()
+    elif lazy:
+        return MatH5Array(obj)
+    else:
+        return np.asarray(MatH5Array(obj))
+
+
 def _check_keys(dic):
     '''
     checks if entries in dictionary are mat-objects. If yes
     todict is called to change them to nested dictionaries
     '''
+
+    import scipy.io as spio
+
     for key in dic:
         if isinstance(dic[key], spio.matlab.mio5_params.mat_struct):
             dic[key] = _todict(dic[key])
@@ -569,6 +1507,9 @@ def _todict(matobj):
     '''
     A recursive function which constructs from matobjects nested dictionaries
     '''
+
+    import scipy.io as spio
+
     dic = {}
     for strg in matobj._fieldnames:
         elem = matobj.__dict__[strg]
@@ -0,0 +1,271 @@
+"""
+Long-running processing worker.
+
+Jobs are YAML files placed in a queue directory. Each job names the
+instrument, the processing stage, and the arguments the corresponding run
+script would take, e.g.::
+
+    instrument: aqd
+    stage: hdr2cdf
+    gatts: glob_att1076a.txt
+    config: aqd_config.yaml
+    directory: /data/1076/aqd   # optional; paths are relative to this
+
+    instrument: aqd
+    stage: cdf2nc
+    cdfname: 10761Baqd-raw.cdf
+    atmpres: atmpres.cdf        # optional
+
+The worker claims jobs by moving them into ``running/``, executes them on a
+pool of processes that have numpy, xarray, and netCDF4 already imported, and
+moves them to ``done/`` or ``failed/`` alongside a ``.result.yaml`` report
+and a ``.log`` file of everything the job printed.
+"""
+
+from __future__ import division, print_function
+import os
+import sys
+import time
+import glob
+import socket
+import traceback
+import contextlib
+import concurrent.futures
+import yaml
+from . import cmd
+
+JOB_EXTENSIONS = ('.yaml', '.yml')
+
+# job keys passed as positional arguments, in order, to the run command
+POSITIONAL_ARGS = ['gatts', 'config', 'cdfname', 'ncname']
+
+# job keys passed as --key value optional arguments to the run command
+OPTIONAL_ARGS = ['atmpres']
+
+
+def job_command(job):
+    """
+    Return the name of the :py:mod:`stglib.core.cmd` command and its argument
+    list for a job dict
+    """
+
+    name = job['instrument'] + job['stage']
+    if name not in cmd.commands or name == 'serve':
+        raise ValueError('Unknown instrument/stage combination: %s/%s' %
+                         (job['instrument'], job['stage']))
+
+    args = [str(job[k]) for k in POSITIONAL_ARGS if k in job]
+    for k in OPTIONAL_ARGS:
+        if job.get(k):
+            args.extend(['--' + k, str(job[k])])
+
+    return name, args
+
+
+def submit(queue_dir, **job):
+    """
+    Add a job to the queue. The job file is written under a temporary name
+    and renamed so a running worker never sees a partial file.
+
+    Returns
+    -------
+    str
+        Path to the queued job file
+    """
+
+    name, _ = job_command(job)  # validate before queueing
+
+    stamp = '%d-%d' % (time.time() * 1e6, os.getpid())
+    jobfile = os.path.join(queue_dir, '%s-%s.yaml' % (name, stamp))
+    with open(jobfile + '.tmp', 'w') as f:
+        yaml.safe_dump(job, f, default_flow_style=False)
+    os.rename(jobfile + '.tmp', jobfile)
+
+    return jobfile
+
+
+def run_job(jobfile, cwd):
+    """
+    Execute a single job file. Runs in a worker process; never raises, so
+    that failures are reported rather than killing the pool.
+    """
+
+    result = {'job': os.path.basename(jobfile),
+              'host': socket.gethostname(),
+              'pid': os.getpid(),
+              'started': time.strftime('%Y-%m-%dT%H:%M:%S')}
+    t0 = time.time()
+    logfile = os.path.splitext(jobfile)[0] + '.log'
+
+    with open(logfile, 'w') as log, contextlib.redirect_stdout(log):
+        try:
+            with open(jobfile) as f:
+                job = yaml.safe_load(f)
+            name, args = job_command(job)
+            result['command'] = ' '.join(['stglib', name] + args)
+
+            os.chdir(job.get('directory', cwd))
+            ds = cmd.commands[name](args)
+
+            result['status'] = 'done'
+            if ds is not None and 'filename' in ds.attrs:
+                result['filename'] = str(ds.attrs['filename'])
+        except BaseException:
+            # SystemExit from argparse counts as a failure too
+            result['status'] = 'failed'
+            tb = traceback.format_exc()
+            result['error'] = tb.strip().splitlines()[-1]
+            print(tb)
+        finally:
+            os.chdir(cwd)
+
+    result['elapsed'] = round(time.time() - t0, 3)
+
+    return result
+
+
+def _warm_up():
+    """Pool initializer: import the heavy libraries once per process"""
+
+    import numpy  # noqa: F401
+    import pandas  # noqa: F401
+    import xarray  # noqa: F401
+    import netCDF4  # noqa: F401
+
+
+def _pending(queue_dir):
+    jobs = [f for f in glob.glob(os.path.join(queue_dir, '*'))
+            if f.endswith(JOB_EXTENSIONS)]
+
+    return sorted(jobs, key=os.path.getmtime)
+
+
+def _claim(jobfile, queue_dir):
+    """Move job into running/; returns None if another worker got it first"""
+
+    running = os.path.join(queue_dir, 'running', os.path.basename(jobfile))
+    try:
+        os.rename(jobfile, running)
+    except OSError:
+        return None
+
+    return running
+
+
+def _result(fut, jobfile):
+    """Result of a finished job, or a failure report if its worker process
+    died (BrokenProcessPool) or the job could not be run at all"""
+
+    try:
+        return fut.result()
+    except Exception as e:
+        return {'job': os.path.basename(jobfile),
+                'status': 'failed',
+                'error': '%s: %s' % (type(e).__name__, e)}
+
+
+def _report(result, jobfile, queue_dir):
+    dest = os.path.join(queue_dir, result['status'])
+    base = os.path.splitext(os.path.basename(jobfile))[0]
+
+    os.rename(jobfile, os.path.join(dest, os.path.basename(jobfile)))
+    logfile = os.path.splitext(jobfile)[0] + '.log'
+    if os.path.exists(logfile):
+        os.rename(logfile, os.path.join(dest, base + '.log'))
+    with open(os.path.join(dest, base + '.result.yaml'), 'w') as f:
+        yaml.safe_dump(result, f, default_flow_style=False)
+
+    if 'elapsed' in result:
+        print('%s %s (%.1f s)' % (result['status'], result['job'],
+                                  result['elapsed']))
+    else:
+        print('%s %s (%s)' % (result['status'], result['job'],
+                              result['error']))
+    sys.stdout.flush()
+
+
+def _pool(processes):
+    return concurrent.futures.ProcessPoolExecutor(max_workers=processes,
+                                                  initializer=_warm_up)
+
+
+def serve(queue_dir, processes=None, poll_interval=1., once=False):
+    """
+    Process jobs from a queue directory until interrupted.
+
+    If a worker process dies (e.g. it is killed or runs out of memory), the
+    jobs that were running are reported as failed and the pool is restarted.
+
+    Parameters
+    ----------
+    queue_dir : string
+        Directory in which job files are placed
+    processes : int, optional
+        Number of worker processes. Default is the number of CPUs
+    poll_interval : float, optional
+        Seconds between checks for new jobs. Default 1
+    once : bool, optional
+        Exit once the queue is empty instead of waiting for more jobs.
+        Default False
+
+    Returns
+    -------
+    list
+        The result dicts of all jobs processed, including those that finish
+        after an interrupt
+    """
+
+    from concurrent.futures.process import BrokenProcessPool
+
+    for d in ['running', 'done', 'failed']:
+        if not os.path.isdir(os.path.join(queue_dir, d)):
+            os.makedirs(os.path.join(queue_dir, d))
+
+    cwd = os.getcwd()
+    results = []
+    futures = {}
+
+    def collect(fut):
+        result = _result(fut, futures[fut])
+        _report(result, futures.pop(fut), queue_dir)
+        results.append(result)
+
+    print('Serving jobs from %s' % os.path.abspath(queue_dir))
+
+    pool = _pool(processes)
+    try:
+        while True:
+            pending = _pending(queue_dir)
+            for jobfile in pending:
+                claimed = _claim(jobfile, queue_dir)
+                if claimed is None:
+                    continue
+                try:
+                    fut = pool.submit(run_job, claimed, cwd)
+                except BrokenProcessPool:
+                    pool.shutdown(wait=False)
+                    pool = _pool(processes)
+                    fut = pool.submit(run_job, claimed, cwd)
+                futures[fut] = claimed
+
+            broken = False
+            for fut in [f for f in futures if f.done()]:
+                broken |= isinstance(fut.exception(), BrokenProcessPool)
+                collect(fut)
+            if broken:
+                print('A worker process died; restarting the pool')
+                pool.shutdown(wait=False)
+                pool = _pool(processes)
+
+            if once and not futures and not pending:
+                break
+
+            time.sleep(poll_interval)
+    except KeyboardInterrupt:
+        print('Interrupted; waiting for running jobs to finish')
+        for fut in concurrent.futures.as_completed(list(futures)):
+            collect(fut)
+    finally:
+        pool.shutdown()
+
+    return results
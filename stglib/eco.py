@@ -1,9 +1,14 @@
 from __future__ import division, print_function
+import re
 import pandas as pd
 import xarray as xr
+from .core import utils
 
+# data lines begin with the date, e.g. 07/20/17
+_ECO_DATA = re.compile(r'^\s*\d{1,2}/\d{1,2}/\d{2,4}\s')
 
-def read_par(filnam, spb=False, skiprows=None, skipfooter=0):
+
+def read_par(filnam, spb=False, skiprows=None, skipfooter=None):
     """Read data from a WET Labs PAR csv file into an xarray
     Dataset.
 
@@ -11,12 +16,15 @@ def read_par(filnam, spb=False, skiprows=None, skipfooter=0):
     ----------
     filnam : string
         The filename
-    spb: bool, optional
-        Samples per burst if using burst sampling
-    skiprows : int, optional
-        How many header rows to skip. Default None
-    skipfooter : into, optional
-        How many footer rows to skip. Default 0
+    spb: int or bool, optional
+        Samples per burst if using burst sampling, or True to detect bursts
+        from gaps in the timestamps
+    skiprows : int or list, optional
+        How many header rows to skip, or the line numbers (0-indexed) to
+        skip. Default None
+    skipfooter : int, optional
+        How many (non-blank) footer rows to skip. Default None, which
+        detects the footer from the end of the file
 
     Returns
     -------
@@ -31,7 +39,7 @@ def read_par(filnam, spb=False, skiprows=None, skipfooter=0):
     return eco_pd_to_xr(par, spb=spb)
 
 
-def read_ntu(filnam, spb=False, skiprows=None, skipfooter=0):
+def read_ntu(filnam, spb=False, skiprows=None, skipfooter=None):
     """Read data from a WET Labs NTU csv file into an xarray
     Dataset.
 
@@ -39,12 +47,15 @@ def read_ntu(filnam, spb=False, skiprows=None, skipfooter=0):
     ----------
     filnam : string
         The filename
-    spb: bool, optional
-        Samples per burst if using burst sampling
-    skiprows : int, optional
-        How many header rows to skip. Default None
-    skipfooter : into, optional
-        How many footer rows to skip. Default 0
+    spb: int or bool, optional
+        Samples per burst if using burst sampling, or True to detect bursts
+        from gaps in the timestamps
+    skiprows : int or list, optional
+        How many header rows to skip, or the line numbers (0-indexed) to
+        skip. Default None
+    skipfooter : int, optional
+        How many (non-blank) footer rows to skip. Default None, which
+        detects the footer from the end of the file
 
     Returns
     -------
@@ -59,34 +70,57 @@ def read_ntu(filnam, spb=False, skiprows=None, skipfooter=0):
     return eco_pd_to_xr(ntu, spb=spb)
 
 
-def read_eco_csv(filnam, names, skiprows=None, skipfooter=0):
+def read_eco_csv(filnam, names, skiprows=None, skipfooter=None,
+                 date_format='%m/%d/%y %H:%M:%S'):
+    """Read a tab-separated WET Labs ECO file into a pandas DataFrame with a
+    date_time column.
+
+    The footer is found by scanning the end of the file, so the fast C parser
+    can be used with a row count instead of the python parser's skipfooter.
+    Timestamps are parsed with the explicit `date_format`, falling back to
+    format inference if they do not match it.
+    """
+
+    if skipfooter is None:
+        skipfooter = utils.count_footer(
+            filnam, lambda line: _ECO_DATA.match(line) is not None)
+
+    nrows = utils.count_rows(filnam, skiprows, skipfooter)
+
+    df = pd.read_csv(filnam,
+                     sep='\t',
+                     names=names,
+                     dtype={'date': str, 'time': str},
+                     engine='c',
+                     skiprows=skiprows,
+                     nrows=nrows)
+
+    datetime = df.pop('date').str.strip() + ' ' + df.pop('time').str.strip()
+    try:
+        date_time = utils.parse_datetime(datetime, date_format)
+    except ValueError:
+        date_time = pd.to_datetime(datetime)
+    df.insert(0, 'date_time', date_time)
 
-    return pd.read_csv(filnam,
-                      sep='\t',
-                      names=names,
-                      parse_dates=[['date', 'time']],
-                      infer_datetime_format=True,
-                      engine='python',
-                      skiprows=skiprows,
-                      skipfooter=skipfooter)
+    return df
 
 
 def eco_pd_to_xr(df, spb=False):
+    """Convert an ECO DataFrame to an xarray Dataset, optionally reshaped
+    into (time, sample) bursts. `spb` may be the number of samples per burst,
+    or True to find bursts from gaps in the timestamps only. Incomplete
+    bursts are padded with NaN; the time of each burst is its middle
+    sample."""
 
     if spb:
-        # get middle time
-        times = df['date_time'].values.reshape((-1, spb))[:, int(spb/2)]
-        counts = df['counts'].values.reshape((-1, spb))
-        sample = range(spb)
-
-        ds = xr.Dataset({'time': ('time', times),
-                         'counts': (['time', 'sample'], counts),
-                         'sample': ('sample', sample)})
+        ds = utils.to_bursts(df['date_time'].values,
+                             {'counts': df['counts'].values},
+                             spb=None if spb is True else spb)
     else:
         times = df['date_time']
         counts = df['counts']
 
-        ds = xr.Dataset({'time': ('time', times),
-                         'counts': ('time', counts)})
+        ds = utils.normalize_time(xr.Dataset({'time': ('time', times),
+                                              'counts': ('time', counts)}))
 
     return ds
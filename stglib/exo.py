@@ -1,21 +1,48 @@
 from __future__ import division, print_function
+import io
+import csv
+import codecs
+import datetime
 import pandas as pd
 import xarray as xr
 import numpy as np
-from .core import utils
+from .core import utils, provenance
 
-def read_exo(filnam, skiprows=25, encoding='utf-8'):
+# first column of the line of column names that precedes the data
+DATA_HEADER = 'Date (MM/DD/YYYY)'
+
+# raw variables not carried through to the processed file
+UNUSED = ['Press_psi_a', 'Site_Name', 'Fault_Code', 'Time_(Fract._Sec)']
+
+
+def read_exo(filnam, skiprows=None, encoding=None, spb=False, window=None):
     """Read data from a YSI EXO multiparameter sonde .csv file into an xarray
     Dataset.
 
+    The file is opened once: the encoding and the number of header lines
+    are sniffed from the beginning of the file, and the header and data are
+    then parsed from the same file handle.
+
     Parameters
     ----------
-    filnam : string
-        The filename
+    filnam : string or list
+        The filename, or a list of filenames (e.g. several exports from one
+        deployment), which are read concurrently and merged by time.
+        Overlapping samples are taken from the earliest file
     skiprows : int, optional
-        How many header rows to skip. Default 25
+        How many header rows to skip. Default None, which finds the line of
+        column names starting with 'Date (MM/DD/YYYY)'
     encoding : string, optional
-        File encoding. Default 'utf-8'
+        File encoding. Default None, which detects UTF-16 from its byte order
+        mark, otherwise tries utf-8 and falls back to mac-roman (old versions
+        of Mac Excel)
+    spb : int or bool, optional
+        Samples per burst if the sonde was run in burst mode, or True to
+        detect bursts from gaps in the timestamps. Default False
+    window : tuple, optional
+        (start, stop) times. If given, only the data lines within this
+        window are parsed; they are found by bisection on the (sorted)
+        timestamps. Default None
 
     Returns
     -------
@@ -23,20 +50,22 @@ def read_exo(filnam, skiprows=25, encoding='utf-8'):
         An xarray Dataset of the EXO data
     """
 
-    exo = pd.read_csv(filnam,
-                        skiprows=skiprows,
-                        infer_datetime_format=True,
-                        parse_dates=[['Date (MM/DD/YYYY)', 'Time (HH:MM:SS)']],
-                        encoding=encoding)
-    exo.rename(columns={'Date (MM/DD/YYYY)_Time (HH:MM:SS)': 'time'},
-               inplace=True)
-    exo.set_index('time', inplace=True)
-    exo.rename(columns=lambda x: x.replace(' ', '_'), inplace=True)
-    exo.rename(columns=lambda x: x.replace('/', '_per_'), inplace=True)
-    exo['Press_dbar'] = exo['Press_psi_a'] * 0.689476
-
-    exo = xr.Dataset(exo)
-    hdr = read_exo_header(filnam, encoding=encoding)
+    if isinstance(filnam, str):
+        filnam = [filnam]
+
+    # serial numbers are taken from the first file
+    hdr, exo = zip(*utils.read_files(_read_exo_file, filnam,
+                                     skiprows=skiprows, encoding=encoding,
+                                     window=window))
+    hdr = hdr[0]
+    exo = utils.merge_time(exo)
+
+    if spb:
+        exo = utils.to_bursts(
+            exo['time'].values,
+            {k: exo[k].values for k in exo.data_vars
+             if np.issubdtype(exo[k].dtype, np.number)},
+            spb=None if spb is True else spb)
     exo.attrs['serial_number'] = hdr['serial_number']
 
     # Apply sensor serial numbers to each sensor
@@ -61,6 +90,175 @@ def read_exo(filnam, skiprows=25, encoding='utf-8'):
 
     return exo
 
+
+def _read_exo_file(filnam, skiprows=None, encoding=None, window=None):
+    """Read the header and data of a single EXO .csv file"""
+
+    sniffed, nhdr = sniff_exo(filnam)
+    if encoding is None:
+        encoding = sniffed
+    if skiprows is None:
+        skiprows = nhdr
+
+    with open(filnam, encoding=encoding, newline='') as f:
+        hdr = parse_exo_header([f.readline() for _ in range(skiprows)])
+        if window is not None:
+            data = _window_lines(filnam, skiprows, window, encoding)
+        else:
+            data = f
+        exo = pd.read_csv(data,
+                          encoding=encoding,
+                          dtype={'Date (MM/DD/YYYY)': str,
+                                 'Time (HH:MM:SS)': str},
+                          engine='c')
+
+    datetime = (exo.pop('Date (MM/DD/YYYY)').str.strip() + ' ' +
+                exo.pop('Time (HH:MM:SS)').str.strip())
+    try:
+        exo['time'] = utils.parse_datetime(datetime, '%m/%d/%Y %H:%M:%S')
+    except ValueError:
+        exo['time'] = pd.to_datetime(datetime)
+    exo.set_index('time', inplace=True)
+    exo.rename(columns=lambda x: x.replace(' ', '_'), inplace=True)
+    exo.rename(columns=lambda x: x.replace('/', '_per_'), inplace=True)
+    exo['Press_dbar'] = exo['Press_psi_a'] * 0.689476
+
+    return hdr, utils.normalize_time(xr.Dataset(exo))
+
+
+def _line_time(line):
+    """Time of a line (bytes or str) of EXO data"""
+
+    if isinstance(line, bytes):
+        line = line.decode('latin-1')
+    date, time = line.replace('"', '').split(',')[:2]
+
+    return datetime.datetime.strptime(date.strip() + ' ' + time.strip(),
+                                      '%m/%d/%Y %H:%M:%S')
+
+
+def _ascii_compatible(encoding):
+    """Whether line ends, digits, and separators are single ASCII bytes in
+    `encoding` (ignoring any byte order mark), so lines can be found and
+    their times parsed without decoding"""
+
+    sample = '\r\n"0123456789/:,. '
+
+    return sample.encode(encoding).endswith(sample.encode('ascii'))
+
+
+def _window_lines(filnam, skiprows, window, encoding='utf-8'):
+    """
+    The line of column names and the data lines within `window` of an EXO
+    .csv file with `skiprows` header lines, as a file-like object
+
+    For ASCII-compatible encodings (UTF-8, Mac Roman, etc.) the window is
+    found by bisection on the raw bytes. Other encodings (e.g. UTF-16) are
+    decoded and each line's time checked.
+    """
+
+    if not _ascii_compatible(encoding):
+        with open(filnam, encoding=encoding, newline='') as f:
+            for _ in range(skiprows):
+                f.readline()
+            lines = [f.readline()]
+            try:
+                for line in f:
+                    if line.strip() and (window[0] <= _line_time(line) <=
+                                         window[1]):
+                        lines.append(line)
+            except ValueError:
+                print('Could not clip %s on read' % filnam)
+                f.seek(0)
+                lines = f.readlines()[skiprows:]
+
+        return io.StringIO(''.join(lines))
+
+    with open(filnam, 'rb') as f:
+        for _ in range(skiprows):
+            f.readline()
+        names = f.readline()
+        offset = f.tell()
+        first = f.readline()
+        try:
+            _line_time(first)
+        except ValueError:
+            # unexpected time format; read everything
+            print('Could not clip %s on read' % filnam)
+            f.seek(offset)
+            return io.BytesIO(names + f.read())
+
+        lo, hi = utils.time_range(filnam, _line_time, *window, offset=offset)
+        f.seek(lo)
+
+        return io.BytesIO(names + f.read(hi - lo))
+
+
+def sniff_exo(filnam, nbytes=65536):
+    """
+    Guess the encoding and number of header lines of an EXO .csv file from
+    its first `nbytes` bytes
+
+    Returns
+    -------
+    encoding : string
+        'utf-16' if the file starts with a UTF-16 byte order mark,
+        'utf-8-sig' or 'utf-8' if the prefix decodes as UTF-8, otherwise
+        'mac-roman'
+    nhdr : int
+        Number of lines before the line of column names, or 25 if it was not
+        found
+    """
+
+    with open(filnam, 'rb') as f:
+        prefix = f.read(nbytes)
+
+    if prefix.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        encoding = 'utf-16'
+        text = codecs.getincrementaldecoder(encoding)().decode(prefix)
+    else:
+        try:
+            # the prefix may end part way through a multi-byte character
+            text = codecs.getincrementaldecoder('utf-8')().decode(prefix)
+            encoding = 'utf-8-sig' if prefix.startswith(codecs.BOM_UTF8) \
+                else 'utf-8'
+        except UnicodeDecodeError:
+            text = prefix.decode('mac-roman')
+            encoding = 'mac-roman'
+
+    for n, line in enumerate(text.lstrip('\ufeff').splitlines()):
+        if line.lstrip('"').startswith(DATA_HEADER):
+            return encoding, n
+
+    return encoding, 25
+
+
+def parse_exo_header(lines):
+    """Parse serial numbers and data columns from the lines of an EXO .csv
+    header"""
+
+    header = {}
+    for row in csv.reader(lines):
+        if not row:
+            continue
+        if row[0] == 'Sonde ID':
+            header['serial_number'] = row[1].split(' ')[1]
+        elif row[0] in ['fDOM',
+                        'Total Algae BGA-PE',
+                        'Wiped CT',
+                        'Unknown CT',
+                        'Optical DO',
+                        'Turbidity',
+                        'pH',
+                        'Depth Non-Vented 0-10m'] and row[0] not in header:
+            header[row[0]] = {}
+            header[row[0]]['sensor_serial_number'] = row[1]
+            header[row[0]]['data_columns'] = [int(x) for x in
+                                              row[3].split(';')]
+
+    return header
+
+
 def csv_to_cdf(metadata):
     """
     Process EXO .csv file to a raw .cdf file
@@ -68,21 +266,39 @@ def csv_to_cdf(metadata):
 
     basefile = metadata['basefile']
 
-    try:
-        ds = read_exo(basefile + '.csv', skiprows=metadata['skiprows'])
-    except UnicodeDecodeError:
-        # try reading as Mac OS Western for old versions of Mac Excel
-        ds = read_exo(basefile + '.csv',
-                      skiprows=metadata['skiprows'],
-                      encoding='mac-roman')
+    if isinstance(basefile, str):
+        filnam = basefile + '.csv'
+    else:
+        filnam = [f + '.csv' for f in basefile]
+
+    provenance.reset_timings()
+
+    window = utils.clip_window(metadata)
+
+    with provenance.timed('exocsv2cdf read'):
+        ds = read_exo(filnam, skiprows=metadata.get('skiprows'),
+                      encoding=metadata.get('encoding'),
+                      spb=metadata.get('spb', False),
+                      window=window)
+
+    # from the config, where true is still distinct from 1 second
+    fill_gaps = metadata.get('fill_gaps')
 
     # write out metadata first, then deal exclusively with xarray attrs
     ds = utils.write_metadata(ds, metadata)
 
     del metadata
 
+    ds = utils.add_clip_history(ds, window)
+
+    ds = utils.normalize_time(ds, freq=fill_gaps)
+
+    ds = provenance.add_inputs(ds, filnam)
+
     ds = utils.create_epic_time(ds)
 
+    ds = provenance.add_timings(ds)
+
     # configure file
     cdf_filename = ds.attrs['filename'] + '-raw.cdf'
 
@@ -97,8 +313,8 @@ def cdf_to_nc(cdf_filename, atmpres=False):
     Load a "raw" .cdf file and generate a processed .nc file
     """
 
-    # Load raw .cdf data
-    ds = xr.open_dataset(cdf_filename, autoclose=True)
+    # Load raw .cdf data, without the variables that are not carried through
+    ds = xr.open_dataset(cdf_filename, drop_variables=UNUSED)
 
     # Clip data to in/out water times or via good_ens
     ds = utils.clip_ds(ds)
@@ -107,11 +323,6 @@ def cdf_to_nc(cdf_filename, atmpres=False):
 
     # ds = ds_add_attrs(ds)
 
-    ds = ds.drop(['Press_psi_a',
-                  'Site_Name',
-                  'Fault_Code',
-                  'Time_(Fract._Sec)'])
-
     if atmpres:
         print("Atmospherically correcting data")
 
@@ -293,28 +504,14 @@ def ds_add_lat_lon(ds):
 
     return ds
 
-def read_exo_header(filnam, encoding='utf-8'):
-    hdr = pd.read_csv(filnam, skiprows=None, encoding=encoding)
-    hdr = pd.DataFrame(hdr.iloc[:,0:4])
-    # print(hdr)
-    header = {}
-    header['serial_number'] = (
-        hdr[hdr['KOR Export File'] == 'Sonde ID'].values[0][1].split(' ')[1])
-    for var in ['fDOM',
-                'Total Algae BGA-PE',
-                'Wiped CT',
-                'Unknown CT',
-                'Optical DO',
-                'Turbidity',
-                'pH',
-                'Depth Non-Vented 0-10m']:
-        vals = hdr[hdr['KOR Export File'] == var]
-        if not vals.empty:
-            header[var] = {}
-            header[var]['sensor_serial_number'] = vals.values[0][1]
-            header[var]['data_columns'] = [int(x) for x in vals.values[0][3].split(';')]
+def read_exo_header(filnam, encoding=None):
+    """Read the serial numbers and data columns from the header of an EXO
+    .csv file, without reading the data"""
+
+    sniffed, nhdr = sniff_exo(filnam)
+    with open(filnam, encoding=encoding or sniffed, newline='') as f:
+        return parse_exo_header([f.readline() for _ in range(nhdr)])
 
-    return header
 
 def exo_qaqc(ds):
     """
@@ -325,7 +522,7 @@ def exo_qaqc(ds):
     for var in ['C_51', 'SpC_48', 'S_41', 'Turb']:
         if var + '_min_diff' in ds.attrs:
             print('Trimming using minimum %s diff of %f' % (var, ds.attrs[var + '_min_diff']))
-            ds[var][np.ediff1d(ds[var], to_begin=0) < ds.attrs[var + '_min_diff']] = np.nan
+            ds[var].values[_ediff(ds[var]) < ds.attrs[var + '_min_diff']] = np.nan
 
             notetxt = 'Values filled where data decreases by more than %f units in a single time step. ' % ds.attrs[var + '_min_diff']
 
@@ -335,7 +532,7 @@ def exo_qaqc(ds):
                 ds[var].attrs.update({'note': notetxt})
         if var + '_max_diff' in ds.attrs:
             print('Trimming using maximum %s diff of %f' % (var, ds.attrs[var + '_max_diff']))
-            ds[var][np.ediff1d(ds[var], to_begin=0) > ds.attrs[var + '_max_diff']] = np.nan
+            ds[var].values[_ediff(ds[var]) > ds.attrs[var + '_max_diff']] = np.nan
 
             notetxt = 'Values filled where data increases by more than %f units in a single time step. ' % ds.attrs[var + '_max_diff']
 
@@ -345,3 +542,10 @@ def exo_qaqc(ds):
                 ds[var].attrs.update({'note': notetxt})
 
     return ds
+
+
+def _ediff(da):
+    """Differences between consecutive values, in time order, of continuous
+    or (time, sample) burst data"""
+
+    return np.ediff1d(da.values.ravel(), to_begin=0).reshape(da.shape)
@@ -1,34 +1,82 @@
 from __future__ import division, print_function
 import pandas as pd
 import xarray as xr
+from .core import utils
 
 
-def read_hobo(filnam, skiprows=1, skipfooter=0):
+def read_hobo(filnam, skiprows=1, skipfooter=None,
+              datetime_format='%m/%d/%y %I:%M:%S %p', spb=False):
     """Read data from an Onset HOBO pressure sensor .csv file into an xarray
     Dataset.
 
     Parameters
     ----------
-    filnam : string
-        The filename
-    skiprows : int, optional
-        How many header rows to skip. Default 1
+    filnam : string or list
+        The filename, or a list of filenames (e.g. exports from before and
+        after a relaunch), which are read concurrently and merged by time.
+        Overlapping samples are taken from the earliest file
+    skiprows : int or list, optional
+        How many header rows to skip, or the line numbers (0-indexed) to
+        skip. Default 1
     skipfooter : int, optional
-        How many footer rows to skip. Default 0
+        How many (non-blank) footer rows to skip. Default None, which
+        detects the footer from the end of the file
+    datetime_format : string, optional
+        strftime format of the Date Time column. Default
+        '%m/%d/%y %I:%M:%S %p'. Falls back to format inference if the
+        timestamps do not match.
+    spb : int or bool, optional
+        Samples per burst if using burst sampling, or True to detect bursts
+        from gaps in the timestamps. Default False
 
     Returns
     -------
     xarray.Dataset
         An xarray Dataset of the HOBO data
     """
-    hobo =  pd.read_csv(filnam,
-                      usecols=[0, 1, 2, 3],
-                      names=['#','datetime','abspres_kPa','temp_C'],
-                      engine='python',
-                      skiprows=skiprows,
-                      skipfooter=skipfooter)
-    hobo['time'] = pd.to_datetime(hobo['datetime'])
+
+    if not isinstance(filnam, str):
+        hobo = utils.merge_time(utils.read_files(
+            read_hobo, filnam, skiprows=skiprows, skipfooter=skipfooter,
+            datetime_format=datetime_format))
+        if spb:
+            return _to_bursts(hobo['time'].values, hobo, spb)
+        return hobo
+
+    if skipfooter is None:
+        skipfooter = utils.count_footer(filnam, _is_data)
+
+    nrows = utils.count_rows(filnam, skiprows, skipfooter)
+
+    hobo = pd.read_csv(filnam,
+                       usecols=[0, 1, 2, 3],
+                       names=['#', 'datetime', 'abspres_kPa', 'temp_C'],
+                       engine='c',
+                       skiprows=skiprows,
+                       nrows=nrows)
+    try:
+        hobo['time'] = utils.parse_datetime(hobo['datetime'],
+                                            datetime_format)
+    except ValueError:
+        hobo['time'] = pd.to_datetime(hobo['datetime'])
     hobo['abspres_dbar'] = hobo['abspres_kPa']/10
+
+    if spb:
+        return _to_bursts(hobo['time'].values, hobo, spb)
+
     hobo.set_index('time', inplace=True)
 
-    return xr.Dataset(hobo)
+    return utils.normalize_time(xr.Dataset(hobo))
+
+
+def _to_bursts(time, hobo, spb):
+    return utils.to_bursts(
+        time,
+        {k: hobo[k].values for k in ['abspres_kPa', 'temp_C', 'abspres_dbar']},
+        spb=None if spb is True else spb)
+
+
+def _is_data(line):
+    """Data lines start with the record number"""
+
+    return line.split(',', 1)[0].strip().strip('"').isdigit()
@@ -1,7 +1,14 @@
 from __future__ import print_function, division
 import pandas as pd
 import numpy as np
-import scipy.stats
+
+# (path below Channel/Transect) -> key in the adcp dict
+QREV_FIELDS = {('StartDateTime',): 'starttime',
+               ('EndDateTime',): 'endtime',
+               ('Discharge', 'Total'): 'q',
+               ('Other', 'Area'): 'AreaQrev',
+               ('Filename',): 'filename'}
+
 
 def parse_qrev_xml(doc, negateq=False):
     """
@@ -22,25 +29,425 @@ def parse_qrev_xml(doc, negateq=False):
         Dictionary of relevant values extracted from the QRev XML tree.
     """
 
+    transects = doc['Channel']['Transect']
+    if isinstance(transects, dict):
+        # xmltodict does not make a list of a single element
+        transects = [transects]
+
+    rows = []
+    for t in transects:
+        row = {}
+        for path, key in QREV_FIELDS.items():
+            node = t
+            for tag in path:
+                node = node[tag]
+            row[key] = node['#text']
+        rows.append(row)
+
+    return _qrev_adcp(rows, negateq)
+
+
+def read_qrev_xml(filename, negateq=False):
+    """
+    Read a QRev XML file in a single streaming pass.
+
+    Unlike :py:func:`parse_qrev_xml`, the document is never held in memory
+    as a whole: transects are extracted as they are parsed and then
+    discarded.
+
+    Parameters
+    ----------
+    filename : string
+        The QRev XML filename
+    negateq : bool, optional
+        Negate all q (discharge) values. Default False
+
+    Returns
+    -------
+    adcp : dict
+        Same as :py:func:`parse_qrev_xml`
+    """
+
+    import xml.etree.ElementTree as ET
+
+    rows = []
+    row = None
+    path = []
+    for event, elem in ET.iterparse(filename, events=('start', 'end')):
+        if event == 'start':
+            path.append(elem.tag)
+            if path == ['Channel', 'Transect']:
+                row = {}
+            continue
+
+        if row is not None and tuple(path[2:]) in QREV_FIELDS:
+            row[QREV_FIELDS[tuple(path[2:])]] = elem.text
+        if path == ['Channel', 'Transect']:
+            rows.append(row)
+            row = None
+            elem.clear()
+        path.pop()
+
+    return _qrev_adcp(rows, negateq)
+
+
+def read_qrev_dir(directory='.', pattern='*.xml', negateq=False,
+                  processes=None):
+    """
+    Read all QRev XML files in a directory, in parallel, into one DataFrame.
+
+    Parameters
+    ----------
+    directory : string, optional
+        Directory to search. Default current directory
+    pattern : string, optional
+        Glob pattern of the XML files. Default '*.xml'
+    negateq : bool, optional
+        Negate all q (discharge) values. Default False
+    processes : int, optional
+        Number of processes. Default is the number of CPUs
+
+    Returns
+    -------
+    pandas.DataFrame
+        One row per transect, sorted by time, with the values returned by
+        :py:func:`read_qrev_xml` and the name of the XML file (``xmlfile``)
+    """
+
+    import glob
+    import os
+    import concurrent.futures
+
+    files = sorted(glob.glob(os.path.join(directory, pattern)))
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=processes) as ex:
+        adcps = list(ex.map(read_qrev_xml, files, [negateq] * len(files)))
+
+    dfs = []
+    for f, adcp in zip(files, adcps):
+        df = pd.DataFrame(adcp)
+        df['xmlfile'] = os.path.basename(f)
+        dfs.append(df)
+
+    if not dfs:
+        return pd.DataFrame(columns=['starttime', 'endtime', 'time', 'q',
+                                     'AreaQrev', 'filename', 'xmlfile'])
+
+    return pd.concat(dfs, ignore_index=True).sort_values(
+        'time', ignore_index=True)
+
+
+def _qrev_adcp(rows, negateq=False):
+    """Build the adcp dict from a list of per-transect dicts of strings"""
+
     adcp = {}
-    lendoc = len(doc['Channel']['Transect'])
-    adcp['starttime'] = pd.to_datetime([doc['Channel']['Transect'][n]['StartDateTime']['#text'] for n in range(lendoc)])
-    adcp['endtime'] = pd.to_datetime([doc['Channel']['Transect'][n]['EndDateTime']['#text'] for n in range(lendoc)])
-    adcp['time'] = pd.to_datetime(np.mean([adcp['starttime'].view('i8'), adcp['endtime'].view('i8')], axis=0).astype('datetime64[ns]'))
-    adcp['q'] = np.asarray([float(doc['Channel']['Transect'][n]['Discharge']['Total']['#text']) for n in range(lendoc)])
+    adcp['starttime'] = pd.to_datetime([r['starttime'] for r in rows])
+    adcp['endtime'] = pd.to_datetime([r['endtime'] for r in rows])
+    adcp['time'] = pd.to_datetime(
+        np.mean([adcp['starttime'].values.astype('datetime64[ns]').view('i8'),
+                 adcp['endtime'].values.astype('datetime64[ns]').view('i8')],
+                axis=0).astype('datetime64[ns]'))
+    adcp['q'] = np.asarray([float(r['q']) for r in rows])
     if negateq:
         adcp['q'] = -adcp['q']
-    adcp['AreaQrev'] = np.asarray([float(doc['Channel']['Transect'][n]['Other']['Area']['#text']) for n in range(lendoc)])
-    adcp['filename'] = np.asarray([doc['Channel']['Transect'][n]['Filename']['#text'] for n in range(lendoc)])
+    adcp['AreaQrev'] = np.asarray([float(r['AreaQrev']) for r in rows])
+    adcp['filename'] = np.asarray([r['filename'] for r in rows])
 
     return adcp
 
+
 def linregress(adcp):
     """
     Perform a linear regression and return slope, intercept, r value, p value,
     and standard error of the slope. This is just a wrapper around
     `scipy.stats.linregress()`
     """
+
+    import scipy.stats
+
     adcp['slope'], adcp['intercept'], adcp['r_value'], adcp['p_value'], adcp['std_err'] = scipy.stats.linregress(adcp['veli'], adcp['Vca'])
 
     return adcp
+
+
+def design_matrix(veli, stage=None, interaction=False):
+    """
+    Build the regression design matrix for an index-velocity rating.
+
+    Columns are an intercept and `veli`, plus `stage` (and ``veli * stage``
+    if `interaction`) for a multiple regression.
+
+    Returns
+    -------
+    numpy.ndarray
+        Array of shape ``veli.shape + (p,)``
+    """
+
+    veli = np.asarray(veli, dtype=float)
+    cols = [np.ones_like(veli), veli]
+    if stage is not None:
+        stage = np.asarray(stage, dtype=float)
+        cols.append(stage)
+        if interaction:
+            cols.append(veli * stage)
+
+    return np.stack(cols, axis=-1)
+
+
+def _wls(X, y, w):
+    """
+    Batched weighted least squares. X is (..., n, p), y and w are (..., n);
+    rows with zero weight are ignored.
+    """
+
+    XtW = np.swapaxes(X * w[..., None], -1, -2)
+    coef = np.linalg.solve(XtW @ X, (XtW @ y[..., None]))[..., 0]
+
+    return coef
+
+
+def fit_rating(veli, Vca, stage=None, method='ols', interaction=False,
+               huber_k=1.345, maxiter=50):
+    """
+    Fit index-velocity ratings of mean channel velocity `Vca` against index
+    velocity `veli` for one or many measurement sets at once.
+
+    Parameters
+    ----------
+    veli, Vca : array_like
+        Index and mean channel velocities, of shape (n,) for one measurement
+        set or (nsets, n) for several. Sets with fewer measurements are
+        padded with NaN.
+    stage : array_like, optional
+        Stage for a multiple regression, same shape as `veli`
+    method : {'ols', 'huber', 'theilsen'}, optional
+        Ordinary least squares; Huber M-estimation by iteratively reweighted
+        least squares; or Theil-Sen (median of pairwise slopes; simple
+        regression only). Default 'ols'
+    interaction : bool, optional
+        Include a ``veli * stage`` term in multiple regressions. Default False
+    huber_k : float, optional
+        Huber tuning constant, in units of the robust residual scale.
+        Default 1.345
+    maxiter : int, optional
+        Maximum IRLS iterations for the Huber fit. Default 50
+
+    Returns
+    -------
+    rating : dict
+        ``coef`` (nsets, p) regression coefficients (intercept first),
+        ``cov`` (nsets, p, p) coefficient covariance, ``s`` residual
+        standard error, ``dof`` residual degrees of freedom, ``r2``, ``n``,
+        and the fit settings. For robust fits the covariance is the
+        weighted least-squares approximation at the final weights.
+    """
+
+    veli = np.atleast_2d(np.asarray(veli, dtype=float))
+    Vca = np.atleast_2d(np.asarray(Vca, dtype=float))
+    if stage is not None:
+        stage = np.atleast_2d(np.asarray(stage, dtype=float))
+
+    good = np.isfinite(veli) & np.isfinite(Vca)
+    if stage is not None:
+        good &= np.isfinite(stage)
+    w = good.astype(float)
+
+    # zero-fill the gaps; they get zero weight
+    X = design_matrix(np.where(good, veli, 0),
+                      None if stage is None else np.where(good, stage, 0),
+                      interaction)
+    y = np.where(good, Vca, 0)
+    n = good.sum(axis=-1)
+    p = X.shape[-1]
+
+    if method == 'ols':
+        coef = _wls(X, y, w)
+    elif method == 'huber':
+        coef = _wls(X, y, w)
+        for _ in range(maxiter):
+            r = np.where(good, y - np.einsum('snp,sp->sn', X, coef), np.nan)
+            scale = np.nanmedian(np.abs(r), axis=-1, keepdims=True) / 0.6745
+            scale[scale == 0] = np.finfo(float).tiny
+            a = np.abs(r) / scale
+            w = np.where(good, np.minimum(1, huber_k / np.maximum(a, 1e-12)),
+                         0)
+            new = _wls(X, y, w)
+            done = np.allclose(new, coef, rtol=1e-8, atol=1e-12)
+            coef = new
+            if done:
+                break
+    elif method == 'theilsen':
+        if stage is not None:
+            raise ValueError('Theil-Sen ratings are simple regressions only')
+        x = np.where(good, veli, np.nan)
+        yy = np.where(good, Vca, np.nan)
+        dx = x[:, None, :] - x[:, :, None]
+        dy = yy[:, None, :] - yy[:, :, None]
+        iu = np.triu_indices(x.shape[-1], k=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            slopes = (dy / dx)[:, iu[0], iu[1]]
+        slopes[~np.isfinite(slopes)] = np.nan
+        slope = np.nanmedian(slopes, axis=-1)
+        intercept = np.nanmedian(yy - slope[:, None] * x, axis=-1)
+        coef = np.stack([intercept, slope], axis=-1)
+    else:
+        raise ValueError('Unknown rating method %r' % method)
+
+    resid = np.where(good, y - np.einsum('snp,sp->sn', X, coef), 0)
+    dof = n - p
+    s2 = (w * resid**2).sum(axis=-1) / dof
+    XtW = np.swapaxes(X * w[..., None], -1, -2)
+    cov = s2[:, None, None] * np.linalg.inv(XtW @ X)
+
+    ym = (y * good).sum(axis=-1) / n
+    sst = (good * (y - ym[:, None])**2).sum(axis=-1)
+    r2 = 1 - (good * resid**2).sum(axis=-1) / sst
+
+    return {'coef': coef,
+            'cov': cov,
+            's': np.sqrt(s2),
+            'dof': dof,
+            'r2': r2,
+            'n': n,
+            'method': method,
+            'multiple': stage is not None,
+            'interaction': interaction}
+
+
+def predict_rating(rating, veli, stage=None, alpha=0.05, which=None):
+    """
+    Evaluate a rating with confidence and prediction intervals.
+
+    Parameters
+    ----------
+    rating : dict
+        Output of :py:func:`fit_rating`
+    veli : array_like
+        Index velocities
+    stage : array_like, optional
+        Stage, required for multiple regression ratings
+    alpha : float, optional
+        Intervals are at the 1 - `alpha` level. Default 0.05
+    which : array_like of int, optional
+        Rating set to use for each value of `veli`. Default 0 (the first
+        set)
+
+    Returns
+    -------
+    Vca, ci, pi : numpy.ndarray
+        Predicted mean channel velocity and the half-widths of its
+        confidence (mean) and prediction (single measurement) intervals
+    """
+
+    import scipy.stats
+
+    if rating['multiple'] and stage is None:
+        raise ValueError('This rating requires stage')
+
+    X = design_matrix(veli, stage if rating['multiple'] else None,
+                      rating['interaction'])
+    if which is None:
+        which = np.zeros(X.shape[:-1], dtype=int)
+    which = np.broadcast_to(which, X.shape[:-1])
+
+    # gather the rating for each sample, then evaluate all at once
+    coef = rating['coef'][which]
+    cov = rating['cov'][which]
+    Vca = np.einsum('...p,...p->...', X, coef)
+    var = np.einsum('...p,...pq,...q->...', X, cov, X)
+    t = scipy.stats.t.ppf(1 - alpha / 2, rating['dof'])[which]
+    ci = t * np.sqrt(var)
+    pi = t * np.sqrt(var + rating['s'][which]**2)
+
+    return Vca, ci, pi
+
+
+# spellings of area and velocity units -> length unit
+AREA_UNITS = {'m2': 'm', 'm^2': 'm', 'm**2': 'm', 'm\u00b2': 'm',
+              'ft2': 'ft', 'ft^2': 'ft', 'ft**2': 'ft', 'ft\u00b2': 'ft'}
+VELOCITY_UNITS = {'m/s': 'm', 'm s-1': 'm', 'm s^-1': 'm', 'm.s-1': 'm',
+                  'ft/s': 'ft', 'ft s-1': 'ft', 'ft s^-1': 'ft'}
+
+
+def discharge_units(area_units, velocity_units):
+    """
+    Units of area times velocity, e.g. 'm3 s-1' for 'm2' and 'm/s', or
+    their product (e.g. 'm2 cm s-1') for other combinations. Returns None
+    if either is unknown.
+    """
+
+    if not area_units or not velocity_units:
+        return None
+
+    L = AREA_UNITS.get(area_units.strip())
+    if L is not None and L == VELOCITY_UNITS.get(velocity_units.strip()):
+        return L + '3 s-1'
+
+    return '%s %s' % (area_units, velocity_units.replace('/s', ' s-1'))
+
+
+def apply_rating(ds, rating, starts=None, area='FlowData_Area',
+                 veli='FlowData_Vel_Mean', stage='FlowData_Stage',
+                 alpha=0.05):
+    """
+    Apply index-velocity ratings to an IQ time series to compute discharge.
+
+    Parameters
+    ----------
+    ds : xarray.Dataset
+        IQ Dataset with index velocity, stage, and area time series
+    rating : dict
+        Output of :py:func:`fit_rating`
+    starts : array_like of datetime64, optional
+        Start time from which each rating set applies, for ratings that
+        change between field seasons. Default None, which applies the first
+        set everywhere
+    area, veli, stage : string, optional
+        Names of the area, index velocity, and stage variables
+    alpha : float, optional
+        Intervals are at the 1 - `alpha` level. Default 0.05
+
+    Returns
+    -------
+    xarray.Dataset
+        `ds` with ``Vca`` and ``Q``, and their confidence (``_ci``) and
+        prediction (``_pi``) interval half-widths, added. Units are those of
+        the index velocity and, for discharge, the area times the velocity
+        (see :py:func:`discharge_units`)
+    """
+
+    if starts is None:
+        which = 0
+    else:
+        which = np.searchsorted(np.asarray(starts, dtype='datetime64[ns]'),
+                                ds['time'].values.astype('datetime64[ns]'),
+                                side='right') - 1
+        which = np.maximum(which, 0)
+
+    Vca, ci, pi = predict_rating(
+        rating, ds[veli].values,
+        ds[stage].values if rating['multiple'] else None,
+        alpha=alpha, which=which)
+    A = ds[area].values
+
+    units = ds[veli].attrs.get('units', '')
+    for k, v in [('Vca', Vca), ('Vca_ci', ci), ('Vca_pi', pi)]:
+        ds[k] = (ds[veli].dims, v)
+        ds[k].attrs['units'] = units
+    qunits = discharge_units(ds[area].attrs.get('units'), units)
+    for k, v in [('Q', Vca), ('Q_ci', ci), ('Q_pi', pi)]:
+        ds[k] = (ds[veli].dims, A * v)
+        if qunits is not None:
+            ds[k].attrs['units'] = qunits
+
+    ds['Vca'].attrs['long_name'] = 'Mean channel velocity from rating'
+    ds['Q'].attrs['long_name'] = 'Discharge from index-velocity rating'
+    for k in ['Vca', 'Q']:
+        ds[k + '_ci'].attrs['long_name'] = (
+            '%d%% confidence interval half-width of %s' %
+            (100 * (1 - alpha), k))
+        ds[k + '_pi'].attrs['long_name'] = (
+            '%d%% prediction interval half-width of %s' %
+            (100 * (1 - alpha), k))
+
+    return ds
@@ -1,19 +1,26 @@
 from __future__ import division, print_function
-import scipy.io as spio
-import matplotlib.pyplot as plt
 import xarray as xr
 import pandas as pd
 import numpy as np
-from . import core
+from .core import utils, provenance
 
-def read_iq(filnam):
+def read_iq(filnam, groups=None):
     """Read SonTek IQ data which has been exported as a Matlab .mat file from IQ
     software into an xarray Dataset
 
+    Only the requested variable groups are read from the file. MATLAB v7.3
+    (HDF5) exports are read lazily, so each array is read from disk once,
+    directly into the Dataset, and the file is closed before returning.
+
     Parameters
     ----------
     filnam : string
         The SonTek .mat filename
+    groups : list of str, optional
+        Variable groups (name prefixes) to load, e.g. ``['FlowData']`` or
+        ``['FlowData', 'Profile', 'FlowSubData']``. ``FlowData_SampleTime``,
+        ``Data_Units`` and the ``System_`` metadata are always loaded.
+        Default None, which loads everything except ``FlowSubData``
 
     Returns
     -------
@@ -21,32 +28,45 @@ def read_iq(filnam):
         An xarray Dataset of the IQ data
     """
 
-    iqmat = core.utils.loadmat(filnam)
-    offset = iqmat['FlowSubData_PrfHeader_0_BlankingDistance']
-    # beamdist_0 = np.linspace(offset, offset + 100*iqmat['FlowSubData_PrfHeader_0_CellSize'], 100)
-    ds = {}
-
-    ds['time'] = xr.DataArray(iqmat['FlowData_SampleTime'],
-        attrs={'standard_name': 'time',
-               'axis': 'T',
-               'units': 'microseconds since 2000-01-01 00:00:00', # per email from SonTek
-               'calendar': 'proleptic_gregorian'}, dims='time')
-
-    ds['velbeam'] = xr.DataArray([1, 2, 3, 4], dims='velbeam')
-    ds['beam'] = xr.DataArray([1, 2, 3, 4, 5], dims='beam')
-    # ds['beamdist_0'] = xr.DataArray(beamdist_0, dims='beamdist_0')
-    attrs = {}
-
-    # need to do this because sometimes the flowsubdata and profile data is one burst longer
-    timelen = len(ds['time'])
-
-    for k in iqmat:
-        if '__' not in k and 'FlowSubData' not in k:
-            print(k, np.shape(iqmat[k]))
-            if len(np.ravel(iqmat[k])) == len(ds['time']):
+    names = list(utils.matvars(filnam))
+    if groups is None:
+        names = [k for k in names if 'FlowSubData' not in k]
+    else:
+        prefixes = tuple(groups) + ('FlowData_SampleTime', 'Data_Units',
+                                    'System_')
+        names = [k for k in names if k.startswith(prefixes)]
+
+    with utils.open_mat(filnam, variable_names=names) as iqmat:
+        # beamdist_0 = np.linspace(offset, offset + 100*iqmat['FlowSubData_PrfHeader_0_CellSize'], 100)
+        ds = {}
+
+        ds['time'] = xr.DataArray(np.ravel(iqmat['FlowData_SampleTime']),
+            attrs={'standard_name': 'time',
+                   'axis': 'T',
+                   'units': 'microseconds since 2000-01-01 00:00:00', # per email from SonTek
+                   'calendar': 'proleptic_gregorian'}, dims='time')
+
+        ds['velbeam'] = xr.DataArray([1, 2, 3, 4], dims='velbeam')
+        ds['beam'] = xr.DataArray([1, 2, 3, 4, 5], dims='beam')
+        # ds['beamdist_0'] = xr.DataArray(beamdist_0, dims='beamdist_0')
+
+        # need to do this because sometimes the flowsubdata and profile data is one burst longer
+        timelen = len(ds['time'])
+
+        for k in iqmat:
+            if '__' in k or k == 'FlowData_SampleTime' or k.startswith('System_'):
+                continue
+            # use the shape so lazy arrays are not read just to check it
+            shape = np.shape(iqmat[k])
+            if 'FlowSubData' in k:
+                if len(shape) == 1 and shape[0] in (timelen, timelen + 1):
+                    ds[k] = xr.DataArray(iqmat[k][0:timelen], dims='time')
+            elif int(np.prod(shape)) == timelen:
                 ds[k] = xr.DataArray(np.ravel(iqmat[k]), dims='time')
                 if k in iqmat['Data_Units']:
                     ds[k].attrs['units'] = iqmat['Data_Units'][k]
+            elif len(shape) != 2:
+                continue
             elif '_2_' in k or '_3_' in k:
                 ds[k] = xr.DataArray(iqmat[k][0:timelen,:], dims=('time', 'beamdist_2_3'))
             elif '_0_' in k or '_1_' in k:
@@ -56,21 +76,161 @@ def read_iq(filnam):
             elif 'FlowData_NoiseLevel' in k:
                 ds[k] = xr.DataArray(iqmat[k][0:timelen,:], dims=('time', 'beam'))
 
-    ds = xr.Dataset(ds)
-    for k in iqmat['System_IqSetup']['basicSetup']:
-        if 'spare' not in k:
-            ds.attrs[k] = iqmat['System_IqSetup']['basicSetup'][k]
-    for k in iqmat['System_Id']:
-        ds.attrs[k] = iqmat['System_Id'][k]
-    for k in iqmat['System_IqState']:
-        if 'spare' not in k:
-            ds.attrs[k] = iqmat['System_IqState'][k]
+        ds = xr.Dataset(ds)
+        for k in iqmat['System_IqSetup']['basicSetup']:
+            if 'spare' not in k:
+                ds.attrs[k] = iqmat['System_IqSetup']['basicSetup'][k]
+        for k in iqmat['System_Id']:
+            ds.attrs[k] = iqmat['System_Id'][k]
+        for k in iqmat['System_IqState']:
+            if 'spare' not in k:
+                ds.attrs[k] = iqmat['System_IqState'][k]
+
+    return utils.normalize_time(xr.decode_cf(ds))
+
+def mat_to_cdf(metadata):
+    """
+    Load IQ data from the exported .mat file and save to raw .cdf
+    """
+
+    basefile = metadata['basefile']
+
+    if 'prefix' in metadata:
+        basefile = metadata['prefix'] + basefile
+
+    provenance.reset_timings()
+
+    with provenance.timed('iqmat2cdf read'):
+        ds = read_iq(basefile + '.mat')
+
+    # write out metadata first, then deal exclusively with xarray attrs
+    ds = utils.write_metadata(ds, metadata)
+
+    del metadata
+
+    ds = provenance.add_inputs(ds, basefile + '.mat')
+
+    ds = provenance.add_timings(ds)
+
+    # configure file
+    if 'prefix' in ds.attrs:
+        cdf_filename = ds.attrs['prefix'] + ds.attrs['filename'] + '-raw.cdf'
+    else:
+        cdf_filename = ds.attrs['filename'] + '-raw.cdf'
+
+    ds.to_netcdf(cdf_filename, unlimited_dims='time')
+
+    print('Finished writing data to %s' % cdf_filename)
+
+    return ds
+
+
+def cdf_to_nc(cdf_filename, chunks=None):
+    """
+    Load a "raw" .cdf file and generate a processed .nc file
+
+    Parameters
+    ----------
+    cdf_filename : string
+        The raw .cdf filename
+    chunks : dict, optional
+        Chunk sizes passed to `xarray.open_dataset`, e.g. ``{'time': 10000}``,
+        so long records are processed lazily, one time chunk at a time.
+        Requires dask. Default None (load into memory)
+    """
+
+    # Load raw .cdf data
+    ds = xr.open_dataset(cdf_filename, chunks=chunks)
+
+    # Clip data to in/out water times or via good_ens
+    ds = utils.clip_ds(ds)
+
+    ds = clean_iq(ds)
+
+    ds = vel_to_ms(ds)
+
+    # assign min/max:
+    ds = utils.add_min_max(ds)
+
+    ds = utils.create_epic_time(ds)
+
+    ds = ds_add_attrs(ds)
+
+    ds = utils.add_start_stop_time(ds)
+
+    ds = utils.add_epic_history(ds)
+
+    # Write to .nc file
+    print("Writing cleaned/trimmed data to .nc file")
+    if 'prefix' in ds.attrs:
+        nc_filename = ds.attrs['prefix'] + ds.attrs['filename'] + '-a.nc'
+    else:
+        nc_filename = ds.attrs['filename'] + '-a.nc'
+
+    ds = utils.rename_time(ds)
+
+    ds.to_netcdf(nc_filename, unlimited_dims='time')
+    print('Done writing netCDF file', nc_filename)
+
+    return ds
+
+
+def ds_add_attrs(ds):
+    """
+    Add lat/lon and EPIC attributes
+    """
+
+    ds['lat'] = xr.DataArray([ds.attrs['latitude']], dims=('lat'), name='lat',
+                             attrs={'units': 'degree_north',
+                                    'long_name': 'Latitude',
+                                    'epic_code': 500})
+    ds['lon'] = xr.DataArray([ds.attrs['longitude']], dims=('lon'), name='lon',
+                             attrs={'units': 'degree_east',
+                                    'long_name': 'Longitude',
+                                    'epic_code': 502})
+
+    # Update attributes for EPIC and STG compliance
+    ds.lat.encoding['_FillValue'] = False
+    ds.lon.encoding['_FillValue'] = False
+    ds.time.encoding['_FillValue'] = False
+    ds.epic_time.encoding['_FillValue'] = False
+    ds.epic_time2.encoding['_FillValue'] = False
+
+    ds['time'].attrs.update({'standard_name': 'time',
+                             'axis': 'T'})
+
+    ds['epic_time'].attrs.update({'units': 'True Julian Day',
+                                  'type': 'EVEN',
+                                  'epic_code': 624})
+
+    ds['epic_time2'].attrs.update({'units': 'msec since 0:00 GMT',
+                                   'type': 'EVEN',
+                                   'epic_code': 624})
+
+    for var in ds.data_vars:
+        if not var.startswith(('FlowData_', 'Profile_')):
+            continue
+        if np.issubdtype(ds[var].dtype, np.floating):
+            ds[var].encoding['_FillValue'] = 1e35
+        elif (np.issubdtype(ds[var].dtype, np.signedinteger) and
+              np.iinfo(ds[var].dtype).min <= SENTINEL):
+            # integers are left unmasked by clean_iq; flag the sentinel
+            ds[var].encoding['_FillValue'] = SENTINEL
+
+    return ds
+
+
+# IQ fill value for missing data
+SENTINEL = -214748368
 
-    return xr.decode_cf(ds)
 
 def clean_iq(iq):
     """
-    Preliminary data cleaning when SNR < 0
+    Preliminary data cleaning: mask the missing-data sentinel in all
+    floating-point FlowData and Profile variables. Uses ``where`` so chunked
+    (dask) data stay lazy. Integer variables are left as they are, rather
+    than converted to float, and the sentinel is their ``_FillValue`` in the
+    .nc file (see :py:func:`ds_add_attrs`).
     """
     # bads = iq['FlowData_SNR'] < 0
     # badsflat = np.any(bads, 1)
@@ -81,10 +241,14 @@ def clean_iq(iq):
     # for var in ['FlowData_SNR']:
     #     iq[var].values[bads] = np.nan
     #
-    iq['FlowData_Vel_Mean'].values[iq['FlowData_Vel_Mean'] < -214748] = np.nan
-    iq['FlowData_Vel'].values[iq['FlowData_Vel'] == -214748368] = np.nan
-    for bm in range(4):
-        iq['Profile_' + str(bm) + '_Vel'].values[iq['Profile_' + str(bm) + '_Vel'] == -214748368] = np.nan
+    for var in iq.data_vars:
+        if not np.issubdtype(iq[var].dtype, np.floating):
+            continue
+        elif var == 'FlowData_Vel_Mean':
+            # mean velocity sentinel is not always exactly SENTINEL
+            iq[var] = iq[var].where(iq[var] >= -214748)
+        elif var.startswith(('FlowData_', 'Profile_')):
+            iq[var] = iq[var].where(iq[var] != SENTINEL)
     #     iq['Profile_' + str(bm) + '_Amp'].values[iq['Profile_' + str(bm) + '_Amp'] == 65535] = np.nan
 
     return iq
@@ -95,48 +259,69 @@ def vel_to_ms(iq):
     """
 
     for var in ['FlowData_Vel_Mean', 'FlowData_Vel']:
+        attrs = iq[var].attrs
         iq[var] = iq[var] / 1000
+        iq[var].attrs = attrs
+        iq[var].attrs['units'] = 'm/s'
 
     return iq
 
 def make_beamdist(iq):
     """
     Generate physical coordinates to pair with the logical beamdist coordinates
+
+    Cell distances are computed for all times at once by broadcasting the
+    blanking distance and cell size against the cell index. The per-cell time
+    coordinates ``time_0`` to ``time_3`` are 2-D (time, cell) arrays, e.g.
+    for plotting with ``pcolormesh``. xarray copies datetime64 data, so each
+    is a full (time, cell) array in memory, but the beams that have the same
+    cells (0 and 1, 2 and 3) share one.
     """
+
+    times = {}
+
     for bm in range(4):
         if bm < 2:
             bdname = 'beamdist_0_1'
         else:
             bdname = 'beamdist_2_3'
 
-        r = range(len(iq[bdname]))
+        ncells = iq[bdname].size
+        r = xr.DataArray(np.arange(ncells), dims=bdname)
+
+        blank = iq['FlowSubData_PrfHeader_' + str(bm) + '_BlankingDistance']
+        cellsize = iq['FlowSubData_PrfHeader_' + str(bm) + '_CellSize']
 
-        time = np.tile(iq['time'], (len(iq[bdname]), 1)).transpose()
+        if bdname not in times:
+            times[bdname] = xr.DataArray(
+                np.broadcast_to(iq['time'].values[:, np.newaxis],
+                                (iq['time'].size, ncells)),
+                dims=('time', bdname))
 
-        cells = np.zeros(np.shape(iq['Profile_' + str(bm) + '_Vel']))
-        for n in range(len(iq['time'])):
-            cells[n,:] = iq['FlowSubData_PrfHeader_' + str(bm) + '_BlankingDistance'][n].values + \
-                         r * iq['FlowSubData_PrfHeader_' + str(bm) + '_CellSize'][n].values
-        iq['cells_' + str(bm)] = xr.DataArray(cells, dims=('time', bdname))
-        iq['time_' + str(bm)] = xr.DataArray(time, dims=('time', bdname))
-        iq.set_coords(['cells_' + str(bm),
-                       'time_' + str(bm)],
-                       inplace=True)
+        iq['cells_' + str(bm)] = (blank + r * cellsize).transpose(
+            'time', bdname)
+        iq['time_' + str(bm)] = times[bdname]
+        iq = iq.set_coords(['cells_' + str(bm), 'time_' + str(bm)])
 
     return iq
 
 def make_iq_plots(iq, directory='', savefig=False):
     """
-    Make IQ turnaround plots
+    Make IQ turnaround plots. Data are decimated to screen resolution before
+    plotting; see :py:mod:`stglib.quicklook`. The figure is only shown
+    interactively when not saved.
     """
 
-    plt.figure(figsize=(11,8.5))
+    import matplotlib.pyplot as plt
+    from . import quicklook
 
-    for n, var in enumerate(['FlowData_Depth', 'FlowData_Vel_Mean', 'FlowData_Flow'], start=1):
-        plt.subplot(3,1,n)
-        plt.plot(iq['time'], iq[var])
-        plt.ylabel(var + ' [' + iq[var].attrs['units'] + ']')
+    fig = quicklook.plot_iq(iq)
+    fig.set_size_inches(11, 8.5)
 
     if savefig:
-        plt.savefig(directory + '/iq_stage_vel_flow.pdf')
-    plt.show()
+        fig.savefig(directory + '/iq_stage_vel_flow.pdf')
+        plt.close(fig)
+    else:
+        plt.show()
+
+    return fig
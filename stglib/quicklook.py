@@ -0,0 +1,362 @@
+"""
+Fast turnaround ("quicklook") plots from raw .cdf (or Zarr) files.
+
+Data are reduced to screen resolution before plotting: line plots keep the
+minimum and maximum of each pixel column, so spikes and dropouts remain
+visible, and images are averaged into one profile per pixel column. Figures
+are written to disk; the ``stglib quicklook`` command renders them with the
+non-interactive Agg backend.
+"""
+
+from __future__ import division, print_function
+import os
+import glob
+import warnings
+import contextlib
+import concurrent.futures
+import numpy as np
+import xarray as xr
+
+# default width of the plotting area, in pixels
+WIDTH = 1100
+
+
+def minmax_decimate(x, y, npix=WIDTH):
+    """
+    Reduce a time series to the minimum and maximum of each pixel column.
+
+    Parameters
+    ----------
+    x : array_like
+        1-D coordinate (e.g. time), monotonic
+    y : array_like
+        1-D data, same length as `x`
+    npix : int, optional
+        Number of pixel columns. Default 1100
+
+    Returns
+    -------
+    x, y : numpy.ndarray
+        Decimated arrays of length 2 * `npix`; each column is drawn as a
+        vertical segment from its minimum to its maximum.
+    """
+
+    x = np.asarray(x)
+    y = np.asarray(y, dtype=float)
+
+    if len(y) <= 2 * npix:
+        return x, y
+
+    per = int(np.ceil(len(y) / npix))
+    ncol = int(np.ceil(len(y) / per))
+    pad = ncol * per - len(y)
+    yy = np.concatenate([y, np.full(pad, np.nan)]).reshape((ncol, per))
+
+    with _ignore_allnan():
+        ymin = np.nanmin(yy, axis=1)
+        ymax = np.nanmax(yy, axis=1)
+
+    return (np.repeat(x[::per], 2),
+            np.column_stack((ymin, ymax)).ravel())
+
+
+def block_mean(z, npix=WIDTH):
+    """
+    Average a (time, ...) array into at most `npix` blocks along time.
+
+    Returns
+    -------
+    z : numpy.ndarray
+        Block-averaged array
+    idx : numpy.ndarray
+        Index of the first time of each block
+    """
+
+    z = np.asarray(z, dtype=float)
+    n = z.shape[0]
+    per = max(int(np.ceil(n / npix)), 1)
+    ncol = int(np.ceil(n / per))
+    pad = ncol * per - n
+
+    if pad:
+        z = np.concatenate([z, np.full((pad,) + z.shape[1:], np.nan)])
+
+    with _ignore_allnan():
+        zz = np.nanmean(z.reshape((ncol, per) + z.shape[1:]), axis=1)
+
+    return zz, np.arange(0, n, per)
+
+
+def pick(n, npix=WIDTH):
+    """Indices of at most `npix` evenly spaced samples out of `n`"""
+
+    if n <= npix:
+        return np.arange(n)
+
+    return np.unique(np.linspace(0, n - 1, npix).astype(int))
+
+
+def open_raw(filename):
+    """Open a raw .cdf or Zarr store lazily"""
+
+    if filename.rstrip('/').endswith('.zarr'):
+        return xr.open_zarr(filename)
+    else:
+        return xr.open_dataset(filename)
+
+
+def instrument_type(ds):
+    """Guess instrument type from the variables in a raw Dataset"""
+
+    if 'VEL1' in ds and 'bindist' in ds['VEL1'].dims:
+        return 'aqd'
+    elif 'VEL1' in ds and 'sample' in ds['VEL1'].dims:
+        return 'wvs'
+    elif 'P_1' in ds and 'sample' in ds['P_1'].dims:
+        return 'rsk'
+    elif 'FlowData_Vel_Mean' in ds:
+        return 'iq'
+    else:
+        return 'timeseries'
+
+
+def plot_line(ax, time, values, npix=WIDTH, **kwargs):
+    """Plot a min/max decimated time series on `ax`"""
+
+    x, y = minmax_decimate(time, values, npix)
+    ax.plot(x, y, **kwargs)
+
+
+def plot_timeseries(ds, variables=None, title='', npix=WIDTH):
+    """
+    Plot every (or the given) time-only variable in its own panel.
+
+    Returns
+    -------
+    matplotlib.figure.Figure
+    """
+
+    import matplotlib.pyplot as plt
+
+    if variables is None:
+        variables = [k for k in ds.data_vars
+                     if ds[k].dims == ('time',) and
+                     np.issubdtype(ds[k].dtype, np.number)]
+
+    fig, axs = plt.subplots(len(variables), 1, sharex=True, squeeze=False,
+                            figsize=(11, max(2 * len(variables), 4)))
+    for ax, var in zip(axs[:, 0], variables):
+        plot_line(ax, ds['time'].values, ds[var].values, npix)
+        ax.set_ylabel(var)
+    axs[0, 0].set_title(title)
+
+    return fig
+
+
+def plot_burst(ds, var='P_1', title='', npix=WIDTH):
+    """
+    Plot burst mean and the min/max envelope of the samples in each burst.
+
+    Returns
+    -------
+    matplotlib.figure.Figure
+    """
+
+    import matplotlib.pyplot as plt
+
+    vals = ds[var].values
+    fig, ax = plt.subplots(figsize=(11, 4))
+    with _ignore_allnan():
+        plot_line(ax, ds['time'].values, np.nanmin(vals, axis=1), npix,
+                  c='0.7')
+        plot_line(ax, ds['time'].values, np.nanmax(vals, axis=1), npix,
+                  c='0.7')
+        plot_line(ax, ds['time'].values, np.nanmean(vals, axis=1), npix,
+                  c='k')
+    ax.set_ylabel(var)
+    ax.set_title(title)
+
+    return fig
+
+
+def plot_aqd(ds, title='', npix=WIDTH):
+    """
+    Aquadopp turnaround plots: sensor time series, velocity and amplitude
+    images, and velocity time series in the first (up to three) bins.
+
+    Velocities are transformed to ENU for one profile per pixel column only,
+    so the cost does not grow with deployment length.
+
+    Returns
+    -------
+    dict
+        Figures keyed by plot name
+    """
+
+    import matplotlib.pyplot as plt
+    from .aqd import qaqc
+
+    figs = {}
+    time = ds['time'].values
+    bindist = ds['bindist'].values
+
+    figs['sensor_ts'] = plot_timeseries(
+        ds, ['Pressure', 'Heading', 'Pitch', 'Roll'], title, npix)
+
+    # one profile per pixel column for the coordinate transform
+    idx = pick(len(time), npix)
+    sub = ds.isel(time=idx)
+    T = ds['TransMatrix'].values.copy()
+    if ds.attrs.get('orientation') == 'DOWN':
+        T[1, :] = -T[1, :]
+        T[2, :] = -T[2, :]
+    u, v, w = qaqc.coord_transform(
+        sub['VEL1'].values, sub['VEL2'].values, sub['VEL3'].values,
+        sub['Heading'].values, sub['Pitch'].values, sub['Roll'].values,
+        T, ds.attrs['AQDCoordinateSystem'])
+    press = sub['Pressure'].values
+
+    fig, axs = plt.subplots(3, 1, sharex=True, figsize=(11, 9))
+    for ax, var, vel in zip(axs, ['U', 'V', 'W'], [u, v, w]):
+        vmax = np.nanmax(np.abs(np.nanpercentile(vel, [5, 95])))
+        pc = ax.pcolormesh(time[idx], bindist, vel.T, vmin=-vmax, vmax=vmax,
+                           cmap='RdBu_r', shading='nearest')
+        ax.plot(time[idx], press, c='k')
+        fig.colorbar(pc, ax=ax, label=var)
+    axs[0].set_title(title)
+    figs['velocity_pcolor'] = fig
+
+    fig, axs = plt.subplots(3, 1, sharex=True, figsize=(11, 9))
+    for ax, n in zip(axs, ['1', '2', '3']):
+        amp, ampidx = block_mean(ds['AMP' + n].values, npix)
+        pc = ax.pcolormesh(time[ampidx], bindist, amp.T,
+                           vmax=np.nanpercentile(amp, 95), shading='nearest')
+        plot_line(ax, time, ds['Pressure'].values, npix, c='k')
+        fig.colorbar(pc, ax=ax, label='AMP' + n)
+    axs[0].set_title(title)
+    figs['amplitude_pcolor'] = fig
+
+    nbins = min(3, len(bindist))
+    fig, axs = plt.subplots(nbins + 1, 1, sharex=True, figsize=(11, 9))
+    plot_line(axs[0], time, ds['Pressure'].values, npix)
+    axs[0].set_ylabel('Pressure')
+    for b, ax in enumerate(axs[1:]):
+        for var, vel in zip(['U', 'V', 'W'], [u, v, w]):
+            ax.plot(time[idx], vel[:, b], label=var)
+        ax.legend()
+        ax.set_title('%s bin %d (%s m)' % (title, b, bindist[b]))
+    figs['velocity_ts'] = fig
+
+    return figs
+
+
+def plot_iq(ds, title='', npix=WIDTH):
+    """
+    IQ stage, mean velocity and flow time series
+
+    Returns
+    -------
+    matplotlib.figure.Figure
+    """
+
+    fig = plot_timeseries(
+        ds, ['FlowData_Depth', 'FlowData_Vel_Mean', 'FlowData_Flow'], title,
+        npix)
+    for ax, var in zip(fig.axes, ['FlowData_Depth', 'FlowData_Vel_Mean',
+                                  'FlowData_Flow']):
+        if 'units' in ds[var].attrs:
+            ax.set_ylabel(var + ' [' + ds[var].attrs['units'] + ']')
+
+    return fig
+
+
+def make_quicklook(filename, outdir=None, npix=WIDTH):
+    """
+    Render and save the quicklook figures for one raw file.
+
+    Returns
+    -------
+    list
+        Filenames of the saved figures
+    """
+
+    import matplotlib.pyplot as plt
+
+    ds = open_raw(filename)
+    base = os.path.basename(filename.rstrip('/'))
+    for ext in ['-raw.cdf', '.cdf', '.zarr']:
+        if base.endswith(ext):
+            base = base[:-len(ext)]
+            break
+    if outdir is None:
+        outdir = os.path.dirname(filename.rstrip('/'))
+    kind = instrument_type(ds)
+
+    if kind == 'aqd':
+        figs = plot_aqd(ds, base, npix)
+    elif kind in ['wvs', 'rsk']:
+        var = 'Pressure' if kind == 'wvs' else 'P_1'
+        figs = {'burst': plot_burst(ds, var, base, npix)}
+    elif kind == 'iq':
+        figs = {'stage_vel_flow': plot_iq(ds, base, npix)}
+    else:
+        figs = {'ts': plot_timeseries(ds, title=base, npix=npix)}
+
+    saved = []
+    for name in figs:
+        fname = os.path.join(outdir, '%s_%s_%s.png' % (base, kind, name))
+        figs[name].savefig(fname)
+        plt.close(figs[name])
+        saved.append(fname)
+
+    ds.close()
+
+    return saved
+
+
+def make_quicklooks(directory='.', pattern='*-raw.cdf', processes=None,
+                    npix=WIDTH):
+    """
+    Render quicklook figures for all raw files in a directory in parallel.
+
+    Parameters
+    ----------
+    directory : string, optional
+        Directory to search. Default current directory
+    pattern : string, optional
+        Glob pattern of files to plot. Default '*-raw.cdf'
+    processes : int, optional
+        Number of processes. Default is the number of CPUs
+    npix : int, optional
+        Horizontal resolution to reduce data to. Default 1100
+
+    Returns
+    -------
+    dict
+        Saved figure filenames (or the error message) keyed by input file
+    """
+
+    files = sorted(glob.glob(os.path.join(directory, pattern)))
+    results = {}
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=processes) as ex:
+        futures = {ex.submit(make_quicklook, f, None, npix): f for f in files}
+        for fut in concurrent.futures.as_completed(futures):
+            f = futures[fut]
+            try:
+                results[f] = fut.result()
+                print('Plotted', f)
+            except Exception as e:
+                results[f] = repr(e)
+                print('Could not plot %s: %r' % (f, e))
+
+    return results
+
+
+@contextlib.contextmanager
+def _ignore_allnan():
+    """Silence RuntimeWarnings from all-NaN slices in nanmin/nanmax/nanmean"""
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', category=RuntimeWarning)
+        yield
@@ -1,6 +1,6 @@
 from __future__ import division, print_function
 import xarray as xr
-from ..core import utils
+from ..core import utils, despike
 
 
 def cdf_to_nc(cdf_filename, atmpres=None):
@@ -14,6 +14,8 @@ def cdf_to_nc(cdf_filename, atmpres=None):
     # Clip data to in/out water times or via good_ens
     ds = utils.clip_ds(ds)
 
+    ds = despike.despike_from_attrs(ds, ['P_1'])
+
     if atmpres is not None:
         print("Atmospherically correcting data")
 
@@ -5,7 +5,7 @@ from ..core import utils
 
 def nc_to_diwasp(nc_filename):
 
-    ds = xr.open_dataset(nc_filename, autoclose=True, decode_times=False)
+    ds = xr.open_dataset(nc_filename, decode_times=False)
 
     ds = utils.epic_to_cf_time(ds)
 
@@ -23,7 +23,7 @@ def nc_to_diwasp(nc_filename):
 
     ds = utils.create_water_depth(ds)
 
-    ds = ds.drop(['P_1', 'P_1ac', 'sample'])
+    ds = ds.drop([k for k in ['P_1', 'P_1ac', 'sample'] if k in ds.variables])
 
     ds = utils.trim_max_wp(ds)
 
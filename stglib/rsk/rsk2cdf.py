@@ -1,9 +1,8 @@
 from __future__ import division, print_function
-import sqlite3
 import numpy as np
 import xarray as xr
 import pandas as pd
-from ..core import utils
+from ..core import utils, provenance
 
 
 def rsk_to_cdf(metadata):
@@ -11,8 +10,12 @@ def rsk_to_cdf(metadata):
     Main function to load data from RSK file and save to raw .CDF
     """
 
+    provenance.reset_timings()
+
     ds = rsk_to_xr(metadata)
 
+    ds = provenance.add_timings(ds)
+
     print("Writing to raw netCDF")
 
     ds.to_netcdf(ds.attrs['filename'] + '-raw.cdf')
@@ -25,30 +28,58 @@ def rsk_to_cdf(metadata):
 def init_connection(rskfile):
     """Initialize an sqlite3 connection and return a cursor"""
 
+    import sqlite3
+
     conn = sqlite3.connect(rskfile)
     return conn.cursor()
 
 
-def rsk_to_xr(metadata):
+def sampling_mode(conn):
     """
-    Load data from RSK file and generate an xarray Dataset
+    Sampling mode of an .rsk file: 'continuous', or 'wave' for burst
+    sampling. Taken from the schedule if recorded there, otherwise from
+    whether the file has a burstdata table.
     """
 
-    rskfile = metadata['basefile'] + '.rsk'
+    import sqlite3
 
-    ds = xr.Dataset()
+    try:
+        mode = conn.execute("select mode from schedules").fetchall()[0][0]
+        return 'continuous' if str(mode).lower() == 'continuous' else 'wave'
+    except (sqlite3.OperationalError, IndexError):
+        pass
 
-    ds = utils.write_metadata(ds, metadata)
+    tables = [r[0] for r in conn.execute(
+        "select name from sqlite_master where type='table'").fetchall()]
+
+    return 'wave' if 'burstdata' in tables else 'continuous'
+
+
+def read_rsk(rskfile, window=None):
+    """
+    Read the burst pressure data and sampling schedule from a single .rsk
+    file into an xarray Dataset with dimensions (time, sample)
+
+    If `window` is a (start, stop) tuple, only the bursts starting within it
+    are fetched from the database.
+
+    Files from loggers sampling continuously are read with
+    :py:func:`read_rsk_continuous` instead, and have only a time dimension.
+    """
+
+    import sqlite3
 
     print(('Loading from sqlite file %s; '
            'this may take a while for large datasets') % rskfile)
 
+    ds = xr.Dataset()
+
     conn = init_connection(rskfile)
 
-    conn.execute("SELECT tstamp, channel01 FROM burstdata")
-    data = conn.fetchall()
-    print("Done fetching data")
-    d = np.asarray(data)
+    if sampling_mode(conn) == 'continuous':
+        conn.close()
+        return read_rsk_continuous(rskfile, window)
+
     # Get samples per burst
     try:
         # this seems to be used on older-style databases;
@@ -80,17 +111,28 @@ def rsk_to_xr(metadata):
         ds.attrs['sample_interval']
     ds.attrs['serial_number'] = conn.execute(
         "select serialID from instruments").fetchall()[0][0]
-    ds.attrs['INST_TYPE'] = 'RBR Virtuoso d|wave'
+
+    if window is None:
+        conn.execute("SELECT tstamp, channel01 FROM burstdata")
+    else:
+        conn.execute("SELECT tstamp, channel01 FROM burstdata "
+                     "WHERE tstamp BETWEEN ? AND ?",
+                     burst_window(conn, window, samplingcount,
+                                  samplingperiod, repetitionperiod))
+    data = conn.fetchall()
+    print("Done fetching data")
+    d = np.asarray(data).reshape((-1, 2))
 
     conn.close()
 
     a = {}
     a['unixtime'] = d[:, 0].copy()
     a['pres'] = d[:, 1].copy()
-    # sort by time (not sorted for some reason)
-    sort = np.argsort(a['unixtime'])
-    a['unixtime'] = a['unixtime'][sort]
-    a['pres'] = a['pres'][sort]
+    # burstdata is not always sorted by time, and may repeat samples
+    order = utils.time_order(a['unixtime'])
+    if order is not None:
+        a['unixtime'] = a['unixtime'][order]
+        a['pres'] = a['pres'][order]
 
     # get indices that end at the end of the final burst
     datlength = a['unixtime'].shape[0] - a['unixtime'].shape[0] % samplingcount
@@ -101,11 +143,185 @@ def rsk_to_xr(metadata):
             (int(datlength/samplingcount), samplingcount)
         )
 
-    times = pd.to_datetime(a['unixtime'][:, 0], unit='ms')
-    samples = np.arange(samplingcount)
+    ds['time'] = pd.to_datetime(a['unixtime'][:, 0], unit='ms')
+    ds['sample'] = np.arange(samplingcount)
+    ds['P_1'] = (('time', 'sample'), a['pres'])
+
+    return ds
+
+
+def read_rsk_continuous(rskfile, window=None):
+    """
+    Read continuously sampled pressure data from a single .rsk file into an
+    xarray Dataset with a time dimension
+
+    If `window` is a (start, stop) tuple, only the samples within it are
+    fetched from the database.
+    """
+
+    import sqlite3
+
+    ds = xr.Dataset()
+
+    conn = init_connection(rskfile)
+
+    try:
+        samplingperiod = conn.execute(
+            "select samplingperiod from continuous").fetchall()[0][0]
+    except sqlite3.OperationalError:
+        samplingperiod = conn.execute(
+            "select samplingperiod from schedules").fetchall()[0][0]
+    ds.attrs['sample_interval'] = samplingperiod / 1000
+    ds.attrs['sampling_mode'] = 'continuous'
+    ds.attrs['serial_number'] = conn.execute(
+        "select serialID from instruments").fetchall()[0][0]
+
+    if window is None:
+        conn.execute("SELECT tstamp, channel01 FROM data")
+    else:
+        conn.execute("SELECT tstamp, channel01 FROM data "
+                     "WHERE tstamp BETWEEN ? AND ?",
+                     [(t - pd.Timestamp('1970-01-01')) // pd.Timedelta('1ms')
+                      for t in window])
+    d = np.asarray(conn.fetchall()).reshape((-1, 2))
+    print("Done fetching data")
+
+    conn.close()
+
+    unixtime = d[:, 0]
+    pres = d[:, 1]
+    order = utils.time_order(unixtime)
+    if order is not None:
+        unixtime = unixtime[order]
+        pres = pres[order]
+
+    ds['time'] = pd.to_datetime(unixtime, unit='ms')
+    ds['P_1'] = ('time', pres)
+
+    return ds
+
+
+def continuous_to_bursts(ds, window_length, window_overlap=0):
+    """
+    Segment continuous data into (optionally overlapping) analysis windows,
+    so they can be processed like burst data.
+
+    The windows are strided views of the continuous record, not copies.
+    Gaps in the record are first filled with NaN so that every window spans
+    the same length of time.
+
+    Parameters
+    ----------
+    ds : xarray.Dataset
+        Continuous data, from :py:func:`read_rsk_continuous`
+    window_length : float
+        Window length, in seconds
+    window_overlap : float, optional
+        Fraction of each window overlapping the next. Default 0
+
+    Returns
+    -------
+    xarray.Dataset
+        Dataset with dimensions (time, sample), time being the start of each
+        window, and the burst attributes of burst-sampled data
+    """
+
+    dt = ds.attrs['sample_interval']
+    nsamp = int(round(window_length / dt))
+    step = max(int(round(nsamp * (1 - window_overlap))), 1)
+
+    t = ds['time'].values
+    if len(t) > 1 and np.diff(t).max() > np.timedelta64(int(1.5e9 * dt),
+                                                        'ns'):
+        ds = utils.normalize_time(ds, freq=dt)
+
+    bursts = utils.to_windows(ds['time'].values,
+                              {'P_1': ds['P_1'].values}, nsamp, step)
+    bursts.attrs = dict(ds.attrs)
+    bursts.attrs['samples_per_burst'] = nsamp
+    bursts.attrs['burst_interval'] = step * dt
+    bursts.attrs['burst_length'] = nsamp * dt
+    bursts.attrs['window_overlap'] = window_overlap
+    print('Segmented continuous data into %d windows of %d samples' %
+          (bursts.sizes['time'], nsamp))
+
+    return bursts
+
+
+def burst_window(conn, window, samplingcount, samplingperiod,
+                 repetitionperiod):
+    """
+    Range of tstamp values (ms) covering the complete bursts that start
+    within `window`, so that clipped data still reshape into whole bursts.
+    Bursts are assumed to follow the schedule from the first burst.
+    """
+
+    t0 = conn.execute("SELECT MIN(tstamp) FROM burstdata").fetchone()[0]
+    if t0 is None:
+        return 0, -1
+
+    start, stop = [(t - pd.Timestamp('1970-01-01')) // pd.Timedelta('1ms')
+                   for t in window]
+    first = t0 + max(np.ceil((start - t0) / repetitionperiod), 0) * \
+        repetitionperiod
+    last = t0 + np.floor((stop - t0) / repetitionperiod) * repetitionperiod
+
+    # allow half a sample of jitter either side
+    return (int(first - samplingperiod / 2),
+            int(last + (samplingcount - 0.5) * samplingperiod))
+
+
+def rsk_to_xr(metadata):
+    """
+    Load data from RSK file and generate an xarray Dataset
+
+    ``basefile`` may be a list, for deployments split across several .rsk
+    files. The files are read concurrently and their bursts merged by time;
+    bursts overlapping an earlier file are dropped.
+    """
+
+    if isinstance(metadata['basefile'], str):
+        rskfiles = [metadata['basefile'] + '.rsk']
+    else:
+        rskfiles = [f + '.rsk' for f in metadata['basefile']]
+
+    window = utils.clip_window(metadata)
+
+    with provenance.timed('rskrsk2cdf read'):
+        raw = utils.merge_time(utils.read_files(read_rsk, rskfiles,
+                                                window=window))
+
+    if raw.attrs.get('sampling_mode') == 'continuous':
+        if 'window_length' not in metadata:
+            raise ValueError('window_length must be specified in the config '
+                             'file for continuously sampled data')
+        raw = continuous_to_bursts(raw, metadata['window_length'],
+                                   metadata.get('window_overlap', 0))
+
+    if metadata.get('fill_gaps'):
+        # missing bursts, on the burst schedule unless given
+        raw = utils.normalize_time(
+            raw, freq=raw.attrs['burst_interval']
+            if metadata['fill_gaps'] is True else metadata['fill_gaps'])
+
+    ds = xr.Dataset()
+
+    ds = utils.write_metadata(ds, metadata)
+
+    ds = utils.add_clip_history(ds, window)
+
+    ds = provenance.add_inputs(ds, rskfiles)
+
+    for k in ['samples_per_burst', 'sample_interval', 'burst_interval',
+              'burst_length', 'serial_number']:
+        ds.attrs[k] = raw.attrs[k]
+    ds.attrs['INST_TYPE'] = 'RBR Virtuoso d|wave'
+
+    times = raw['time'].values
+    samples = raw['sample'].values
 
     ds['P_1'] = xr.DataArray(
-        a['pres'],
+        raw['P_1'].values,
         coords=[times, samples],
         dims=('time', 'sample'),
         name='Pressure',
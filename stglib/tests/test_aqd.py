@@ -0,0 +1,140 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+import xarray as xr
+from stglib.aqd import qaqc
+from stglib.core import utils
+
+
+class TestCoordTransform(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        N, M = 20, 5
+        self.ds = xr.Dataset(
+            {'VEL1': (('time', 'bindist'), rng.randn(N, M)),
+             'VEL2': (('time', 'bindist'), rng.randn(N, M)),
+             'VEL3': (('time', 'bindist'), rng.randn(N, M)),
+             'Heading': ('time', rng.uniform(0, 360, N)),
+             'Pitch': ('time', rng.uniform(-10, 10, N)),
+             'Roll': ('time', rng.uniform(-10, 10, N))},
+            attrs={'AQDCoordinateSystem': 'BEAM',
+                   'magnetic_variation': -12.3})
+        self.T = rng.randn(3, 3)
+
+    def test_beam_to_enu(self):
+        ds = self.ds
+        u, v, w = qaqc.coord_transform(
+            ds['VEL1'].values, ds['VEL2'].values, ds['VEL3'].values,
+            ds['Heading'].values, ds['Pitch'].values, ds['Roll'].values,
+            self.T, 'BEAM')
+
+        # one profile at a time, as in the original implementation
+        i = 7
+        hh, pp, rr = np.deg2rad([ds['Heading'][i] - 90, ds['Pitch'][i],
+                                 ds['Roll'][i]])
+        H = np.array([[np.cos(hh), np.sin(hh), 0],
+                      [-np.sin(hh), np.cos(hh), 0],
+                      [0, 0, 1]])
+        P = np.array([[np.cos(pp), -np.sin(pp) * np.sin(rr),
+                       -np.cos(rr) * np.sin(pp)],
+                      [0, np.cos(rr), -np.sin(rr)],
+                      [np.sin(pp), np.sin(rr) * np.cos(pp),
+                       np.cos(pp) * np.cos(rr)]])
+        vel = H @ P @ self.T @ np.array([ds['VEL1'][i], ds['VEL2'][i],
+                                         ds['VEL3'][i]])
+        np.testing.assert_allclose([u[i], v[i], w[i]], vel)
+
+    def test_fused_magvar(self):
+        fused = qaqc.transform_velocity(self.ds.copy(), self.T,
+                                        ('time', 'bindist'))
+        sep = self.ds.copy()
+        sep.attrs['separate_magvar'] = True
+        sep = qaqc.transform_velocity(sep, self.T, ('time', 'bindist'))
+        for k in ['U', 'V', 'W', 'Heading']:
+            np.testing.assert_allclose(fused[k], sep[k], atol=1e-12)
+        self.assertTrue((fused['Heading'] >= 0).all() and
+                        (fused['Heading'] < 360).all())
+
+    def test_separate_magvar_written(self):
+        # separate_magvar: true is written to the raw file as 1
+        fd, fname = tempfile.mkstemp(suffix='.cdf')
+        os.close(fd)
+        try:
+            utils.write_metadata(self.ds.copy(), {
+                'separate_magvar': True}).to_netcdf(fname)
+            with xr.open_dataset(fname) as ds:
+                self.assertEqual(ds.attrs['separate_magvar'], 1)
+                sep = qaqc.transform_velocity(ds.load(), self.T,
+                                              ('time', 'bindist'))
+            fused = qaqc.transform_velocity(self.ds.copy(), self.T,
+                                            ('time', 'bindist'))
+            np.testing.assert_allclose(fused['U'], sep['U'], atol=1e-12)
+        finally:
+            os.remove(fname)
+
+    def test_enu_magvar(self):
+        enu = self.ds.copy()
+        enu.attrs['AQDCoordinateSystem'] = 'ENU'
+        fused = qaqc.transform_velocity(enu.copy(), self.T,
+                                        ('time', 'bindist'))
+        enu.attrs['separate_magvar'] = True
+        sep = qaqc.transform_velocity(enu, self.T, ('time', 'bindist'))
+        for k in ['U', 'V', 'W']:
+            np.testing.assert_allclose(fused[k], sep[k], atol=1e-12)
+
+
+class TestTrimVel(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        N, M = 30, 20
+        self.ds = xr.Dataset(
+            {'U': (('time', 'bindist'), rng.randn(N, M)),
+             'V': (('time', 'bindist'), rng.randn(N, M)),
+             'W': (('time', 'bindist'), rng.randn(N, M)),
+             'AGC': (('time', 'bindist'),
+                     np.tile(100. - 3 * np.arange(M), (N, 1))),
+             'Pressure': ('time', rng.uniform(4, 6, N))},
+            {'bindist': 0.3 + 0.5 * np.arange(M)},
+            attrs={'AQDBeamAngle': 25, 'history': ''})
+
+    def test_water_level_sl(self):
+        ds = self.ds.copy()
+        ds.attrs['trim_method'] = 'water level sl'
+        trimmed = qaqc.trim_vel(ds)
+        expected = self.ds['U'].where(
+            self.ds['bindist'] <
+            self.ds['Pressure'] * np.cos(np.deg2rad(25)))
+        nbins = trimmed.sizes['bindist']
+        np.testing.assert_equal(trimmed['U'].values,
+                                expected.values[:, :nbins])
+        self.assertTrue(np.isnan(expected.values[:, nbins:]).all())
+        self.assertTrue(np.isfinite(expected.values[:, nbins - 1]).any())
+
+    def test_no_bins_trimmed(self):
+        # all bins are good; none should be removed
+        ds = self.ds.copy()
+        ds.attrs['trim_method'] = 'water level'
+        ds['Pressure'][:] = 100
+        self.assertEqual(qaqc.trim_vel(ds).sizes['bindist'], 20)
+
+    def test_amplitude(self):
+        ds = self.ds.copy()
+        ds.attrs['cutoff_ampl'] = 60
+        self.assertEqual(qaqc.trim_vel(ds).sizes['bindist'], 14)
+        # a cutoff of 0 is no cutoff, and is not recorded
+        ds = self.ds.copy()
+        ds.attrs['cutoff_ampl'] = 0
+        ds['AGC'][:, 15:] = 0
+        self.assertEqual(qaqc.trim_masks(ds), {})
+        self.assertEqual(qaqc.trim_vel(ds).attrs['history'], '')
+        ds = self.ds.copy()
+        ds.attrs['ampl_dropoff'] = 5
+        ds['AGC'][:, 10] = 80
+        self.assertEqual(qaqc.trim_vel(ds).sizes['bindist'], 11)
+
+
+if __name__ == '__main__':
+    unittest.main()
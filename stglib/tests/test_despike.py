@@ -0,0 +1,67 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+import xarray as xr
+from stglib.core import despike, utils
+from stglib.rsk import cdf2nc
+
+
+class TestDespike(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        t = np.arange(1024) * 0.5
+        self.clean = (10 + 0.3 * np.sin(2 * np.pi * t / 7.) +
+                      rng.normal(0, 0.005, (20, 1024)))
+        self.spikes = np.zeros(self.clean.shape, dtype=bool)
+        self.spikes[np.arange(20), rng.randint(1, 1023, 20)] = True
+        self.x = self.clean + 2 * self.spikes
+
+    def test_methods(self):
+        for method in despike.METHODS:
+            found = despike.find_spikes(self.x, method)
+            self.assertTrue((found[self.spikes]).all(), method)
+            self.assertLess((found & ~self.spikes).sum(), 5, method)
+
+    def test_fill(self):
+        y, n = despike.despike_array(self.x)
+        np.testing.assert_equal(n, np.ones(20))
+        np.testing.assert_allclose(y, self.clean, atol=0.1)
+
+    def test_interp_nan(self):
+        x = np.array([[np.nan, 1, np.nan, 3, np.nan], [np.nan] * 5])
+        np.testing.assert_equal(despike.interp_nan(x),
+                                [[1, 1, 2, 3, 3], [np.nan] * 5])
+
+
+class TestDespikeNc(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_cdf_to_nc(self):
+        # despike: true in the config survives the raw .cdf file as 1
+        rng = np.random.RandomState(0)
+        p = (5 + 0.2 * np.sin(np.arange(256) / 5.) +
+             rng.normal(0, 0.005, (10, 256)))
+        p[2, 100] += 3
+        ds = xr.Dataset(
+            {'P_1': (('time', 'sample'), p)},
+            coords={'time': pd.date_range('2018-01-01', periods=10,
+                                          freq='1h'),
+                    'sample': np.arange(256), 'lat': [40.], 'lon': [-70.],
+                    'depth': [10.]})
+        ds = utils.write_metadata(ds, {
+            'filename': os.path.join(self.dir, 'test'), 'despike': True,
+            'burst_interval': 3600, 'sample_interval': 0.25})
+        ds.to_netcdf(os.path.join(self.dir, 'test-raw.cdf'))
+
+        ds = cdf2nc.cdf_to_nc(os.path.join(self.dir, 'test-raw.cdf'))
+        np.testing.assert_equal(ds['P_1_spikes'].values, [0, 0, 1] + [0] * 7)
+        self.assertIn('Despiked P_1 using mad method', ds.attrs['history'])
@@ -0,0 +1,135 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+import xarray as xr
+from stglib import exo
+
+
+def write_exo(filnam, n=48, start='2018-01-01', freq='30min', skip=(),
+              encoding='utf-8', times=None):
+    """Write a small EXO .csv export with `n` half-hourly samples (or at
+    `times`), leaving out the samples in `skip`"""
+
+    if times is None:
+        times = pd.date_range(start, periods=n, freq=freq)
+    with open(filnam, 'w', encoding=encoding, newline='') as f:
+        f.write('"Kor Export File"\r\n'
+                '"Sonde ID","Sonde 12A345678"\r\n'
+                '"Wiped CT","11A111111","",1;2\r\n'
+                '"Depth Non-Vented 0-10m","11B222222","",3\r\n'
+                '\r\n')
+        f.write('Date (MM/DD/YYYY),Time (HH:MM:SS),Time (Fract. Sec),'
+                'Site Name,Temp °C,Cond mS/cm,Press psi a,Depth m,'
+                'Battery V\r\n')
+        for i, t in enumerate(times):
+            if i not in skip:
+                f.write('%s,%s,0,site,%.2f,40.000,%.3f,0.500,6.1\r\n' % (
+                    t.strftime('%m/%d/%Y'), t.strftime('%H:%M:%S'),
+                    10 + i / 10., 14.7 + i / 100.))
+
+    return times
+
+
+class TestExo(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.basefile = os.path.join(self.dir, 'exo')
+        self.times = write_exo(self.basefile + '.csv')
+        self.metadata = {'basefile': self.basefile,
+                         'filename': os.path.join(self.dir, 'test'),
+                         'initial_instrument_height': 0.5,
+                         'latitude': 40.,
+                         'longitude': -70.,
+                         'Deployment_date': '2018-01-01 05:00',
+                         'Recovery_date': '2018-01-01 15:00'}
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_window_lines(self):
+        encoding, nhdr = exo.sniff_exo(self.basefile + '.csv')
+        f = exo._window_lines(self.basefile + '.csv', nhdr,
+                              (self.times[3], self.times[5]))
+        lines = f.read().decode(encoding).splitlines()
+        self.assertTrue(lines[0].startswith(exo.DATA_HEADER))
+        self.assertEqual(len(lines), 4)
+
+    def test_sniff(self):
+        for encoding, sniffed in [('utf-8', 'utf-8'),
+                                  ('utf-8-sig', 'utf-8-sig'),
+                                  ('mac-roman', 'mac-roman'),
+                                  ('utf-16', 'utf-16')]:
+            write_exo(self.basefile + '.csv', encoding=encoding)
+            self.assertEqual(exo.sniff_exo(self.basefile + '.csv'),
+                             (sniffed, 5), encoding)
+            ds = exo.read_exo(self.basefile + '.csv')
+            self.assertIn('Temp_°C', ds, encoding)
+            self.assertEqual(ds.attrs['serial_number'], '12A345678')
+            # the window is found without decoding only for ASCII-compatible
+            # encodings; UTF-16 is decoded line by line
+            ds = exo.read_exo(self.basefile + '.csv',
+                              window=(self.times[3], self.times[5]))
+            np.testing.assert_equal(ds['time'].values,
+                                    self.times[3:6].values, encoding)
+
+        # no line of column names in the sniffed prefix
+        with open(self.basefile + '.csv', 'w') as f:
+            f.write('"Kor Export File"\n' * 30)
+        self.assertEqual(exo.sniff_exo(self.basefile + '.csv'), ('utf-8', 25))
+
+    def test_parse_header(self):
+        with open(self.basefile + '.csv', encoding='utf-8') as f:
+            hdr = exo.parse_exo_header(f.readlines()[:5])
+        self.assertEqual(hdr['serial_number'], '12A345678')
+        self.assertEqual(hdr['Wiped CT'], {'sensor_serial_number': '11A111111',
+                                           'data_columns': [1, 2]})
+        self.assertEqual(hdr['Depth Non-Vented 0-10m']['data_columns'], [3])
+
+    def test_clip_on_read(self):
+        self.metadata['clip_on_read'] = True
+        exo.csv_to_cdf(self.metadata)
+
+        with xr.open_dataset(self.metadata['filename'] + '-raw.cdf') as ds:
+            np.testing.assert_equal(ds['time'].values,
+                                    self.times[10:31].values)
+            self.assertEqual(ds.attrs['clip_on_read'], 1)
+            self.assertIn('clipped on read', ds.attrs['history'])
+
+        self.metadata['Deployment_date'] = '2019-01-01'
+        self.metadata['Recovery_date'] = '2019-02-01'
+        with self.assertRaisesRegex(ValueError, 'clip_on_read'):
+            exo.csv_to_cdf(self.metadata)
+
+    def test_fill_gaps(self):
+        write_exo(self.basefile + '.csv', skip=(3, 4, 20))
+        for fill_gaps, n in [(True, 48), (False, 45), (1800, 48)]:
+            self.metadata['fill_gaps'] = fill_gaps
+            exo.csv_to_cdf(self.metadata)
+            with xr.open_dataset(self.metadata['filename'] +
+                                 '-raw.cdf') as ds:
+                self.assertEqual(ds.sizes['time'], n, fill_gaps)
+                if fill_gaps:
+                    np.testing.assert_equal(ds['time'].values,
+                                            self.times.values)
+                    self.assertTrue(
+                        np.isnan(ds['Temp_°C'][[3, 4, 20]]).all())
+
+    def test_spb(self):
+        # six bursts of four samples, one second apart, every half hour
+        times = (pd.date_range('2018-01-01', periods=6, freq='30min')
+                 .repeat(4) + pd.to_timedelta(np.tile(np.arange(4), 6), 's'))
+        write_exo(self.basefile + '.csv', times=times)
+        self.metadata['spb'] = True
+        exo.csv_to_cdf(self.metadata)
+
+        with xr.open_dataset(self.metadata['filename'] + '-raw.cdf') as ds:
+            self.assertEqual(ds['Temp_°C'].shape, (6, 4))
+            self.assertEqual(ds.attrs['spb'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
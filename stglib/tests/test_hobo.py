@@ -0,0 +1,34 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+from stglib import hobo
+
+
+class TestHobo(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.filnam = tempfile.mkstemp(suffix='.csv')
+        with os.fdopen(fd, 'w') as f:
+            f.write('"Plot Title: 10761"\n'
+                    '"#","Date Time, GMT-04:00","Abs Pres, kPa","Temp, C"\n'
+                    '\n')
+            for n in range(1, 11):
+                f.write('%d,07/20/17 %02d:00:00 AM,%.1f,20.0\n' % (
+                    n, n, 101 + n / 10.))
+                if n == 5:
+                    f.write('\n')
+            f.write('\n"Logged","End Of File"\n')
+
+    def tearDown(self):
+        os.remove(self.filnam)
+
+    def test_blank_lines(self):
+        for skiprows in [3, [0, 1]]:
+            ds = hobo.read_hobo(self.filnam, skiprows=skiprows)
+            self.assertEqual(ds.sizes['time'], 10)
+            np.testing.assert_allclose(ds['abspres_kPa'][-1], 102)
+
+
+if __name__ == '__main__':
+    unittest.main()
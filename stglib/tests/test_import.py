@@ -0,0 +1,43 @@
+import json
+import subprocess
+import sys
+import unittest
+
+# modules that are slow to import and should only be loaded when needed
+HEAVY = ['numpy', 'pandas', 'xarray', 'scipy', 'matplotlib', 'netCDF4',
+         'sqlite3']
+
+
+def run_import(stmt):
+    """Run import statement in a fresh interpreter and report what it loaded"""
+    code = ('import sys, json\n'
+            '%s\n'
+            'print(json.dumps({"modules": sorted(sys.modules)}))\n') % stmt
+    out = subprocess.check_output([sys.executable, '-c', code])
+    return json.loads(out.decode().splitlines()[-1])
+
+
+class TestImport(unittest.TestCase):
+
+    def test_import_is_lazy(self):
+        res = run_import('import stglib')
+        for mod in HEAVY:
+            self.assertNotIn(mod, res['modules'])
+        # nor any of the package's own submodules
+        self.assertEqual([m for m in res['modules']
+                          if m.startswith('stglib.')], [])
+
+    def test_submodule_defers_heavy_deps(self):
+        res = run_import('import stglib; stglib.hobo; stglib.cmd')
+        for mod in ['scipy', 'matplotlib', 'netCDF4', 'sqlite3']:
+            self.assertNotIn(mod, res['modules'])
+
+    def test_lazy_attributes(self):
+        import stglib
+        self.assertTrue(callable(stglib.read_globalatts))
+        self.assertIs(stglib.utils, stglib.core.utils)
+        with self.assertRaises(AttributeError):
+            stglib.notamodule
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+import scipy.stats
+import xarray as xr
+from stglib import indexvel
+
+
+class TestRating(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.veli = rng.uniform(-1, 1, (3, 30))
+        self.Vca = 0.05 + 0.9 * self.veli + 0.02 * rng.randn(3, 30)
+        # ragged sets
+        self.veli[1, 20:] = np.nan
+
+    def test_ols_matches_linregress(self):
+        rating = indexvel.fit_rating(self.veli, self.Vca)
+        for s in range(3):
+            good = np.isfinite(self.veli[s])
+            lr = scipy.stats.linregress(self.veli[s, good], self.Vca[s, good])
+            np.testing.assert_allclose(rating['coef'][s],
+                                       [lr.intercept, lr.slope])
+            np.testing.assert_allclose(np.sqrt(rating['cov'][s, 1, 1]),
+                                       lr.stderr)
+            np.testing.assert_allclose(rating['r2'][s], lr.rvalue**2)
+
+    def test_robust(self):
+        Vca = self.Vca.copy()
+        Vca[:, :3] = 5
+        for method in ['huber', 'theilsen']:
+            rating = indexvel.fit_rating(self.veli, Vca, method=method)
+            np.testing.assert_allclose(rating['coef'][:, 1], 0.9, atol=0.05)
+
+    def test_predict(self):
+        rating = indexvel.fit_rating(self.veli, self.Vca)
+        Vca, ci, pi = indexvel.predict_rating(rating, [0, 0.5],
+                                              which=[0, 2])
+        np.testing.assert_allclose(
+            Vca, [rating['coef'][0, 0], rating['coef'][2] @ [1, 0.5]])
+        self.assertTrue((pi > ci).all())
+
+    def test_apply_units(self):
+        rating = indexvel.fit_rating(self.veli, self.Vca)
+        ds = xr.Dataset(
+            {'FlowData_Vel_Mean': ('time', [0.1, 0.5], {'units': 'm/s'}),
+             'FlowData_Area': ('time', [10., 11.], {'units': 'm2'}),
+             'FlowData_Stage': ('time', [1., 1.1], {'units': 'm'})})
+        ds = indexvel.apply_rating(ds, rating)
+        for k in ['Vca', 'Vca_ci', 'Vca_pi']:
+            self.assertEqual(ds[k].attrs['units'], 'm/s')
+        for k in ['Q', 'Q_ci', 'Q_pi']:
+            self.assertEqual(ds[k].attrs['units'], 'm3 s-1')
+        np.testing.assert_allclose(ds['Q'], ds['Vca'] * ds['FlowData_Area'])
+
+        self.assertEqual(indexvel.discharge_units('ft^2', 'ft/s'), 'ft3 s-1')
+        self.assertEqual(indexvel.discharge_units('m2', 'cm/s'), 'm2 cm s-1')
+        self.assertIsNone(indexvel.discharge_units(None, 'm/s'))
+
+
+QREV = """<?xml version="1.0" encoding="UTF-8"?>
+<Channel>
+<SiteInformation><Filename>site</Filename></SiteInformation>
+<Transect><Filename type="char">a.mmt</Filename>
+<StartDateTime type="date">05/10/2017 10:00:00</StartDateTime>
+<EndDateTime type="date">05/10/2017 10:10:00</EndDateTime>
+<Discharge><Top>1</Top><Total unitsCode="cms">12.5</Total></Discharge>
+<Other><Area unitsCode="sm">40.2</Area></Other></Transect>
+<Transect><Filename type="char">b.mmt</Filename>
+<StartDateTime type="date">05/10/2017 10:20:00</StartDateTime>
+<EndDateTime type="date">05/10/2017 10:30:00</EndDateTime>
+<Discharge><Total unitsCode="cms">13.5</Total></Discharge>
+<Other><Area unitsCode="sm">41.2</Area></Other></Transect>
+<Summary><Total><Discharge><Total>99</Total></Discharge></Total></Summary>
+</Channel>
+"""
+
+
+class TestQrev(unittest.TestCase):
+
+    def test_read_qrev_xml(self):
+        fd, filename = tempfile.mkstemp(suffix='.xml')
+        with os.fdopen(fd, 'w') as f:
+            f.write(QREV)
+        try:
+            adcp = indexvel.read_qrev_xml(filename, negateq=True)
+        finally:
+            os.remove(filename)
+
+        np.testing.assert_equal(adcp['q'], [-12.5, -13.5])
+        np.testing.assert_equal(adcp['AreaQrev'], [40.2, 41.2])
+        np.testing.assert_equal(adcp['filename'], ['a.mmt', 'b.mmt'])
+        np.testing.assert_equal(
+            adcp['time'].values,
+            np.array(['2017-05-10T10:05', '2017-05-10T10:25'],
+                     dtype='datetime64[ns]'))
+
+
+if __name__ == '__main__':
+    unittest.main()
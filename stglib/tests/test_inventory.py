@@ -0,0 +1,85 @@
+import os
+import shutil
+import tempfile
+import unittest
+import pandas as pd
+from stglib.core import inventory
+from test_exo import write_exo
+
+
+class TestInventory(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        with open(os.path.join(self.dir, 'test.sen'), 'w') as f:
+            for n in range(90):
+                f.write('07 20 2017 %02d %02d 00 00000000 00000000  12.3 '
+                        '1500.0 123.4  -1.2   0.4  10.123\n' % divmod(n, 60))
+        with open(os.path.join(self.dir, 'notes.txt'), 'w') as f:
+            f.write('not a raw file\n')
+        with open(os.path.join(self.dir, 'table.csv'), 'w') as f:
+            f.write('a,b\n1,2\n3,4\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_sen(self):
+        df = inventory.inventory(self.dir)
+        self.assertEqual(len(df), 1)
+        row = df.iloc[0]
+        self.assertEqual(row['instrument'], 'aqd')
+        self.assertEqual(row['start'], pd.Timestamp('2017-07-20 00:00'))
+        self.assertEqual(row['stop'], pd.Timestamp('2017-07-20 01:29'))
+        self.assertEqual(row['records'], 90)
+        self.assertFalse(row['records_estimated'])
+        self.assertTrue(pd.isna(row['error']))
+
+    def test_csv(self):
+        write_exo(os.path.join(self.dir, 'exo.csv'))
+        write_exo(os.path.join(self.dir, 'exo_long.csv'), n=5000)
+        with open(os.path.join(self.dir, 'hobo.csv'), 'w') as f:
+            f.write('"Plot Title: 10761"\n'
+                    '"#","Date Time, GMT-04:00","Abs Pres, kPa","Temp, C"\n')
+            for n in range(1, 11):
+                f.write('%d,07/20/17 %02d:00:00 AM,101.3,20.0\n' % (n, n))
+            f.write('"Logged","End Of File"\n')
+        with open(os.path.join(self.dir, 'eco.csv'), 'w') as f:
+            for n in range(20):
+                f.write('07/20/17\t10:%02d:00\t700\t%d\t544\n' % (n, n))
+            f.write('Done\n')
+        # an EXO file whose data cannot be read is an error, not another
+        # instrument
+        with open(os.path.join(self.dir, 'exo_bad.csv'), 'w') as f:
+            f.write('Date (MM/DD/YYYY),Time (HH:MM:SS)\n')
+
+        df = inventory.inventory(self.dir).set_index('file')
+        df.index = [os.path.basename(f) for f in df.index]
+        self.assertEqual(sorted(df.index), ['eco.csv', 'exo.csv',
+                                            'exo_bad.csv', 'exo_long.csv',
+                                            'hobo.csv', 'test.sen'])
+
+        self.assertEqual(list(df.loc[['exo.csv', 'exo_long.csv', 'hobo.csv',
+                                      'eco.csv'], 'instrument']),
+                         ['exo', 'exo', 'hobo', 'eco'])
+        self.assertEqual(df.loc['exo.csv', 'records'], 48)
+        self.assertFalse(df.loc['exo.csv', 'records_estimated'])
+        self.assertEqual(df.loc['exo.csv', 'stop'],
+                         pd.Timestamp('2018-01-01 23:30'))
+        self.assertTrue(df.loc['exo_long.csv', 'records_estimated'])
+        # later lines are a little longer
+        self.assertAlmostEqual(df.loc['exo_long.csv', 'records'], 5000,
+                               delta=100)
+        self.assertEqual(df.loc['hobo.csv', 'records'], 10)
+        self.assertEqual(df.loc['hobo.csv', 'stop'],
+                         pd.Timestamp('2017-07-20 10:00'))
+        self.assertEqual(df.loc['eco.csv', 'records'], 20)
+        self.assertEqual(df.loc['eco.csv', 'start'],
+                         pd.Timestamp('2017-07-20 10:00'))
+
+        self.assertTrue(pd.isna(df.loc['exo_bad.csv', 'instrument']))
+        self.assertIn('ValueError', df.loc['exo_bad.csv', 'error'])
+        self.assertTrue(df.drop('exo_bad.csv')['error'].isna().all())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,186 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import scipy.io
+import xarray as xr
+from stglib import iq
+from stglib.core import utils
+
+try:
+    import h5py
+except ImportError:
+    h5py = None
+
+
+def write_mat73(filnam, variables):
+    """Write a MATLAB v7.3 file of `variables`, a dict of arrays (in MATLAB
+    order), strings, and dicts (structs)"""
+
+    def write(group, name, value):
+        if isinstance(value, dict):
+            sub = group.create_group(name)
+            sub.attrs['MATLAB_class'] = np.bytes_('struct')
+            for k, v in value.items():
+                write(sub, k, v)
+        elif isinstance(value, str):
+            group[name] = np.array([[ord(c) for c in value]], dtype='u2')
+            group[name].attrs['MATLAB_class'] = np.bytes_('char')
+        else:
+            value = np.asarray(value, dtype=float)
+            if value.ndim == 1:
+                value = value[:, None]
+            # HDF5 stores MATLAB arrays transposed
+            group[name] = value.T
+            group[name].attrs['MATLAB_class'] = np.bytes_('double')
+
+    with h5py.File(filnam, 'w', userblock_size=512) as f:
+        for k, v in variables.items():
+            write(f, k, v)
+    with open(filnam, 'r+b') as f:
+        f.write(b'MATLAB 7.3 MAT-file, Platform: GLNXA64')
+
+
+def iq_variables(n=20):
+    """Variables of a small SonTek IQ export"""
+
+    rng = np.random.RandomState(0)
+    return {
+        'FlowData_SampleTime': 5.7e14 + 60e6 * np.arange(n),
+        'FlowData_Depth': 1 + rng.uniform(0, 0.1, n),
+        'FlowData_Vel_Mean': rng.normal(0, 0.3, n),
+        'FlowData_Vel': rng.normal(0, 0.3, (n, 4)),
+        'Profile_0_Vel': rng.normal(0, 0.3, (n, 10)),
+        'FlowSubData_CellSize': np.full(n + 1, 0.05),
+        'Data_Units': {'FlowData_Depth': 'm', 'FlowData_Vel_Mean': 'm/s'},
+        'System_IqSetup': {'basicSetup': {'SiteName': 'site',
+                                          'spare1': 0.}},
+        'System_Id': {'SerialNumber': 'IQ1234'},
+        'System_IqState': {'CellSize': 0.05}}
+
+
+@unittest.skipIf(h5py is None, 'h5py is not installed')
+class TestMat73(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.filnam = os.path.join(self.dir, 'iq.mat')
+        self.variables = iq_variables()
+        write_mat73(self.filnam, self.variables)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_loadmat(self):
+        self.assertTrue(utils.is_mat73(self.filnam))
+        self.assertEqual(utils.matvars(self.filnam)['Profile_0_Vel'],
+                         (20, 10))
+        mat = utils.loadmat(self.filnam, variable_names=['Profile_0_Vel',
+                                                         'System_Id'])
+        self.assertEqual(sorted(mat), ['Profile_0_Vel', 'System_Id'])
+        np.testing.assert_equal(mat['Profile_0_Vel'],
+                                self.variables['Profile_0_Vel'])
+        self.assertEqual(mat['System_Id']['SerialNumber'], 'IQ1234')
+
+    def test_open_mat(self):
+        with utils.open_mat(self.filnam) as mat:
+            vel = mat['Profile_0_Vel']
+            self.assertIsInstance(vel, utils.MatH5Array)
+            self.assertEqual(vel.shape, (20, 10))
+            np.testing.assert_equal(vel[2:5, 3],
+                                    self.variables['Profile_0_Vel'][2:5, 3])
+            np.testing.assert_equal(np.asarray(mat['FlowData_Depth']),
+                                    self.variables['FlowData_Depth'])
+        # closed on exit
+        self.assertFalse(vel.dset.id.valid)
+
+    def test_read_iq_groups(self):
+        ds = iq.read_iq(self.filnam, groups=['FlowData'])
+        self.assertIn('FlowData_Vel', ds)
+        self.assertNotIn('Profile_0_Vel', ds)
+        self.assertNotIn('FlowSubData_CellSize', ds)
+        self.assertEqual(ds['FlowData_Depth'].attrs['units'], 'm')
+        self.assertEqual(ds.attrs['SerialNumber'], 'IQ1234')
+
+        ds = iq.read_iq(self.filnam)
+        self.assertEqual(ds['Profile_0_Vel'].dims, ('time', 'beamdist_0_1'))
+        np.testing.assert_equal(ds['Profile_0_Vel'].values,
+                                self.variables['Profile_0_Vel'])
+        self.assertNotIn('FlowSubData_CellSize', ds)
+
+
+class TestBeamdist(unittest.TestCase):
+
+    def test_make_beamdist(self):
+        time = np.arange('2018-01-01T00', '2018-01-01T05',
+                         dtype='datetime64[h]').astype('datetime64[ns]')
+        ds = xr.Dataset(coords={'time': time,
+                                'beamdist_0_1': np.arange(4),
+                                'beamdist_2_3': np.arange(3)})
+        for bm in range(4):
+            ds['FlowSubData_PrfHeader_%d_BlankingDistance' % bm] = (
+                'time', np.full(5, 0.1 * bm))
+            ds['FlowSubData_PrfHeader_%d_CellSize' % bm] = (
+                'time', np.linspace(0.1, 0.2, 5))
+        ds = iq.make_beamdist(ds)
+
+        for bm, ncells in enumerate([4, 4, 3, 3]):
+            cells = ds['cells_%d' % bm]
+            self.assertEqual(cells.shape, (5, ncells))
+            np.testing.assert_allclose(
+                cells, 0.1 * bm + np.linspace(0.1, 0.2, 5)[:, None] *
+                np.arange(ncells))
+            self.assertEqual(ds['time_%d' % bm].shape, (5, ncells))
+            np.testing.assert_equal(ds['time_%d' % bm].values,
+                                    np.tile(time[:, None], (1, ncells)))
+        # beams with the same cells share a time array
+        self.assertTrue(np.shares_memory(ds['time_0'].values,
+                                         ds['time_1'].values))
+
+
+class TestPipeline(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.variables = iq_variables()
+        self.variables['FlowData_Depth'][3] = iq.SENTINEL
+        self.variables['Profile_0_Amp'] = np.tile(
+            np.arange(10, dtype='i4'), (20, 1))
+        self.variables['Profile_0_Amp'][5, 2] = iq.SENTINEL
+        os.makedirs(os.path.join(self.dir, 'site'))
+        scipy.io.savemat(os.path.join(self.dir, 'site', 'iq.mat'),
+                         self.variables)
+        self.metadata = {'basefile': 'iq',
+                         'prefix': os.path.join(self.dir, 'site') + os.sep,
+                         'filename': '10761iq',
+                         'initial_instrument_height': 0.1,
+                         'latitude': 40.,
+                         'longitude': -70.}
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_mat_to_nc(self):
+        iq.mat_to_cdf(self.metadata)
+        cdf = os.path.join(self.dir, 'site', '10761iq-raw.cdf')
+        with xr.open_dataset(cdf) as raw:
+            self.assertNotIn('epic_time', raw)
+            self.assertEqual(raw.sizes['time'], 20)
+
+        ds = iq.cdf_to_nc(cdf)
+        nc = os.path.join(self.dir, 'site', '10761iq-a.nc')
+        self.assertTrue(np.isnan(ds['FlowData_Depth'][3]))
+        np.testing.assert_allclose(
+            ds['FlowData_Vel_Mean'],
+            self.variables['FlowData_Vel_Mean'] / 1000)
+        # integer variables stay integers, with the sentinel as fill value
+        self.assertEqual(ds['Profile_0_Amp'].dtype, np.int32)
+        with xr.open_dataset(nc, decode_times=False) as out:
+            self.assertEqual(out['time'].attrs['units'], 'True Julian Day')
+            self.assertTrue(np.isnan(out['Profile_0_Amp'][5, 2]))
+            self.assertEqual(out['Profile_0_Amp'][5, 3], 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import os
+import shutil
+import tempfile
+import unittest
+import netCDF4
+import numpy as np
+from stglib.core import lowpass
+
+
+class TestLowpass(unittest.TestCase):
+
+    def setUp(self):
+        # 60 days of 15-minute samples: a slow signal plus M2 and K1 tides
+        self.dt = 0.25
+        t = np.arange(60 * 96) * self.dt
+        self.slow = 0.2 * np.sin(2 * np.pi * t / (10 * 24.))
+        self.x = (self.slow + np.cos(2 * np.pi * t / 12.42) +
+                  0.5 * np.cos(2 * np.pi * t / 23.93))
+        self.x[2000:2010] = np.nan
+
+    def test_tides_removed(self):
+        # away from the ends and the gap
+        m = lowpass.halfwidth(self.dt, 'pl33')
+        ok = np.zeros(len(self.x), dtype=bool)
+        ok[m:2000 - m] = ok[2010 + m:-m] = True
+        for method in lowpass.METHODS:
+            y = lowpass.filter_array(self.x, self.dt, method)
+            # the Butterworth filter rolls off more slowly, passing some K1
+            np.testing.assert_allclose(y[ok], self.slow[ok], err_msg=method,
+                                       atol=0.05 if method == 'butter'
+                                       else 0.02)
+            self.assertTrue(np.isnan(y[2000:2010]).all(), method)
+
+    def test_chunked(self):
+        # FIR filters match exactly; the Butterworth response is truncated at
+        # the overlap, leaving an error of a few 1e-6 here
+        atol = {'pl33': 1e-12, 'godin': 1e-12, 'butter': 1e-5}
+        x = np.column_stack([self.x, 2 * self.x])
+        for method in lowpass.METHODS:
+            whole = lowpass.filter_array(x, self.dt, method)
+            for chunksize in [1000, 3000]:
+                out = np.full(x.shape, np.nan)
+
+                def write(start, stop, values):
+                    out[start:stop] = values
+
+                lowpass.filter_chunked(lambda a, b: x[a:b], write, len(x),
+                                       self.dt, method, chunksize=chunksize)
+                np.testing.assert_allclose(out, whole, rtol=0,
+                                           atol=atol[method],
+                                           err_msg='%s %d' % (method,
+                                                              chunksize))
+
+    def test_filter_nc(self):
+        tmp = tempfile.mkdtemp()
+        filename = os.path.join(tmp, '10761sc-a.nc')
+        x = np.column_stack([self.x, 2 * self.x])
+        # EPIC time: true Julian day and milliseconds since midnight
+        ms = np.arange(len(x)) * self.dt * 3600000
+        try:
+            with netCDF4.Dataset(filename, 'w') as nc:
+                nc.createDimension('time', None)
+                nc.createDimension('depth', 2)
+                nc.createVariable('time', 'i4', ('time',))[:] = (
+                    2458000 + ms // 86400000)
+                nc.createVariable('time2', 'i4', ('time',))[:] = (
+                    ms % 86400000)
+                v = nc.createVariable('u_1205', 'f4', ('time', 'depth'),
+                                      fill_value=1e35)
+                v[:] = np.ma.masked_invalid(x)
+                v.units = 'cm/s'
+                v.minimum = -1.
+                nc.history = 'Processed. '
+
+            for _ in range(2):
+                # a second run overwrites the filtered variable
+                lowpass.filter_nc(filename, ['u_1205'], chunksize=1000)
+
+            whole = lowpass.filter_array(x.astype('f4'), self.dt)
+            with netCDF4.Dataset(filename) as nc:
+                out = nc['u_1205_lp']
+                self.assertEqual(out.dimensions, ('time', 'depth'))
+                self.assertEqual(out.units, 'cm/s')
+                self.assertNotIn('minimum', out.ncattrs())
+                self.assertIn('PL33', out.note)
+                np.testing.assert_allclose(
+                    np.ma.filled(out[:].astype(float), np.nan), whole,
+                    atol=1e-5)
+                self.assertEqual(nc.history.count('Low-pass'), 2)
+        finally:
+            shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    unittest.main()
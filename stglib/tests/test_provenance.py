@@ -0,0 +1,72 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+import xarray as xr
+from stglib.core import provenance, utils
+
+
+class TestProvenance(unittest.TestCase):
+
+    def test_config_hash(self):
+        self.assertEqual(provenance.config_hash({'a': 1, 'b': [1, 2]}),
+                         provenance.config_hash({'b': [1, 2], 'a': 1}))
+        self.assertNotEqual(provenance.config_hash({'a': 1}),
+                            provenance.config_hash({'a': 2}))
+
+    def test_inputs(self):
+        fd, fname = tempfile.mkstemp()
+        os.write(fd, b'abc')
+        os.close(fd)
+        try:
+            ds = xr.Dataset(attrs={'checksum_inputs': True})
+            ds = provenance.add_inputs(ds, fname)
+            self.assertIn('(3 bytes, sha1 '
+                          'a9993e364706816aba3e25717850c26c9cd0d89d)',
+                          ds.attrs['stglib_inputs'])
+        finally:
+            os.remove(fname)
+
+    def test_write(self):
+        fd, fname = tempfile.mkstemp()
+        os.write(fd, b'abc')
+        os.close(fd)
+        ncname = fname + '.cdf'
+        metadata = {'checksum_inputs': True, 'instmeta': {}}
+        try:
+            with mock.patch.object(provenance, 'config_hash',
+                                   wraps=provenance.config_hash) as h:
+                ds = utils.write_metadata(xr.Dataset(), metadata)
+                ds = utils.write_metadata(ds, {'AQDSerial': 'X'})
+                self.assertEqual(h.call_count, 1)
+            ds = provenance.add_inputs(ds, fname)
+            ds.to_netcdf(ncname)
+            with xr.open_dataset(ncname) as ds:
+                self.assertEqual(ds.attrs['checksum_inputs'], 1)
+                self.assertIn('sha1', ds.attrs['stglib_inputs'])
+                # the option still works when read back as an integer
+                self.assertIn('sha1', provenance.add_inputs(
+                    ds, fname).attrs['stglib_inputs'])
+        finally:
+            os.remove(fname)
+            if os.path.exists(ncname):
+                os.remove(ncname)
+
+    def test_timings(self):
+        provenance.reset_timings()
+        with provenance.timed('read'):
+            pass
+        ds = provenance.add_timings(xr.Dataset())
+        self.assertTrue(ds.attrs['stglib_timings'].startswith('read '))
+        self.assertEqual(len(provenance._timings), 0)
+
+    def test_reset_timings(self):
+        # a failed job must not leave its timings to the next one
+        with self.assertRaises(ValueError):
+            with provenance.timed('failed'):
+                raise ValueError
+        provenance.reset_timings()
+        with provenance.timed('read'):
+            pass
+        ds = provenance.add_timings(xr.Dataset())
+        self.assertNotIn('failed', ds.attrs['stglib_timings'])
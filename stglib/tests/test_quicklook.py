@@ -0,0 +1,58 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+import xarray as xr
+from stglib import quicklook
+
+
+class TestQuicklook(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.time = pd.date_range('2018-01-01', periods=5000, freq='1min')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_minmax_decimate(self):
+        y = np.zeros(len(self.time))
+        y[1234] = 10
+        x, yd = quicklook.minmax_decimate(self.time, y, 100)
+        self.assertEqual(len(yd), 200)
+        # the spike survives decimation
+        self.assertEqual(yd.max(), 10)
+
+    def test_aqd_two_bins(self):
+        import matplotlib
+        backend = matplotlib.get_backend()
+
+        rng = np.random.RandomState(0)
+        n = len(self.time)
+        data = {'Pressure': ('time', 5 + rng.normal(0, 0.1, n))}
+        for k in ['Heading', 'Pitch', 'Roll']:
+            data[k] = ('time', np.zeros(n))
+        for k in ['1', '2', '3']:
+            data['VEL' + k] = (('time', 'bindist'), rng.normal(0, 1, (n, 2)))
+            data['AMP' + k] = (('time', 'bindist'), rng.uniform(0, 100,
+                                                                (n, 2)))
+        data['TransMatrix'] = (('inst_row', 'inst_col'), np.eye(3))
+        xr.Dataset(data, coords={'time': self.time, 'bindist': [0.5, 1.],
+                                 'inst_row': range(3), 'inst_col': range(3)},
+                   attrs={'AQDCoordinateSystem': 'ENU',
+                          'orientation': 'UP'}).to_netcdf(
+            os.path.join(self.dir, '10761aqd-raw.cdf'))
+
+        saved = quicklook.make_quicklook(
+            os.path.join(self.dir, '10761aqd-raw.cdf'))
+        self.assertEqual(len(saved), 4)
+        for f in saved:
+            self.assertTrue(os.path.exists(f))
+        # the caller's backend is left alone
+        self.assertEqual(matplotlib.get_backend(), backend)
+
+
+if __name__ == '__main__':
+    unittest.main()
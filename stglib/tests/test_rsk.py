@@ -0,0 +1,83 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+import xarray as xr
+from stglib.core import utils
+from stglib.rsk import rsk2cdf, cdf2nc, nc2diwasp
+
+
+class TestBurstWindow(unittest.TestCase):
+
+    def setUp(self):
+        # ten bursts of four 0.5 s samples, every minute
+        self.conn = sqlite3.connect(':memory:')
+        self.conn.execute('CREATE TABLE burstdata (tstamp INTEGER)')
+        t0 = pd.Timestamp('2018-01-01').value // 10**6
+        self.conn.executemany(
+            'INSERT INTO burstdata VALUES (?)',
+            [(t0 + b * 60000 + s * 500,) for b in range(10) for s in range(4)])
+
+    def tearDown(self):
+        self.conn.close()
+
+    def test_whole_bursts(self):
+        lo, hi = rsk2cdf.burst_window(
+            self.conn, (pd.Timestamp('2018-01-01 00:01:30'),
+                        pd.Timestamp('2018-01-01 00:04:00')), 4, 500, 60000)
+        t = [r[0] for r in self.conn.execute(
+            'SELECT tstamp FROM burstdata WHERE tstamp BETWEEN ? AND ?',
+            (lo, hi))]
+        # the bursts starting at 2, 3, and 4 minutes, complete
+        self.assertEqual(len(t), 12)
+        self.assertEqual(pd.to_datetime(t[0], unit='ms'),
+                         pd.Timestamp('2018-01-01 00:02'))
+
+
+class TestNcToDiwasp(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_variables(self):
+        rng = np.random.RandomState(0)
+        time = pd.date_range('2018-01-01', periods=10, freq='1h')
+        ds = xr.Dataset(
+            {'P_1': (('time', 'sample'), 5 + rng.normal(0, 0.1, (10, 64)))},
+            coords={'time': time, 'sample': np.arange(64), 'lat': [40.],
+                    'lon': [-70.], 'depth': [10.]})
+        ds = utils.write_metadata(ds, {
+            'filename': os.path.join(self.dir, 'test'), 'despike': True,
+            'burst_interval': 3600, 'sample_interval': 0.25,
+            'initial_instrument_height': 0.2, 'WATER_DEPTH': 10.,
+            'serial_number': 'X', 'INST_TYPE': 'RBR Virtuoso d|wave'})
+        ds.to_netcdf(os.path.join(self.dir, 'test-raw.cdf'))
+        nc = cdf2nc.cdf_to_nc(os.path.join(self.dir, 'test-raw.cdf'))
+
+        freq = np.linspace(0.05, 0.5, 8)
+        xr.Dataset({'wp_peak': ('time', np.full(10, 5.)),
+                    'wh_4061': ('time', np.full(10, 0.5)),
+                    'wp_4060': ('time', np.full(10, 4.)),
+                    'frequency': ('frequency', freq),
+                    'pspec': (('time', 'frequency'), np.ones((10, 8)))}
+                   ).to_netcdf(nc.attrs['filename'][:-2] + 'diwasp.nc')
+        ds = nc2diwasp.nc_to_diwasp(os.path.join(self.dir, 'testb-cal.nc'))
+
+        # everything but the sample-resolution pressure is carried through,
+        # including the per-burst spike counts
+        self.assertIn('P_1_spikes', ds)
+        for k in ['P_1', 'P_1ac', 'sample']:
+            self.assertNotIn(k, ds.variables)
+        for k in nc.data_vars:
+            if k not in ['P_1', 'P_1ac']:
+                self.assertIn(k, ds.variables)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,138 @@
+import unittest
+import numpy as np
+import pandas as pd
+import xarray as xr
+from stglib.core import tide
+
+
+def ttide_astron(time):
+    """Mean lunar time and s, h, p, and N (degrees) from the polynomials of
+    Schureman (1958) as in t_tide's t_astron.m, independent of the Meeus
+    (1998) expressions used by :py:func:`tide.astronomical`"""
+
+    jd = pd.DatetimeIndex(np.ravel(time)).to_julian_date().values
+    d = jd - 2415020.
+    args = np.array([np.ones_like(d), d, (d / 1e4) ** 2, (d / 1e4) ** 3])
+    s = np.dot([270.434164, 13.1763965268, -0.0000850, 0.000000039], args)
+    h = np.dot([279.696678, 0.9856473354, 0.00002267, 0], args)
+    p = np.dot([334.329556, 0.1114040803, -0.0007739, -0.00000026], args)
+    N = -np.dot([-259.183275, 0.0529539222, -0.0001557, -0.000000050], args)
+    tau = 360 * (np.mod(jd, 1) - 0.5) + h - s
+
+    return np.mod([tau, s, h, p, N], 360)
+
+
+class TestTide(unittest.TestCase):
+
+    def setUp(self):
+        self.time = pd.date_range('2018-03-01', periods=200 * 96,
+                                  freq='15min')
+        self.names = list(tide.CONSTITUENTS)
+        self.amp = np.linspace(1, 0.1, len(self.names))
+        self.phase = np.arange(len(self.names)) * 30. + 10
+
+    def test_equilibrium(self):
+        # S2 is in phase with the mean sun at Greenwich
+        ref, f, vu = tide.nodal(pd.Timestamp('2018-03-01').value,
+                                pd.Timestamp('2018-03-02').value, ('S2',))
+        self.assertAlmostEqual(f[0], 1)
+        self.assertAlmostEqual(vu[0], 0)
+
+    def test_astronomical(self):
+        for t in ['1950-06-01 03:00', '2018-03-01', '2040-11-17 17:30']:
+            np.testing.assert_allclose(tide.astronomical(t),
+                                       np.ravel(ttide_astron(t)), atol=0.005)
+
+    def test_nodal_range(self):
+        # ranges of f and u over the nodal cycle (Pugh, 1987, Table 4.3)
+        for name, f, u in [('M2', (0.963, 1.038), 2.1),
+                           ('K1', (0.882, 1.113), 8.9),
+                           ('O1', (0.806, 1.183), 10.8),
+                           ('K2', (0.748, 1.317), 17.7)]:
+            fu = np.array([tide._nodal_fu(name, N)
+                           for N in np.arange(0, 360, 1.)])
+            np.testing.assert_allclose(
+                [fu[:, 0].min(), fu[:, 0].max()], f, atol=0.002, err_msg=name)
+            # less the higher harmonics of N in the full expressions
+            self.assertAlmostEqual(np.abs(fu[:, 1]).max(), u, delta=0.2,
+                                   msg=name)
+
+    def test_nodal_readonly(self):
+        ref, f, vu = tide.nodal(pd.Timestamp('2018-03-01').value,
+                                pd.Timestamp('2018-04-01').value, ('M2',))
+        with self.assertRaises(ValueError):
+            f[0] = 2
+        with self.assertRaises(ValueError):
+            vu[0] = 0
+
+    def test_nodal_cache(self):
+        # records of a deployment starting and ending on the same days share
+        # one reference time and one cached result
+        a = tide.nodal(pd.Timestamp('2018-03-01 00:15').value,
+                       pd.Timestamp('2018-03-30 23:45').value, ('M2',))
+        b = tide.nodal(pd.Timestamp('2018-03-01 06:00').value,
+                       pd.Timestamp('2018-03-30 12:00').value, ('M2',))
+        self.assertIs(a, b)
+        self.assertEqual(a[0], pd.Timestamp('2018-03-16'))
+        self.assertIsNotNone(tide._nodal_days.cache_info().maxsize)
+
+    def test_reference_phase(self):
+        # a tide synthesized with the t_tide astronomical arguments evaluated
+        # at every sample, so the fit is checked against an independent
+        # equilibrium argument rather than its own prediction (the nodal
+        # corrections are checked by test_nodal_range)
+        time = pd.date_range('2018-03-01', periods=60 * 24, freq='1h')
+        astro = ttide_astron(time)
+        amp = {'M2': 1., 'K1': 0.3, 'O1': 0.2}
+        phase = {'M2': 120., 'K1': 300., 'O1': 45.}
+        x = np.zeros(len(time))
+        for name in amp:
+            v = (np.dot(tide.CONSTITUENTS[name][:4], astro[:4]) +
+                 tide.CONSTITUENTS[name][4])
+            f, u = tide._nodal_fu(name, astro[4])
+            x += f * amp[name] * np.cos(np.radians(v + u - phase[name]))
+
+        fit = tide.harmonic_fit(time, x, names=list(amp))
+        for i, name in enumerate(fit['names']):
+            self.assertAlmostEqual(fit['amplitude'][i], amp[name], delta=0.002,
+                                   msg=name)
+            self.assertAlmostEqual(fit['phase'][i], phase[name], delta=0.1,
+                                   msg=name)
+
+    def test_fit(self):
+        x = tide.predict(self.time, self.names, self.amp[:, None],
+                         self.phase[:, None], 10.)
+        # bins with different missing data
+        x = np.tile(x, (1, 4))
+        x[1000:1100, 1] = np.nan
+        x[5000:, 2] = np.nan
+        x[:, 3] = np.nan
+        fit = tide.harmonic_fit(self.time, x)
+
+        self.assertEqual(fit['names'], self.names)
+        for i in range(3):
+            np.testing.assert_allclose(fit['amplitude'][:, i], self.amp,
+                                       atol=1e-6)
+            np.testing.assert_allclose(fit['phase'][:, i], self.phase,
+                                       atol=1e-4)
+        np.testing.assert_allclose(fit['mean'][:3], 10)
+        self.assertTrue(np.isnan(fit['amplitude'][:, 3]).all())
+
+    def test_rayleigh(self):
+        # K2 and P1 need half a year to separate from S2 and K1
+        self.assertNotIn('K2', tide.resolvable(30 * 24))
+        self.assertNotIn('P1', tide.resolvable(30 * 24))
+        self.assertEqual(tide.resolvable(200 * 24), self.names)
+
+    def test_ds(self):
+        x = tide.predict(self.time, ['M2'], [[0.5, 0.4]], [[40, 50]])
+        ds = xr.Dataset({'u_1205': (('time', 'depth'), x, {'units': 'm/s'})},
+                        coords={'time': self.time, 'depth': [1., 2.]})
+        out = tide.harmonic_ds(ds, ['u_1205'], names=['M2'])
+        np.testing.assert_allclose(out['u_1205_amp'].sel(constituent='M2'),
+                                   [0.5, 0.4], atol=1e-6)
+        self.assertEqual(out['u_1205_amp'].dims, ('constituent', 'depth'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,259 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+import xarray as xr
+from stglib.core import utils
+
+
+class TestParseDatetime(unittest.TestCase):
+
+    def test_fixed_width(self):
+        s = ['07/20/17 12:00:01 AM', '07/20/17 12:30:00 PM',
+             '12/31/99 11:59:59 pm']
+        np.testing.assert_equal(
+            utils.parse_datetime(s, '%m/%d/%y %I:%M:%S %p').values,
+            pd.to_datetime(s, format='%m/%d/%y %I:%M:%S %p').values)
+
+    def test_fallback(self):
+        # not zero padded
+        s = ['7/20/2017 1:00:01', '7/20/2017 10:00:01']
+        np.testing.assert_equal(
+            utils.parse_datetime(s, '%m/%d/%Y %H:%M:%S').values,
+            pd.to_datetime(s, format='%m/%d/%Y %H:%M:%S').values)
+
+    def test_mismatch(self):
+        with self.assertRaises(ValueError):
+            utils.parse_datetime(['2017-07-20 00:00:00'],
+                                 '%m/%d/%Y %H:%M:%S')
+
+
+class TestFooter(unittest.TestCase):
+
+    def test_count_footer(self):
+        fd, filnam = tempfile.mkstemp()
+        with os.fdopen(fd, 'w') as f:
+            f.write('header\n1,a\n2,b\n3,c\nLogged\nEnd Of File\n\n')
+        try:
+            self.assertEqual(utils.count_footer(
+                filnam, lambda l: l.split(',')[0].isdigit()), 2)
+            self.assertEqual(utils.count_lines(filnam), 6)
+        finally:
+            os.remove(filnam)
+
+
+class TestCountRows(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.filnam = tempfile.mkstemp()
+        with os.fdopen(fd, 'w', newline='') as f:
+            f.write('title\r\n\r\nheader\r\n1,a\r\n\r\n2,b\n\n\n3,c\r\n'
+                    'End Of File\r\n\r\n')
+
+    def tearDown(self):
+        os.remove(self.filnam)
+
+    def test_blank_lines(self):
+        self.assertEqual(utils.count_lines(self.filnam), 6)
+        # blank lines are counted once across chunk boundaries
+        for chunksize in [1, 2, 3, 5]:
+            self.assertEqual(utils.count_lines(self.filnam, chunksize), 6)
+
+    def test_count_rows(self):
+        for skiprows in [3, [0, 1, 2], [0, 2]]:
+            nrows = utils.count_rows(self.filnam, skiprows, 1)
+            df = pd.read_csv(self.filnam, names=['n', 'x'], engine='c',
+                             skiprows=skiprows, nrows=nrows)
+            self.assertEqual(list(df['x'])[-3:], ['a', 'b', 'c'])
+        with self.assertRaises(TypeError):
+            utils.count_rows(self.filnam, lambda i: i < 3)
+
+
+class TestTimeRange(unittest.TestCase):
+
+    def test_line_range(self):
+        fd, filnam = tempfile.mkstemp()
+        with os.fdopen(fd, 'w') as f:
+            f.write('header\n')
+            for n in range(100):
+                f.write('%d,%s\n' % (n, 'x' * (n % 7)))
+            f.write('End Of File\n')
+
+        def parse(line):
+            return int(line.split(b',')[0])
+
+        try:
+            lo, hi = utils.time_range(filnam, parse, 10, 20, offset=7)
+            with open(filnam, 'rb') as f:
+                f.seek(lo)
+                lines = f.read(hi - lo).splitlines()
+            self.assertEqual([parse(l) for l in lines], list(range(10, 21)))
+            self.assertEqual(utils.time_range(filnam, parse, 200, 300,
+                                              offset=7)[0],
+                             utils.time_range(filnam, parse, 100, 300,
+                                              offset=7)[1])
+            self.assertEqual(utils.line_number(filnam, lo), 11)
+        finally:
+            os.remove(filnam)
+
+    def test_read_lines(self):
+        fd, fixed = tempfile.mkstemp()
+        with os.fdopen(fd, 'w') as f:
+            for n in range(50):
+                f.write('%04d,abc\n' % n)
+        fd, ragged = tempfile.mkstemp()
+        with os.fdopen(fd, 'w') as f:
+            for n in range(50):
+                f.write('%d,%s\n' % (n, 'x' * (n % 3)))
+
+        def parse(line):
+            return int(line.split(b',')[0])
+
+        try:
+            self.assertEqual(utils.record_length(fixed), 9)
+            self.assertIsNone(utils.record_length(ragged))
+            for filnam in [fixed, ragged]:
+                first, nrows = utils.line_range(filnam, parse, 5, 14)
+                self.assertEqual((first, nrows), (5, 10))
+                lines = utils.read_lines(filnam, first, nrows).readlines()
+                self.assertEqual([parse(l) for l in lines],
+                                 list(range(5, 15)))
+        finally:
+            os.remove(fixed)
+            os.remove(ragged)
+
+
+class TestNormalizeTime(unittest.TestCase):
+
+    def setUp(self):
+        time = pd.to_datetime(['2017-07-20 00:00', '2017-07-20 00:02',
+                               '2017-07-20 00:01', '2017-07-20 00:02',
+                               '2017-07-20 00:05'])
+        self.ds = xr.Dataset({'P_1': ('time', np.arange(5))},
+                             coords={'time': time})
+
+    def test_sorted(self):
+        ds = self.ds.isel(time=[0, 2, 1])
+        self.assertIs(utils.normalize_time(ds), ds)
+
+    def test_sort_dedupe(self):
+        ds = utils.normalize_time(self.ds)
+        np.testing.assert_equal(ds['P_1'].values, [0, 2, 1, 4])
+
+    def test_grid(self):
+        ds = utils.normalize_time(self.ds, freq=60)
+        self.assertEqual(ds.sizes['time'], 6)
+        np.testing.assert_equal(ds['P_1'].values,
+                                [0, 2, 1, np.nan, np.nan, 4])
+
+
+class TestClip(unittest.TestCase):
+
+    def test_good_ens(self):
+        ds = xr.Dataset({'P_1': ('time', np.arange(10.)),
+                         'bindist': ('bindist', [1., 2.])},
+                        coords={'time': pd.date_range('2017-07-20',
+                                                      periods=10,
+                                                      freq='h')})
+        ds.attrs['good_ens'] = [[1, 3], [5, 8]]
+        clipped = utils.clip_ds(ds)
+        np.testing.assert_equal(clipped['P_1'].values, [1, 2, 5, 6, 7])
+        self.assertEqual(clipped['bindist'].dims, ('bindist',))
+
+        ds.attrs['good_ens'] = [2, 4]
+        clipped = utils.clip_ds(ds)
+        np.testing.assert_equal(clipped['P_1'].values, [2, 3])
+        self.assertTrue(np.shares_memory(clipped['P_1'].values,
+                                         ds['P_1'].values))
+
+        # several ranges from a file on disk are not read into memory
+        tmp = tempfile.mkdtemp()
+        try:
+            filnam = os.path.join(tmp, 'test-raw.cdf')
+            del ds.attrs['good_ens']
+            ds['VEL1'] = (('time', 'bindist'), np.ones((10, 2)))
+            ds.to_netcdf(filnam)
+            with xr.open_dataset(filnam) as raw:
+                raw.attrs['good_ens'] = [[1, 3], [5, 8]]
+                clipped = utils.clip_ds(raw)
+                for k in ['P_1', 'VEL1']:
+                    self.assertFalse(clipped[k].variable._in_memory, k)
+                np.testing.assert_equal(clipped['P_1'].values,
+                                        [1, 2, 5, 6, 7])
+        finally:
+            shutil.rmtree(tmp)
+
+
+class TestBursts(unittest.TestCase):
+
+    def setUp(self):
+        # 8 bursts of 5 samples at 1 Hz, one hour apart
+        t = np.arange('2017-01-01', 5, dtype='datetime64[s]')
+        self.time = (t[None, :] +
+                     np.arange(8)[:, None] * np.timedelta64(1, 'h')).ravel()
+        self.v = np.arange(40)
+
+    def test_complete(self):
+        ds = utils.to_bursts(self.time, {'v': self.v})
+        np.testing.assert_equal(ds['v'].values, self.v.reshape((8, 5)))
+        self.assertEqual(ds['v'].dtype, self.v.dtype)
+        np.testing.assert_equal(ds['time'].values,
+                                self.time.reshape((8, 5))[:, 2])
+
+    def test_dropped_and_truncated(self):
+        keep = np.ones(40, dtype=bool)
+        keep[7] = False
+        keep[-2:] = False
+        ds = utils.to_bursts(self.time[keep], {'v': self.v[keep]})
+        expected = self.v.reshape((8, 5)).astype(float)
+        expected[1, 2] = np.nan
+        expected[-1, -2:] = np.nan
+        np.testing.assert_equal(ds['v'].values, expected)
+
+    def test_continuous_spb(self):
+        t = np.arange('2017-01-01', 20, dtype='datetime64[s]')
+        ds = utils.to_bursts(t, {'v': np.arange(20)}, spb=6)
+        self.assertEqual(ds['v'].shape, (4, 6))
+        np.testing.assert_equal(ds['v'].values[3], [18, 19] + [np.nan] * 4)
+
+
+class TestWindows(unittest.TestCase):
+
+    def test_overlap(self):
+        time = pd.date_range('2017-07-20', periods=10, freq='s')
+        p = np.arange(10.)
+        ds = utils.to_windows(time, {'P_1': p}, 4, 2)
+        self.assertEqual(ds['P_1'].shape, (4, 4))
+        np.testing.assert_equal(ds['P_1'].values[1], [2, 3, 4, 5])
+        np.testing.assert_equal(ds['time'].values, time.values[[0, 2, 4, 6]])
+        self.assertTrue(np.shares_memory(ds['P_1'].values, p))
+
+
+class TestMergeTime(unittest.TestCase):
+
+    def test_overlap(self):
+        t = np.arange('2017-01-01', 10, dtype='datetime64[s]')
+        a = xr.Dataset({'v': ('time', np.zeros(6))}, {'time': t[:6]})
+        b = xr.Dataset({'v': ('time', np.ones(6))}, {'time': t[4:]})
+        c = xr.Dataset({'v': ('time', np.full(2, 2.))}, {'time': t[1:3]})
+        ds = utils.merge_time([b, c, a])
+        np.testing.assert_equal(ds['time'].values, t)
+        np.testing.assert_equal(ds['v'].values, [0] * 6 + [1] * 4)
+
+
+class TestAddLatLon(unittest.TestCase):
+
+    def test_view(self):
+        u = np.random.randn(5, 3)
+        ds = xr.Dataset({'U': (('time', 'bindist'), u)},
+                        {'lat': [41.5], 'lon': [-70.7]})
+        ds = utils.add_lat_lon(ds, 'U')
+        self.assertEqual(ds['U'].dims, ('time', 'bindist', 'lat', 'lon'))
+        np.testing.assert_equal(ds['U'].values[:, :, 0, 0], u)
+        self.assertTrue(np.shares_memory(ds['U'].values, u))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import os
+import glob
+import shutil
+import tempfile
+import unittest
+import multiprocessing
+import yaml
+from stglib.core import cmd, worker
+from test_exo import write_exo
+
+
+def crash(args):
+    # a worker process dying outright, e.g. killed for running out of memory
+    os._exit(1)
+
+
+class TestWorker(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.queue = os.path.join(self.dir, 'queue')
+        os.makedirs(self.queue)
+
+        write_exo(os.path.join(self.dir, 'exo.csv'))
+        with open(os.path.join(self.dir, 'gatts.txt'), 'w') as f:
+            f.write('MOORING; 1076\n'
+                    'latitude; 40.\n'
+                    'longitude; -70.\n'
+                    'Deployment_date; 2018-01-01 05:00\n'
+                    'Recovery_date; 2018-01-01 15:00\n')
+        with open(os.path.join(self.dir, 'config.yaml'), 'w') as f:
+            yaml.safe_dump({'basefile': 'exo', 'filename': '10761exo',
+                            'initial_instrument_height': 0.5}, f)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_submit(self):
+        jobfile = worker.submit(self.queue, instrument='exo', stage='csv2cdf',
+                                gatts='gatts.txt', config='config.yaml')
+        with open(jobfile) as f:
+            job = yaml.safe_load(f)
+        self.assertEqual(worker.job_command(job),
+                         ('exocsv2cdf',
+                          ['gatts.txt', 'config.yaml']))
+
+        with self.assertRaisesRegex(ValueError, 'Unknown'):
+            worker.submit(self.queue, instrument='exo', stage='hdr2cdf')
+        self.assertEqual(len(worker._pending(self.queue)), 1)
+
+    def test_serve_once(self):
+        worker.submit(self.queue, instrument='exo', stage='csv2cdf',
+                      gatts='gatts.txt', config='config.yaml',
+                      directory=self.dir)
+        worker.submit(self.queue, instrument='exo', stage='csv2cdf',
+                      gatts='missing.txt', config='config.yaml',
+                      directory=self.dir)
+        results = worker.serve(self.queue, processes=1, poll_interval=0.05,
+                               once=True)
+
+        self.assertEqual(sorted(r['status'] for r in results),
+                         ['done', 'failed'])
+        self.assertTrue(os.path.exists(
+            os.path.join(self.dir, '10761exo-raw.cdf')))
+        for status in ['done', 'failed']:
+            d = os.path.join(self.queue, status)
+            self.assertEqual(len(glob.glob(os.path.join(d, '*.result.yaml'))),
+                             1)
+            self.assertEqual(len(glob.glob(os.path.join(d, '*.log'))), 1)
+        self.assertEqual(os.listdir(os.path.join(self.queue, 'running')), [])
+
+    @unittest.skipUnless(multiprocessing.get_start_method() == 'fork',
+                         'the crashing command must be inherited by the pool')
+    def test_broken_pool(self):
+        cmd.commands['exocrash'] = crash
+        try:
+            worker.submit(self.queue, instrument='exo', stage='crash')
+            results = worker.serve(self.queue, processes=1,
+                                   poll_interval=0.05, once=True)
+            self.assertEqual(results[0]['status'], 'failed')
+            self.assertIn('BrokenProcessPool', results[0]['error'])
+
+            # the pool is restarted for the next job
+            worker.submit(self.queue, instrument='exo', stage='csv2cdf',
+                          gatts='gatts.txt', config='config.yaml',
+                          directory=self.dir)
+            results = worker.serve(self.queue, processes=1,
+                                   poll_interval=0.05, once=True)
+            self.assertEqual(results[0]['status'], 'done')
+        finally:
+            del cmd.commands['exocrash']
+
+
+if __name__ == '__main__':
+    unittest.main()